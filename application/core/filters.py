@@ -1,9 +1,12 @@
 from application.core.utils import NoneToEmptyStringEncoder
 from jinja2 import pass_eval_context
-from markdown import markdown
+from markdown import Markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
 from markupsafe import Markup
 import json
 import jsonpickle
+from collections import OrderedDict, namedtuple
 from bs4 import BeautifulSoup
 from slugify import slugify
 from uritemplate import URITemplate
@@ -12,10 +15,13 @@ from urllib.parse import urlencode
 import requests
 import os
 import hashlib
+import threading
+import time
 import validators
 import numbers
 from application.settings import get_settings
 import logging
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -104,16 +110,107 @@ def make_url_param_str(param_dict, exclude_values=None, exclude_params=None):
     return urlencode(output_dict, doseq=True)
 
 
+MARKDOWN_HEADINGS = {"h1", "h2", "h3", "h4", "h5"}
+MARKDOWN_GOVUK_CLASSES = {
+    "p": "govuk-body",
+    "h1": "govuk-heading-xl",
+    "h2": "govuk-heading-l",
+    "h3": "govuk-heading-m",
+    "h4": "govuk-heading-s",
+    "ul": "govuk-list govuk-list--bullet",
+    "a": "govuk-link",
+    "ol": "govuk-list govuk-list--number",
+    "hr": "govuk-section-break govuk-section-break--l",
+    "code": "app-code",
+}
+
+
+class _GovukAttributesTreeprocessor(Treeprocessor):
+    def run(self, root):
+        if self.md.htmlStash.html_counter:
+            # left to _add_html_attrs, see _render_markdown_html
+            return
+        for element in root.iter():
+            if element.tag in MARKDOWN_HEADINGS:
+                # sets the id to a 'slugified' version of the text content
+                element.set("id", slugify("".join(element.itertext())))
+            if element.tag in MARKDOWN_GOVUK_CLASSES:
+                element.set("class", MARKDOWN_GOVUK_CLASSES[element.tag])
+
+
+class _GovukAttributesExtension(Extension):
+    def extendMarkdown(self, md):
+        # after unescape so heading ids are made from the final text
+        md.treeprocessors.register(
+            _GovukAttributesTreeprocessor(md), "govuk_attributes", -10
+        )
+
+
+MarkdownCacheInfo = namedtuple(
+    "MarkdownCacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+_markdown_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_markdown_cache_stats = {"hits": 0, "misses": 0}
+_markdown_cache_lock = threading.Lock()
+
+
+def markdown_cache_info() -> MarkdownCacheInfo:
+    with _markdown_cache_lock:
+        return MarkdownCacheInfo(
+            _markdown_cache_stats["hits"],
+            _markdown_cache_stats["misses"],
+            settings.MARKDOWN_CACHE_SIZE,
+            len(_markdown_cache),
+        )
+
+
+def markdown_cache_clear():
+    with _markdown_cache_lock:
+        _markdown_cache.clear()
+        _markdown_cache_stats.update(hits=0, misses=0)
+
+
+def _render_markdown_html(text, govAttributes):
+    extensions = [_GovukAttributesExtension()] if govAttributes else []
+    md = Markdown(extensions=extensions)
+    html = md.convert(text)
+    if md.htmlStash.html_counter:
+        # raw html in the markdown isn't part of the tree so it's tidied up
+        # and given the attributes by parsing the output
+        soup = BeautifulSoup(html, "html.parser")
+        if govAttributes:
+            _add_html_attrs(soup)
+        html = str(soup)
+    return html
+
+
+def _get_markdown_html(text, govAttributes):
+    # keyed on a hash of the text so the cache doesn't hold on to the markdown
+    key = (hashlib.sha1(text.encode()).digest(), govAttributes)
+    with _markdown_cache_lock:
+        html = _markdown_cache.get(key)
+        if html is not None:
+            _markdown_cache.move_to_end(key)
+            _markdown_cache_stats["hits"] += 1
+            return html
+        _markdown_cache_stats["misses"] += 1
+
+    html = _render_markdown_html(text, govAttributes)
+    with _markdown_cache_lock:
+        _markdown_cache[key] = html
+        while len(_markdown_cache) > settings.MARKDOWN_CACHE_SIZE:
+            _markdown_cache.popitem(last=False)
+    return html
+
+
 def render_markdown(text, govAttributes=False, makeSafe=True):
     if text is None:
         return ""
-    soup = BeautifulSoup(markdown(text), "html.parser")
-    if govAttributes:
-        _add_html_attrs(soup)
+    html = _get_markdown_html(text, govAttributes)
     if makeSafe:
-        return Markup(soup)
+        return Markup(html)
     else:
-        return soup
+        return BeautifulSoup(html, "html.parser")
 
 
 def _add_html_attrs(soup):
@@ -200,10 +297,48 @@ def hash_file(filename):
     return sha1Hashed
 
 
-# Takes the URI and appends a param containing the current git hash
+ASSET_DIRECTORIES = ["static"]
+_asset_mtimes = {}
+
+
+@lru_cache()
+def get_asset_manifest():
+    """
+    Maps the path of each file in the asset directories, relative to the root
+    of the repo, to a hash of its content. Built once per process so pages
+    don't read and hash the assets they link to every time they're rendered
+    """
+    root = os.path.dirname(__file__) + "/../../"
+    manifest = {}
+    for directory in ASSET_DIRECTORIES:
+        for dirpath, _, filenames in os.walk(root + directory):
+            for name in filenames:
+                path = os.path.relpath(os.path.join(dirpath, name), root)
+                manifest[path] = hash_file(path)
+    return manifest
+
+
+def get_asset_hash(filename):
+    path = os.path.normpath(filename.lstrip("/"))
+    manifest = get_asset_manifest()
+    if settings.WATCH_ASSETS:
+        # assets are rebuilt while developing so hash them again once changed
+        try:
+            mtime = os.stat(os.path.dirname(__file__) + "/../../" + path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if _asset_mtimes.get(path) != mtime:
+            manifest.pop(path, None)
+            _asset_mtimes[path] = mtime
+    if path not in manifest:
+        manifest[path] = hash_file(path)
+    return manifest[path]
+
+
+# Takes the URI and appends a param containing a hash of the file
 def cacheBust(uri):
     filename = uri.split("?")[0]
-    sha = hash_file(filename)
+    sha = get_asset_hash(filename)
     return append_uri_param(uri, {"v": sha})
 
 
@@ -284,20 +419,82 @@ def commanum_filter(v):
     return v
 
 
+# the map javascript asks for a new token 30 seconds before it expires so a
+# token isn't handed out once it has less than that left, and is refreshed in
+# the background for a minute before then
+OS_TOKEN_EXPIRY_BUFFER = 30
+OS_TOKEN_REFRESH_BUFFER = 90
+OS_TOKEN_TIMEOUT = 10
+
+_os_token = {"token": None, "expires": 0.0, "refresh": 0.0}
+_os_token_lock = threading.Lock()
+_os_token_refreshing = threading.Lock()
+
+
+def _request_os_oauth2_token():
+    try:
+        result = requests.post(
+            "https://api.os.uk/oauth2/token/v1",
+            data={"grant_type": "client_credentials"},
+            headers={},
+            auth=(settings.OS_CLIENT_KEY, settings.OS_CLIENT_SECRET),
+            timeout=OS_TOKEN_TIMEOUT,
+        )
+        jsonResult = result.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"OS token request failed: {e}")
+        return None
+    if "Error" in jsonResult:
+        logger.error(jsonResult["Error"])
+        return None
+    return jsonResult
+
+
+def _refresh_os_oauth2_token():
+    # only one request for a token is made at a time, any others wait for it
+    # and use the token it gets
+    with _os_token_lock:
+        now = time.monotonic()
+        if _os_token["token"] is not None and now < _os_token["refresh"]:
+            return _os_token["token"]
+
+        token = _request_os_oauth2_token()
+        if token is not None:
+            issued = time.monotonic()
+            expires_in = int(token.get("expires_in") or 0)
+            _os_token.update(
+                token=token,
+                expires=issued + expires_in - OS_TOKEN_EXPIRY_BUFFER,
+                refresh=issued + expires_in - OS_TOKEN_REFRESH_BUFFER,
+            )
+        elif now >= _os_token["expires"]:
+            _os_token["token"] = None
+        return _os_token["token"]
+
+
+def _refresh_os_oauth2_token_in_background():
+    try:
+        _refresh_os_oauth2_token()
+    finally:
+        _os_token_refreshing.release()
+
+
 def get_os_oauth2_token():
+    """
+    Returns the OS Maps API token, the token is kept for the process and
+    refreshed in the background shortly before it expires
+    """
     if not settings.OS_CLIENT_KEY or not settings.OS_CLIENT_SECRET:
         logger.error("OS_CLIENT_KEY or OS_CLIENT_SECRET not set")
         return "null"
 
-    result = requests.post(
-        "https://api.os.uk/oauth2/token/v1",
-        data={"grant_type": "client_credentials"},
-        headers={},
-        auth=(settings.OS_CLIENT_KEY, settings.OS_CLIENT_SECRET),
-    )
-    jsonResult = result.json()
-    if "Error" in jsonResult:
-        logger.error(jsonResult["Error"])
-        return "null"
-    else:
-        return jsonResult
+    token = _os_token["token"]
+    now = time.monotonic()
+    if token is None or now >= _os_token["expires"]:
+        token = _refresh_os_oauth2_token()
+    elif now >= _os_token["refresh"] and _os_token_refreshing.acquire(blocking=False):
+        threading.Thread(
+            target=_refresh_os_oauth2_token_in_background, daemon=True
+        ).start()
+
+    return token if token is not None else "null"
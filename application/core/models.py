@@ -1,12 +1,17 @@
+import json
+
 from datetime import date
-from typing import Optional, List, Dict, Any
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, FrozenSet, Type
 
 from geoalchemy2.shape import to_shape
 from geoalchemy2.elements import WKBElement, WKTElement
-from pydantic import BaseModel, Field, validator, Extra, create_model
+from pydantic import BaseModel, Field, PrivateAttr, validator, Extra, create_model
+from shapely.geometry import mapping
 
 from application.db.models import EntityOrm
 from application.core.utils import to_snake
+from application.search.enum import SimplifyOption
 
 
 def to_kebab(string: str) -> str:
@@ -70,6 +75,15 @@ class EntityModel(DigitalLandDateFieldsModel, extra=Extra.allow):
     _validate_point = validator("point", pre=True, always=True, allow_reuse=True)(
         _make_geometry
     )
+    _geojson_text: Optional[str] = PrivateAttr(default=None)
+
+    @property
+    def geojson_text(self) -> Optional[str]:
+        """
+        The stored GeoJSON geometry as text, only set when the entity was
+        created with raw_geojson so it can be written into responses as is
+        """
+        return self._geojson_text
 
 
 class DatasetModel(DigitalLandDateFieldsModel):
@@ -142,21 +156,112 @@ class DatasetPublicationCountModel(DigitalLandBaseModel):
     publisher_count: int
 
 
-def entity_factory(entity_orm: EntityOrm):
-    e = EntityModel.from_orm(entity_orm)
-    if entity_orm.json is not None:
-        # if values in json present then extend the pydantic model
-        # TODO could add in additional validation using field informtion
-        field_definitions = {
-            to_snake(key): (Any, None) for key in entity_orm.json.keys()
-        }
-        ExtendedEntityModel = create_model(
-            "ExtendedEntityModel", **field_definitions, __base__=EntityModel
+# entities in a dataset share the same json keys so the extended models are cached
+# by key set rather than building a new model class for every row
+@lru_cache(maxsize=512)
+def get_extended_entity_model(keys: FrozenSet[str]) -> Type[EntityModel]:
+    # TODO could add in additional validation using field informtion
+    field_definitions = {to_snake(key): (Any, None) for key in sorted(keys)}
+    return create_model(
+        "ExtendedEntityModel", **field_definitions, __base__=EntityModel
+    )
+
+
+def _get_simplified_geometry(entity_orm: EntityOrm, simplify: SimplifyOption):
+    # entities without a geometry fall back to their point for the geojson
+    geometry = getattr(entity_orm, f"geometry_simplified_{simplify.value}")
+    shape = to_shape(geometry) if geometry is not None else None
+    if shape is None and entity_orm.point is not None:
+        geojson_shape = to_shape(entity_orm.point)
+    else:
+        geojson_shape = shape
+    wkt = shape.wkt if shape is not None else None
+    geojson = mapping(geojson_shape) if geojson_shape is not None else None
+    return wkt, geojson
+
+
+def entity_factory(
+    entity_orm: EntityOrm,
+    raw_geojson: bool = False,
+    simplify: Optional[SimplifyOption] = None,
+):
+    # when the raw geojson is wanted it's kept as text instead of being parsed,
+    # when simplified the geometry fields are filled in from the simplified one
+    skipped = set()
+    if raw_geojson:
+        skipped.add("geojson")
+    if simplify is not None:
+        skipped.update(["geometry", "geojson"])
+    values = {
+        name: getattr(entity_orm, name)
+        for name in EntityModel.__fields__
+        if name not in skipped
+    }
+
+    geojson_text = None
+    if simplify is not None:
+        values["geometry"], geometry = _get_simplified_geometry(entity_orm, simplify)
+        if geometry is not None and raw_geojson:
+            geojson_text = json.dumps(geometry, separators=(",", ":"))
+        elif geometry is not None:
+            values["geojson"] = {"geometry": geometry, "type": "Feature"}
+    elif raw_geojson:
+        geojson_text = entity_orm.geometry_geojson
+
+    if entity_orm.json is None:
+        entity = EntityModel(**values)
+    else:
+        # if values in json present then extend the pydantic model, the orm
+        # values are read directly so each row is only validated once
+        ExtendedEntityModel = get_extended_entity_model(
+            frozenset(entity_orm.json.keys())
         )
+        entity = ExtendedEntityModel(**values, **entity_orm.json)
+
+    entity._geojson_text = geojson_text
+    return entity
+
 
-        # use new model with the added json fields
-        e = ExtendedEntityModel(**e.dict(by_alias=False), **entity_orm.json)
+def entity_json(
+    entity_orm: EntityOrm, simplify: Optional[SimplifyOption] = None
+) -> Dict[str, Any]:
+    """
+    The entity as entity_factory(entity_orm).dict(by_alias=True) gives it,
+    built straight from the row for JSON responses. Validating a model only to
+    turn it back into a dict was most of the cost of rendering entities as JSON
+    """
+    e = {
+        "entry-date": entity_orm.entry_date,
+        "start-date": entity_orm.start_date,
+        "end-date": entity_orm.end_date,
+        "entity": entity_orm.entity,
+        "name": entity_orm.name,
+        "dataset": entity_orm.dataset,
+        "typology": entity_orm.typology,
+        "reference": entity_orm.reference,
+        "prefix": entity_orm.prefix,
+        "organisation-entity": (
+            str(entity_orm.organisation_entity)
+            if entity_orm.organisation_entity is not None
+            else None
+        ),
+        "geojson": entity_orm.geojson if simplify is None else None,
+        "geometry": _make_geometry(entity_orm.geometry, None)
+        if simplify is None
+        else None,
+        "point": _make_geometry(entity_orm.point, None),
+    }
+    if simplify is not None:
+        e["geometry"], geometry = _get_simplified_geometry(entity_orm, simplify)
+        if geometry is not None:
+            e["geojson"] = {"geometry": geometry, "type": "Feature"}
+    if e["geojson"] is not None:
+        e["geojson"]["properties"] = None
 
+    if entity_orm.json is not None:
+        # named as the fields of the extended model are, see get_extended_entity_model
+        for key in sorted(entity_orm.json, key=to_snake):
+            e[to_kebab(to_snake(key))] = entity_orm.json[key]
     return e
 
 
@@ -0,0 +1,174 @@
+"""
+Cache of rendered HTML pages shared by the workers through files in
+PAGE_CACHE_DIR, the cache is off when that isn't set.
+
+Pages are keyed on the full URL, the day and optionally the data version so a
+data load, or a new release, means pages are rendered again. The oldest pages
+are removed once there are more than PAGE_CACHE_SIZE of them, the directory
+is only counted again when the pages this process has written could have
+taken it past that.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from datetime import date
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from application.data_access.reference_data import (
+    get_dataset_versions,
+    get_last_updated,
+)
+from application.settings import get_settings
+
+# pages thought to be in each directory, counted when this process first
+# writes to it and when it's evicted from, then added to as pages are written
+_page_counts: Dict[Path, int] = {}
+_lock = threading.Lock()
+
+
+def _get_directory() -> Optional[Path]:
+    directory = get_settings().PAGE_CACHE_DIR
+    return Path(directory) if directory else None
+
+
+def _make_key(request: Request, session=None) -> str:
+    versions = None
+    last_updated = None
+    if session is not None:
+        versions = sorted(get_dataset_versions(session).items())
+        last_updated = get_last_updated(session)
+    key = json.dumps(
+        [
+            get_settings().RELEASE_TAG,
+            str(request.url),
+            str(date.today()),
+            versions,
+            str(last_updated),
+        ]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_page(key: str) -> Optional[bytes]:
+    try:
+        return (_get_directory() / f"{key}.html").read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def set_page(key: str, body: bytes):
+    directory = _get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    # written to a temporary file and moved so other workers never read part of a page
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(body)
+    os.replace(tmp, directory / f"{key}.html")
+
+    size = get_settings().PAGE_CACHE_SIZE
+    with _lock:
+        if directory not in _page_counts:
+            _page_counts[directory] = len(list(directory.glob("*.html")))
+        else:
+            _page_counts[directory] += 1
+        if _page_counts[directory] <= size:
+            return
+        _page_counts[directory] = size
+    _evict(directory, size)
+
+
+def _evict(directory: Path, size: int):
+    pages = list(directory.glob("*.html"))
+    if len(pages) <= size:
+        return
+    for page in sorted(pages, key=_get_mtime)[: len(pages) - size]:
+        try:
+            page.unlink()
+        except FileNotFoundError:
+            # already removed by another worker
+            pass
+
+
+def _get_mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def clear_pages():
+    directory = _get_directory()
+    if directory is not None and directory.exists():
+        for page in directory.glob("*.html"):
+            page.unlink(missing_ok=True)
+        with _lock:
+            _page_counts.pop(directory, None)
+
+
+def _is_cacheable(response) -> bool:
+    return (
+        isinstance(response, Response)
+        and response.status_code == 200
+        and response.media_type == "text/html"
+    )
+
+
+def cached_page(data_version: bool = True) -> Callable:
+    """
+    Caches the HTML a route renders. With data_version the route's session is
+    used to key the page on the dataset versions, otherwise the page is only
+    rendered again for a new release or day. Responses with an extension,
+    i.e. json, aren't cached.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        def get_key(kwargs) -> Optional[str]:
+            if _get_directory() is None or kwargs.get("extension") is not None:
+                return None
+            session = kwargs.get("session") if data_version else None
+            return _make_key(kwargs["request"], session)
+
+        def store(key: Optional[str], response):
+            if key is not None and _is_cacheable(response):
+                set_page(key, response.body)
+
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                # the files are read and written off the event loop
+                key = get_key(kwargs)
+                body = None
+                if key is not None:
+                    body = await run_in_threadpool(get_page, key)
+                if body is not None:
+                    return HTMLResponse(body)
+                response = await func(*args, **kwargs)
+                await run_in_threadpool(store, key, response)
+                return response
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = get_key(kwargs)
+            body = get_page(key) if key is not None else None
+            if body is not None:
+                return HTMLResponse(body)
+            response = func(*args, **kwargs)
+            store(key, response)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -11,6 +11,8 @@ from datetime import date
 
 from starlette.responses import Response
 
+from application.search.enum import CountOption
+
 logger = logging.getLogger(__name__)
 
 
@@ -119,6 +121,12 @@ def make_links(scheme, netloc, path, query, data):
     limit = data["params"].get("limit", 10)
     offset = data["params"].get("offset", 0)
 
+    if data["params"].get("after_entity") is not None:
+        return make_cursor_links(scheme, netloc, path, query, data)
+
+    if data["params"].get("count", CountOption.exact) != CountOption.exact:
+        return make_uncounted_links(scheme, netloc, path, query, data)
+
     # note api validation ensures limit > 0 but handle ZeroDivisionError
     try:
         page_count = count / limit
@@ -151,13 +159,80 @@ def make_links(scheme, netloc, path, query, data):
     return pagination_links
 
 
-def make_pagination_query_str(query, limit, offset=0):
+def make_uncounted_links(scheme, netloc, path, query, data):
+    """
+    Creates pagination links when the total number of results isn't known
+    exactly. There is no last link and a next link is given whenever the
+    current page is full.
+    """
+
+    from urllib.parse import urlunsplit
+
+    limit = data["params"].get("limit", 10)
+    offset = data["params"].get("offset", 0)
+
+    if not limit:
+        return {}
+
+    pagination_links = {}
+    has_next = len(data.get("entities", [])) >= limit
+    prev_offset = max(offset - limit, 0)
+
+    if not has_next and not offset:
+        return pagination_links
+
+    query_str = make_pagination_query_str(query, limit)
+    pagination_links["first"] = urlunsplit((scheme, netloc, path, query_str, ""))
+
+    if has_next:
+        query_str = make_pagination_query_str(query, limit, offset=offset + limit)
+        pagination_links["next"] = urlunsplit((scheme, netloc, path, query_str, ""))
+
+    if offset:
+        query_str = make_pagination_query_str(query, limit, offset=prev_offset)
+        pagination_links["prev"] = urlunsplit((scheme, netloc, path, query_str, ""))
+
+    return pagination_links
+
+
+def make_cursor_links(scheme, netloc, path, query, data):
+    """
+    Creates pagination links for keyset pagination, the next link seeks
+    from the last entity on the current page using the after_entity parameter
+    """
+
+    from urllib.parse import urlunsplit
+
+    limit = data["params"].get("limit", 10)
+    entities = data.get("entities", [])
+
+    query_str = make_pagination_query_str(query, limit)
+    pagination_links = {"first": urlunsplit((scheme, netloc, path, query_str, ""))}
+
+    if limit and len(entities) >= limit:
+        # entities are dicts when they're from the json fast path, see entity_json
+        last = entities[-1]
+        last_entity = last["entity"] if isinstance(last, dict) else last.entity
+        query_str = make_pagination_query_str(query, limit, after_entity=last_entity)
+        pagination_links["next"] = urlunsplit((scheme, netloc, path, query_str, ""))
+
+    return pagination_links
+
+
+def make_pagination_query_str(query, limit, offset=0, after_entity=None):
     from urllib.parse import parse_qs, urlencode
 
     query_dict = parse_qs(query)
 
     query_dict["limit"] = limit
 
+    if after_entity is not None:
+        query_dict["after_entity"] = after_entity
+        query_dict.pop("offset", None)
+        return urlencode(query_dict, doseq=True)
+
+    query_dict.pop("after_entity", None)
+
     if offset != 0:
         query_dict["offset"] = offset
     else:
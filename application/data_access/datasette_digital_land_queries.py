@@ -1,6 +1,6 @@
 import logging
 
-from application.data_access.datasette_query_helpers import get_datasette_http
+from application.data_access.datasette_query_helpers import get_datasette_rows
 from application.settings import get_settings
 
 
@@ -26,17 +26,7 @@ def get_field_specifications(fields):
     params = {"sql": sql, "_shape": "array"}
 
     try:
-        http = get_datasette_http()
-        resp = http.get(url, params=params)
-        resp.raise_for_status()
-        rows = resp.json()
-        # datasette returns empty strings for nulls. is there
-        # a datasette config way to prevent this? for now set empties
-        # to None.
-        for r in rows:
-            for key, val in r.items():
-                if not val:
-                    r[key] = None
+        rows = get_datasette_rows(url, params)
         fields = [FieldModel(**field) for field in rows]
         return fields
     except Exception as e:
@@ -1,22 +1,183 @@
-import requests
+import threading
+import time
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
+import httpx
+import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from application.settings import get_settings
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    requests has no session wide timeout so apply a default to every
+    request sent through the adapter unless one is given
+    """
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
 
-def get_datasette_http():
+
+@lru_cache()
+def get_datasette_http() -> requests.Session:
     """
     Function to return  http for the use of querying  datasette,
-    specifically to add retries for larger queries
+    specifically to add retries for larger queries. The session is created
+    once per process so connections to datasette are pooled and reused
     """
+    settings = get_settings()
     retry_strategy = Retry(
-        total=3, status_forcelist=[400], method_whitelist=["GET"], backoff_factor=0
+        total=settings.DATASETTE_RETRIES,
+        status_forcelist=[400],
+        method_whitelist=["GET"],
+        backoff_factor=settings.DATASETTE_RETRY_BACKOFF,
+    )
+    adapter = TimeoutHTTPAdapter(
+        max_retries=retry_strategy,
+        pool_connections=settings.DATASETTE_POOL_SIZE,
+        pool_maxsize=settings.DATASETTE_POOL_SIZE,
+        timeout=settings.DATASETTE_TIMEOUT,
     )
-
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-
     http = requests.Session()
     http.mount("https://", adapter)
     http.mount("http://", adapter)
-
     return http
+
+
+@lru_cache()
+def get_datasette_async_http() -> httpx.AsyncClient:
+    """
+    Async equivalent of get_datasette_http for use from async path functions.
+    httpx only retries failed connections, not responses
+    """
+    settings = get_settings()
+    transport = httpx.AsyncHTTPTransport(
+        retries=settings.DATASETTE_RETRIES,
+        limits=httpx.Limits(
+            max_connections=settings.DATASETTE_POOL_SIZE,
+            max_keepalive_connections=settings.DATASETTE_POOL_SIZE,
+        ),
+    )
+    return httpx.AsyncClient(transport=transport, timeout=settings.DATASETTE_TIMEOUT)
+
+
+async def close_datasette_http():
+    if get_datasette_http.cache_info().currsize:
+        get_datasette_http().close()
+        get_datasette_http.cache_clear()
+    if get_datasette_async_http.cache_info().currsize:
+        await get_datasette_async_http().aclose()
+        get_datasette_async_http.cache_clear()
+
+
+def _clean_rows(rows: List[dict]) -> List[dict]:
+    # datasette returns empty strings for nulls. is there
+    # a datasette config way to prevent this? for now set empties
+    # to None.
+    for r in rows:
+        for key, val in r.items():
+            if not val:
+                r[key] = None
+    return rows
+
+
+def get_datasette_rows(url: str, params: dict) -> List[dict]:
+    resp = get_datasette_http().get(url, params=params)
+    resp.raise_for_status()
+    return _clean_rows(resp.json())
+
+
+async def get_datasette_rows_async(url: str, params: dict) -> List[dict]:
+    resp = await get_datasette_async_http().get(url, params=params)
+    resp.raise_for_status()
+    return _clean_rows(resp.json())
+
+
+class DatasetteQuery(NamedTuple):
+    """
+    SQL sent to datasette with named parameters, e.g. :entity, rather than
+    values formatted into it. The text is the same for every call so only the
+    parameters in the url change, and the same lookup is always the same url
+    """
+
+    name: str
+    sql: str
+
+
+_cache: "OrderedDict[Tuple, Tuple[float, List[dict]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def invalidate_datasette_queries():
+    with _lock:
+        _cache.clear()
+
+
+def _get_query_request(
+    dataset: str, query: DatasetteQuery, params: Dict[str, Any]
+) -> Tuple[str, dict, Tuple]:
+    url = f"{get_settings().DATASETTE_URL}/{dataset}.json"
+    # parameters are sorted so the url, and the key, don't depend on their order
+    params = dict(sorted(params.items()))
+    key = (dataset, query.name, tuple(params.items()))
+    return url, {"sql": query.sql, "_shape": "array", **params}, key
+
+
+def _get_cached_rows(key: Tuple) -> Optional[List[dict]]:
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+    # callers are free to modify the rows they get back so hand out copies
+    return [dict(row) for row in entry[1]]
+
+
+def _set_cached_rows(key: Tuple, rows: List[dict]):
+    settings = get_settings()
+    if not settings.DATASETTE_CACHE_SIZE or not settings.DATASETTE_CACHE_TTL:
+        return
+    with _lock:
+        _cache[key] = (
+            time.monotonic() + settings.DATASETTE_CACHE_TTL,
+            [dict(row) for row in rows],
+        )
+        _cache.move_to_end(key)
+        while len(_cache) > settings.DATASETTE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def query_datasette(
+    dataset: str, query: DatasetteQuery, params: Dict[str, Any]
+) -> List[dict]:
+    url, request_params, key = _get_query_request(dataset, query, params)
+    rows = _get_cached_rows(key)
+    if rows is None:
+        rows = get_datasette_rows(url, request_params)
+        _set_cached_rows(key, rows)
+    return rows
+
+
+async def query_datasette_async(
+    dataset: str, query: DatasetteQuery, params: Dict[str, Any]
+) -> List[dict]:
+    url, request_params, key = _get_query_request(dataset, query, params)
+    rows = _get_cached_rows(key)
+    if rows is None:
+        rows = await get_datasette_rows_async(url, request_params)
+        _set_cached_rows(key, rows)
+    return rows
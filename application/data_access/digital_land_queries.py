@@ -1,5 +1,6 @@
 import logging
-from typing import List
+from datetime import date
+from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
@@ -11,6 +12,7 @@ from application.core.models import (
     DatasetPublicationCountModel,
 )
 from application.db.models import (
+    DatasetEntityCountOrm,
     DatasetOrm,
     EntityOrm,
     OrganisationOrm,
@@ -46,12 +48,12 @@ def get_dataset_query(session: Session, dataset) -> DatasetModel:
 def get_datasets_with_data_by_typology(
     session: Session, typology
 ) -> List[DatasetModel]:
+    # datasets without entities have no row in dataset_entity_count
     query = session.query(DatasetOrm).join(
-        EntityOrm, DatasetOrm.dataset == EntityOrm.dataset
+        DatasetEntityCountOrm, DatasetOrm.dataset == DatasetEntityCountOrm.dataset
     )
     query = query.filter(DatasetOrm.typology == typology)
-    query = query.group_by(DatasetOrm.dataset)
-    query = query.having(func.count(EntityOrm.entity) > 0)
+    query = query.filter(DatasetEntityCountOrm.entity_count > 0)
     datasets = query.all()
     return [DatasetModel.from_orm(ds) for ds in datasets]
 
@@ -115,3 +117,11 @@ def get_latest_resource(session: Session, dataset) -> DatasetCollectionModel:
         return DatasetCollectionModel.from_orm(result)
     else:
         return None
+
+
+def get_dataset_versions(session: Session) -> Dict[str, Optional[str]]:
+    return dict(session.query(DatasetOrm.dataset, DatasetOrm.version).all())
+
+
+def get_last_updated(session: Session) -> Optional[date]:
+    return session.query(func.max(DatasetCollectionOrm.last_updated)).scalar()
@@ -1,20 +1,26 @@
+import json
 import logging
 
-from typing import Optional, List, Tuple
-from sqlalchemy import select, func, or_, and_, tuple_
-from sqlalchemy.orm import Session
+from typing import Dict, Iterator, Optional, List, Tuple, Union
+from sqlalchemy import delete, insert, select, func, or_, and_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer, undefer
 
-from application.core.models import EntityModel, entity_factory
+from application.core.models import EntityModel, entity_factory, entity_json
 from application.data_access.entity_query_helpers import (
+    get_bbox_operator_for_relation,
     get_date_field_to_filter,
     get_date_to_filter,
+    get_geometry,
     get_operator,
     get_point,
     get_spatial_function_for_relation,
     normalised_params,
 )
-from application.db.models import EntityOrm, OldEntityOrm
-from application.search.enum import GeometryRelation, PeriodOption
+from application.db.models import DatasetEntityCountOrm, EntityOrm, OldEntityOrm
+from application.exceptions import QueryCostExceeded
+from application.search.enum import CountOption, GeometryRelation, PeriodOption
+from application.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
@@ -42,11 +48,18 @@ def get_entity_query(
             return entity_factory(entity), None, None
 
 
+async def get_entity_query_async(
+    session: AsyncSession,
+    id: int,
+) -> Tuple[Optional[EntityModel], Optional[int], Optional[int]]:
+    return await session.run_sync(get_entity_query, id)
+
+
 def get_entity_count(session: Session, dataset: Optional[str] = None):
-    sql = select(EntityOrm.dataset, func.count(EntityOrm.entity))
-    sql = sql.group_by(EntityOrm.dataset)
+    # read from the counts kept as entities are loaded rather than counting them
+    sql = select(DatasetEntityCountOrm.dataset, DatasetEntityCountOrm.entity_count)
     if dataset is not None:
-        sql = sql.filter(EntityOrm.dataset == dataset)
+        sql = sql.filter(DatasetEntityCountOrm.dataset == dataset)
     result = session.execute(sql)
     if dataset is not None:
         return result.fetchone()
@@ -54,6 +67,23 @@ def get_entity_count(session: Session, dataset: Optional[str] = None):
         return result.fetchall()
 
 
+def refresh_entity_counts(session: Session):
+    """
+    Counts the entities in each dataset again. The counts are kept up to date
+    by triggers on the entity table so this is only needed after a load that
+    bypasses them, e.g. one run with session_replication_role set to replica
+    """
+    session.execute(delete(DatasetEntityCountOrm))
+    session.execute(
+        insert(DatasetEntityCountOrm).from_select(
+            ["dataset", "entity_count"],
+            select(EntityOrm.dataset, func.count(EntityOrm.entity))
+            .where(EntityOrm.dataset.is_not(None))
+            .group_by(EntityOrm.dataset),
+        )
+    )
+
+
 def get_entities(session, dataset: str, limit: int) -> List[EntityModel]:
     entities = (
         session.query(EntityOrm).filter(EntityOrm.dataset == dataset).limit(limit).all()
@@ -61,61 +91,230 @@ def get_entities(session, dataset: str, limit: int) -> List[EntityModel]:
     return [entity_factory(e) for e in entities]
 
 
-def get_entity_search(session: Session, parameters: dict):
+def get_entity_search(
+    session: Session,
+    parameters: dict,
+    load_geojson: bool = True,
+    raw_geojson: bool = False,
+    as_json: bool = False,
+):
+    """
+    Searches for entities, load_geojson=False defers the stored geojson for
+    responses that don't include it and raw_geojson=True leaves it as text on
+    the entities (see EntityModel.geojson_text) rather than parsing it. The
+    simplify parameter swaps in the stored simplified geometries. as_json=True
+    gives the entities as the dicts they're rendered from in JSON responses,
+    see entity_json, rather than as models.
+    """
     params = normalised_params(parameters)
-    count: int
+    count_option = params.get("count", CountOption.exact)
+    count: Optional[int] = None
     entities: [EntityModel]
 
-    # get count
-    query_args = [func.count(EntityOrm.entity).label("count")]
-    query = session.query(*query_args)
-    query = _apply_base_filters(query, params)
-    query = _apply_date_filters(query, params)
-    query = _apply_location_filters(session, query, params)
-    query = _apply_period_option_filter(query, params)
-
-    entities = query.all()
-    if entities:
-        count = entities[0].count
+    if count_option == CountOption.exact and params.get("after_entity") is None:
+        # fetch the page and the total in one query using a window function so the
+        # filters (in particular the spatial ones) are only evaluated once
+        query_args = [EntityOrm, func.count().over().label("count")]
+        query = _get_entity_search_query(session, query_args, params)
+        query = _apply_limit_and_pagination_filters(query, params)
+        query = _apply_geometry_options(query, params, load_geojson)
+        _check_query_cost(session, query)
+        rows = query.all()
+
+        if rows:
+            count = rows[0].count
+        elif params.get("offset"):
+            # paged past the last result so the window has nothing to count
+            count = _get_entity_search_count(session, params)
+        else:
+            count = 0
+        entities = [row.EntityOrm for row in rows]
     else:
-        count = 0
+        query = _get_entity_search_query(session, [EntityOrm], params)
+        query = _apply_limit_and_pagination_filters(query, params)
+        query = _apply_geometry_options(query, params, load_geojson)
+        _check_query_cost(session, query)
+        entities = query.all()
+
+        if count_option == CountOption.exact:
+            # the keyset filter would limit a window count to the remaining
+            # entities so the total is counted separately
+            count = _get_entity_search_count(session, params)
+        elif count_option == CountOption.estimated:
+            query = _get_entity_search_query(session, [EntityOrm.entity], params)
+            count = _get_estimated_count(session, query)
+
+    entities = [
+        _make_entity(entity_orm, params, raw_geojson, as_json)
+        for entity_orm in entities
+    ]
+    return {"params": params, "count": count, "entities": entities}
+
+
+def _make_entity(entity_orm: EntityOrm, params: dict, raw_geojson: bool, as_json: bool):
+    if as_json:
+        return entity_json(entity_orm, params.get("simplify"))
+    return entity_factory(entity_orm, raw_geojson, params.get("simplify"))
+
+
+async def get_entity_search_async(
+    session: AsyncSession,
+    parameters: dict,
+    load_geojson: bool = True,
+    raw_geojson: bool = False,
+    as_json: bool = False,
+):
+    """
+    get_entity_search for async path functions, the queries are built as they
+    are for get_entity_search and run on the async session's connection
+    """
+    return await session.run_sync(
+        get_entity_search,
+        parameters,
+        load_geojson=load_geojson,
+        raw_geojson=raw_geojson,
+        as_json=as_json,
+    )
+
+
+def get_entity_search_stream(
+    session: Session,
+    parameters: dict,
+    batch_size: int = 1000,
+    load_geojson: bool = True,
+    raw_geojson: bool = False,
+    as_json: bool = False,
+) -> Iterator[Union[EntityModel, dict]]:
+    """
+    Yields every entity matching the search parameters. Rows are read through a
+    server side cursor in batches so memory use stays flat however many entities
+    match. limit and offset are ignored, after_entity can be used to resume.
+    load_geojson, raw_geojson and as_json are as for get_entity_search.
+    """
+    params = normalised_params(parameters)
+    params.pop("limit", None)
+    params.pop("offset", None)
+
+    query = _get_entity_search_query(session, [EntityOrm], params)
+    query = _apply_limit_and_pagination_filters(query, params)
+    query = _apply_geometry_options(query, params, load_geojson)
+    # checked before streaming starts so a refusal can still be a 503
+    _check_query_cost(session, query)
+
+    return (
+        _make_entity(entity_orm, params, raw_geojson, as_json)
+        for entity_orm in query.yield_per(batch_size)
+    )
+
 
-    # get entities
-    query_args = [EntityOrm]
+def _get_entity_search_query(session: Session, query_args: list, params: dict):
     query = session.query(*query_args)
     query = _apply_base_filters(query, params)
     query = _apply_date_filters(query, params)
     query = _apply_location_filters(session, query, params)
     query = _apply_period_option_filter(query, params)
-    query = _apply_limit_and_pagination_filters(query, params)
+    return query
 
-    entities = query.all()
-    entities = [entity_factory(entity_orm) for entity_orm in entities]
-    return {"params": params, "count": count, "entities": entities}
+
+def _apply_geometry_options(query, params: dict, load_geojson: bool):
+    simplify = params.get("simplify")
+    if simplify is not None:
+        # only the simplified geometry is needed, the geojson is derived from it
+        simplified = getattr(EntityOrm, f"geometry_simplified_{simplify.value}")
+        query = query.options(
+            defer(EntityOrm.geometry),
+            defer(EntityOrm.geometry_geojson),
+            undefer(simplified),
+        )
+    elif not load_geojson:
+        query = query.options(defer(EntityOrm.geometry_geojson))
+    return query
 
 
-def lookup_entity_link(
-    session: Session, reference: str, dataset: str, organisation_entity: int
-):
+def _get_entity_search_count(session: Session, params: dict) -> int:
+    query_args = [EntityOrm.entity]
+    query = _get_entity_search_query(session, query_args, params)
+    return query.count()
+
+
+def _get_estimated_count(session: Session, query) -> int:
+    """
+    Uses the row estimate from the postgres query planner rather than
+    running the query, cheap but can be some way off the exact count
+    """
+    plan = _get_query_plan(session, query)
+    return int(plan["Plan Rows"])
+
+
+def _check_query_cost(session: Session, query):
+    """
+    Refuses queries the planner estimates will cost more than
+    DB_QUERY_COST_LIMIT so they don't tie up a connection
+    """
+    limit = get_settings().DB_QUERY_COST_LIMIT
+    if limit is None:
+        return
+    cost = _get_query_plan(session, query)["Total Cost"]
+    if cost > limit:
+        raise QueryCostExceeded(f"Query cost {cost} exceeds the limit of {limit}")
+
+
+def _get_query_plan(session: Session, query) -> dict:
+    # IN lists are rendered as a parameter per value, the EXPLAIN text is run
+    # as is so it can't contain the placeholders expanded at execution time
+    compiled = query.statement.compile(
+        dialect=session.get_bind().dialect,
+        compile_kwargs={"render_postcompile": True},
+    )
+    params = compiled.params
+    if compiled.positional:
+        # the asyncpg dialect takes its parameters by position, not name
+        params = tuple(params[name] for name in compiled.positiontup)
+    result = session.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", params
+    )
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def get_entity_links(
+    session: Session,
+    links: Dict[str, str],
+    organisation_entity: Optional[Union[int, str]] = None,
+) -> Tuple[Optional[EntityModel], Dict[str, dict]]:
     """
-    This function takes an entity and a list of fields that are entity links.
-    any entity link fields are then replaced with the entity object.
+    Resolves the organisation entity and the linked entities shown on an entity
+    page in a single query. links maps a linked dataset to the reference the
+    entity holds for it, a link is only resolved when exactly one entity in
+    that dataset has the reference. organisation_entity can be given as it is
+    held on EntityModel, i.e. as a string.
     """
-    search_params = {
-        "reference": [reference],
-        "dataset": [dataset],
-        "organisation-entity": [organisation_entity],
+    organisation_entity = int(organisation_entity) if organisation_entity else None
+    links = {dataset: ref for dataset, ref in links.items() if ref is not None}
+    clauses = [
+        and_(EntityOrm.dataset == d, EntityOrm.reference == r) for d, r in links.items()
+    ]
+    if organisation_entity is not None:
+        clauses.append(EntityOrm.entity == organisation_entity)
+    if not clauses:
+        return None, {}
+
+    organisation = None
+    found = {}
+    for entity in session.query(EntityOrm).filter(or_(*clauses)):
+        if entity.entity == organisation_entity:
+            organisation = entity_factory(entity)
+        if links.get(entity.dataset) == entity.reference:
+            found.setdefault(entity.dataset, []).append(entity)
+
+    linked_entities = {
+        dataset: entity_factory(entities[0]).dict(by_alias=True, exclude={"geojson"})
+        for dataset, entities in found.items()
+        if len(entities) == 1
     }
-    found_entities = get_entity_search(session, search_params)
-    if found_entities["count"] == 1:
-        found_entity = found_entities["entities"][0]
-        return found_entity.dict(by_alias=True, exclude={"geojson"})
-    # elif found_entities["count"] > 1:
-    # Log that multiple entities were found
-    # set the entity to -1 so the page not found page is shown
-    # elif found_entities["count"] == 0:
-    # Log that no entity was found
-    # set the entity to -1 so the page not found page is shown
+    return organisation, linked_entities
 
 
 def _apply_base_filters(query, params):
@@ -163,38 +362,45 @@ def _apply_date_filters(query, params):
     return query
 
 
+def _spatial_clause(relation, column, column_is_valid, geometry, *conditions):
+    """
+    Matches rows where the column is valid and has the relation to the
+    geometry. The bounding box operator for the relation is checked first so
+    the spatial index narrows the rows the exact relation is worked out for
+    """
+    clauses = [column_is_valid.is_(True), *conditions]
+    bbox_operator = get_bbox_operator_for_relation(relation)
+    if bbox_operator is not None:
+        clauses.append(column.op(bbox_operator)(geometry))
+    clauses.append(get_spatial_function_for_relation(relation)(column, geometry))
+    return and_(*clauses)
+
+
 def _apply_location_filters(session, query, params):
     point = get_point(params)
     if point is not None:
         query = query.filter(
-            and_(
-                EntityOrm.geometry.is_not(None),
-                func.ST_IsValid(EntityOrm.geometry),
-                func.ST_Contains(EntityOrm.geometry, func.ST_GeomFromText(point, 4326)),
+            _spatial_clause(
+                GeometryRelation.contains,
+                EntityOrm.geometry,
+                EntityOrm.geometry_is_valid,
+                func.ST_GeomFromText(point, 4326),
             )
         )
 
-    spatial_function = get_spatial_function_for_relation(
-        params.get("geometry_relation", GeometryRelation.within)
-    )
+    relation = params.get("geometry_relation", GeometryRelation.within)
 
     clauses = []
     for geometry in params.get("geometry", []):
+        # pass the already parsed geometry as WKB so postgis isn't parsing WKT
+        geometry = func.ST_GeomFromWKB(get_geometry(geometry).wkb, 4326)
         clauses.append(
             or_(
-                and_(
-                    EntityOrm.geometry.is_not(None),
-                    func.ST_IsValid(EntityOrm.geometry),
-                    spatial_function(
-                        EntityOrm.geometry, func.ST_GeomFromText(geometry, 4326)
-                    ),
+                _spatial_clause(
+                    relation, EntityOrm.geometry, EntityOrm.geometry_is_valid, geometry
                 ),
-                and_(
-                    EntityOrm.point.is_not(None),
-                    func.ST_IsValid(EntityOrm.point),
-                    spatial_function(
-                        EntityOrm.point, func.ST_GeomFromText(geometry, 4326)
-                    ),
+                _spatial_clause(
+                    relation, EntityOrm.point, EntityOrm.point_is_valid, geometry
                 ),
             )
         )
@@ -204,84 +410,38 @@ def _apply_location_filters(session, query, params):
     intersecting_entities = params.get("geometry_entity", [])
     if intersecting_entities:
         intersecting_entities_query = (
-            session.query(EntityOrm.geometry)
+            session.query(EntityOrm.geometry, EntityOrm.geometry_is_valid)
             .filter(EntityOrm.entity.in_(intersecting_entities))
             .group_by(EntityOrm.entity)
             .subquery()
         )
-
         query = query.join(
             intersecting_entities_query,
-            or_(
-                and_(
-                    EntityOrm.geometry.is_not(None),
-                    func.ST_IsValid(EntityOrm.geometry),
-                    func.ST_IsValid(intersecting_entities_query.c.geometry),
-                    spatial_function(
-                        EntityOrm.geometry,
-                        intersecting_entities_query.c.geometry,
-                    ),
-                ),
-                and_(
-                    EntityOrm.point.is_not(None),
-                    func.ST_IsValid(intersecting_entities_query.c.geometry),
-                    spatial_function(
-                        EntityOrm.point, intersecting_entities_query.c.geometry
-                    ),
-                ),
-            ),
+            _get_spatial_join_clause(relation, intersecting_entities_query),
         )
 
     references = params.get("geometry_reference", [])
     if references:
         reference_query = (
-            session.query(EntityOrm.geometry)
+            session.query(EntityOrm.geometry, EntityOrm.geometry_is_valid)
             .filter(EntityOrm.reference.in_(references))
             .group_by(EntityOrm)
             .subquery()
         )
         query = query.join(
-            reference_query,
-            or_(
-                and_(
-                    EntityOrm.geometry.is_not(None),
-                    func.ST_IsValid(EntityOrm.geometry),
-                    func.ST_IsValid(reference_query.c.geometry),
-                    spatial_function(EntityOrm.geometry, reference_query.c.geometry),
-                ),
-                and_(
-                    EntityOrm.point.is_not(None),
-                    func.ST_IsValid(reference_query.c.geometry),
-                    spatial_function(EntityOrm.point, reference_query.c.geometry),
-                ),
-            ),
+            reference_query, _get_spatial_join_clause(relation, reference_query)
         )
 
     curies = params.get("geometry_curie", [])
     if curies:
         split_curies = [tuple(curie.split(":")) for curie in curies]
         curie_query = (
-            session.query(EntityOrm.geometry)
+            session.query(EntityOrm.geometry, EntityOrm.geometry_is_valid)
             .filter(tuple_(EntityOrm.prefix, EntityOrm.reference).in_(split_curies))
             .group_by(EntityOrm)
             .subquery()
         )
-        query = query.join(
-            curie_query,
-            or_(
-                and_(
-                    EntityOrm.geometry.is_not(None),
-                    func.ST_IsValid(EntityOrm.geometry),
-                    func.ST_IsValid(curie_query.c.geometry),
-                    spatial_function(EntityOrm.geometry, curie_query.c.geometry),
-                ),
-                and_(
-                    EntityOrm.point.is_not(None),
-                    func.ST_IsValid(curie_query.c.geometry),
-                    spatial_function(EntityOrm.point, curie_query.c.geometry),
-                ),
-            ),
-        )
+        query = query.join(curie_query, _get_spatial_join_clause(relation, curie_query))
 
     # final step to add a group by if more than one condition is being met.
     if len(intersecting_entities) > 1 or len(references) > 0 or len(curies) > 1:
@@ -292,6 +452,27 @@ def _apply_location_filters(session, query, params):
     return query
 
 
+def _get_spatial_join_clause(relation, subquery):
+    # subquery is of the geometries of other entities to compare against
+    valid = subquery.c.geometry_is_valid.is_(True)
+    return or_(
+        _spatial_clause(
+            relation,
+            EntityOrm.geometry,
+            EntityOrm.geometry_is_valid,
+            subquery.c.geometry,
+            valid,
+        ),
+        _spatial_clause(
+            relation,
+            EntityOrm.point,
+            EntityOrm.point_is_valid,
+            subquery.c.geometry,
+            valid,
+        ),
+    )
+
+
 def _apply_period_option_filter(query, params):
     options = params.get("period", PeriodOption.all)
     if options == PeriodOption.all or PeriodOption.all in options:
@@ -309,9 +490,13 @@ def _apply_period_option_filter(query, params):
 
 
 def _apply_limit_and_pagination_filters(query, params):
+    # seek past the last entity seen rather than scanning and discarding
+    # offset rows, this keeps deep pages as cheap as the first
+    if params.get("after_entity") is not None:
+        query = query.filter(EntityOrm.entity > params["after_entity"])
     query = query.order_by(EntityOrm.entity)
     if params.get("limit") is not None:
         query = query.limit(params["limit"])
-    if params.get("offset") is not None:
+    if params.get("offset") is not None and params.get("after_entity") is None:
         query = query.offset(params["offset"])
     return query
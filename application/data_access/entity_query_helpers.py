@@ -1,6 +1,12 @@
 import datetime
 import operator
 
+from functools import lru_cache
+from typing import Optional
+
+from shapely import wkt
+from shapely.geometry.base import BaseGeometry
+
 from application.db.models import EntityOrm
 from application.search.enum import DateOption, GeometryRelation
 
@@ -45,6 +51,16 @@ def get_point(params):
     return None
 
 
+@lru_cache(maxsize=256)
+def get_geometry(geometry: str) -> BaseGeometry:
+    """
+    Parses WKT into a shapely geometry, raises an exception if the WKT is invalid.
+    Parsed geometries are cached so a geometry validated when the request is
+    read isn't parsed again when the query is built.
+    """
+    return wkt.loads(geometry)
+
+
 def get_spatial_function_for_relation(relation):
     from sqlalchemy import func
 
@@ -70,6 +86,22 @@ def get_spatial_function_for_relation(relation):
     return func.ST_Within
 
 
+def get_bbox_operator_for_relation(relation) -> Optional[str]:
+    """
+    Returns the bounding box operator implied by the relation, it's checked
+    against the spatial indexes before the exact relation is worked out.
+    Disjoint geometries can have overlapping bounding boxes so there's no
+    operator for it
+    """
+    if relation == GeometryRelation.disjoint:
+        return None
+    if relation in [GeometryRelation.within, GeometryRelation.coveredby]:
+        return "@"
+    if relation in [GeometryRelation.contains, GeometryRelation.covers]:
+        return "~"
+    return "&&"
+
+
 def normalised_params(params):
     lists = [
         "typology",
@@ -0,0 +1,139 @@
+"""
+Counts of the entities matching a search by dataset, typology and
+organisation_entity, i.e. how many results each of the search filters would
+give.
+
+The counts for every facet asked for come from one aggregate query using
+GROUPING SETS, so the search filters are only evaluated once. Results are kept
+in a bounded in process cache for FACET_CACHE_TTL seconds, keyed on the search
+and the dataset versions so a load means they are counted again.
+"""
+import json
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from application.data_access.entity_queries import (
+    _check_query_cost,
+    _get_entity_search_query,
+)
+from application.data_access.entity_query_helpers import normalised_params
+from application.data_access.reference_data import get_dataset_versions
+from application.db.models import EntityOrm
+from application.search.enum import FacetOption
+from application.settings import get_settings
+
+# parameters that change how results are paged or shown but not which match
+IGNORED_PARAMS = [
+    "limit",
+    "offset",
+    "after_entity",
+    "count",
+    "simplify",
+    "accept",
+    "suffix",
+    "field",
+    "exclude_field",
+    "facet",
+]
+
+_cache: "OrderedDict[str, Tuple[float, Dict[str, Dict[str, int]]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def invalidate_facets():
+    with _lock:
+        _cache.clear()
+
+
+def _copy(counts: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+    # callers are free to modify the counts they get back so hand out copies
+    return {facet: dict(values) for facet, values in counts.items()}
+
+
+def _make_key(session: Session, params: dict, facets: List[FacetOption]) -> str:
+    versions = sorted(get_dataset_versions(session).items())
+    return json.dumps(
+        [params, sorted(facet.value for facet in facets), versions],
+        sort_keys=True,
+        default=str,
+    )
+
+
+def _get_facets_query(session: Session, params: dict, facets: List[FacetOption]):
+    # the search can be grouped by entity, e.g. for geometry_reference, so the
+    # matching entities are found first and counted without that grouping
+    matching = _get_entity_search_query(session, [EntityOrm.entity], params)
+    matching = matching.subquery("matching")
+
+    columns = [getattr(EntityOrm, facet.value) for facet in facets]
+    # grouping() is 0 for the rows grouped by the column, the column is null
+    # in the rows for the other sets
+    query_args = [
+        *columns,
+        *[func.grouping(column).label(f"{column.key}_grouping") for column in columns],
+        func.count().label("count"),
+    ]
+    return (
+        session.query(*query_args)
+        .filter(EntityOrm.entity.in_(select(matching.c.entity)))
+        .group_by(func.grouping_sets(*columns))
+    )
+
+
+def get_entity_facets(
+    session: Session, parameters: dict, facets: Optional[List[FacetOption]] = None
+) -> Dict[str, Dict[str, int]]:
+    """
+    Returns the number of entities matching the search parameters for each
+    value of the facets, e.g. {"dataset": {"conservation-area": 12}}. Entities
+    without a value for a facet aren't counted for it.
+    """
+    facets = sorted(set(facets or FacetOption), key=list(FacetOption).index)
+    params = {
+        key: value
+        for key, value in normalised_params(parameters).items()
+        if key not in IGNORED_PARAMS
+    }
+
+    ttl = get_settings().FACET_CACHE_TTL
+    key = _make_key(session, params, facets)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(key)
+            return _copy(entry[1])
+
+    query = _get_facets_query(session, params, facets)
+    _check_query_cost(session, query)
+
+    counts = {facet.value: {} for facet in facets}
+    for row in query.all():
+        for facet in facets:
+            value = getattr(row, facet.value)
+            if getattr(row, f"{facet.value}_grouping") == 0 and value is not None:
+                counts[facet.value][str(value)] = row.count
+
+    size = get_settings().FACET_CACHE_SIZE
+    if size and ttl:
+        with _lock:
+            _cache[key] = (now + ttl, counts)
+            _cache.move_to_end(key)
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+    return _copy(counts)
+
+
+async def get_entity_facets_async(
+    session: AsyncSession,
+    parameters: dict,
+    facets: Optional[List[FacetOption]] = None,
+) -> Dict[str, Dict[str, int]]:
+    return await session.run_sync(get_entity_facets, parameters, facets)
@@ -1,44 +1,102 @@
+import json
 import logging
 
 from typing import List, Optional
+from sqlalchemy import Text, cast, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg
+from sqlalchemy.orm import Session
+
 from application.core.models import FactModel, DatasetFieldModel
-from application.data_access.datasette_query_helpers import get_datasette_http
-from application.settings import get_settings
+from application.data_access.datasette_query_helpers import (
+    DatasetteQuery,
+    query_datasette,
+    query_datasette_async,
+)
+from application.db.models import EntityOrm, FactOrm, FactResourceOrm
 
 logger = logging.getLogger(__name__)
-settings = get_settings()
 
+DATASET_FIELDS_QUERY = DatasetteQuery(
+    "dataset-fields",
+    """
+    SELECT DISTINCT f.field
+    FROM fact f;
+    """,
+)
 
-def get_dataset_fields(dataset, entity=None):
-    url = f"{settings.DATASETTE_URL}/{dataset}.json"
-    sql = """
-         SELECT DISTINCT f.field
-         FROM fact f
+ENTITY_FIELDS_QUERY = DatasetteQuery(
+    "entity-fields",
+    """
+    SELECT DISTINCT f.field
+    FROM fact f
+    WHERE f.entity = :entity;
+    """,
+)
+
+FACT_QUERY = DatasetteQuery(
+    "fact",
     """
+    SELECT
+        f.fact,
+        f.entity,
+        e.name as entity_name,
+        e.prefix as entity_prefix,
+        e.reference as entity_reference,
+        f.reference_entity,
+        f.field,
+        f.value,
+        min(fr.entry_date) as earliest_entry_date,
+        max(fr.entry_date) as latest_entry_date,
+        fr.resource as latest_resource,
+        json_group_array(json_object('resource',fr.resource,'entry_date',fr.entry_date)) as resources
+    FROM fact f, fact_resource fr, entity e
+    WHERE f.fact = fr.fact
+    AND f.entity = e.entity
+    AND f.fact = :fact
+    GROUP BY f.entity, f.fact, f.field,f.value;
+    """,
+)
+
+# :fields is a json array of field names, an empty array is every field, so
+# the text is the same however many fields are asked for
+ENTITY_FACTS_QUERY = DatasetteQuery(
+    "entity-facts",
+    """
+    SELECT
+        f.fact,
+        f.entity,
+        e.name as entity_name,
+        e.prefix as entity_prefix,
+        e.reference as entity_reference,
+        f.reference_entity,
+        f.field,
+        f.value,
+        min(fr.entry_date) as earliest_entry_date,
+        max(fr.entry_date) as latest_entry_date,
+        fr.resource as latest_resource
+    FROM fact f, fact_resource fr, entity e
+    WHERE f.fact = fr.fact
+    AND f.entity = e.entity
+    AND f.entity = :entity
+    AND (
+        json_array_length(:fields) = 0
+        OR f.field IN (SELECT value FROM json_each(:fields))
+    )
+    GROUP BY f.entity, f.fact, f.field,f.value;
+    """,
+)
+
+
+def _get_dataset_fields_query(entity=None):
     if entity is not None:
-        sql = (
-            sql
-            + f"""
-            WHERE f.entity='{entity}';
-        """
-        )
-    else:
-        sql = sql + ";"
+        return ENTITY_FIELDS_QUERY, {"entity": entity}
+    return DATASET_FIELDS_QUERY, {}
 
-    params = {"sql": sql, "_shape": "array"}
 
+def get_dataset_fields(dataset, entity=None):
+    query, params = _get_dataset_fields_query(entity)
     try:
-        http = get_datasette_http()
-        resp = http.get(url, params=params)
-        resp.raise_for_status()
-        rows = resp.json()
-        # datasette returns empty strings for nulls. is there
-        # a datasette config way to prevent this? for now set empties
-        # to None.
-        for r in rows:
-            for key, val in r.items():
-                if not val:
-                    r[key] = None
+        rows = query_datasette(dataset, query, params)
         fields = [DatasetFieldModel(**field) for field in rows]
         return fields
     except Exception as e:
@@ -46,47 +104,18 @@ def get_dataset_fields(dataset, entity=None):
         return None
 
 
-def get_fact_query(fact: str, dataset: str) -> Optional[FactModel]:
-    url = f"{settings.DATASETTE_URL}/{dataset}.json"
-    sql = f"""SELECT
-                f.fact,
-                f.entity,
-                e.name as entity_name,
-                e.prefix as entity_prefix,
-                e.reference as entity_reference,
-                f.reference_entity,
-                f.field,
-                f.value,
-                min(fr.entry_date) as earliest_entry_date,
-                max(fr.entry_date) as latest_entry_date,
-                fr.resource as latest_resource,
-                json_group_array(json_object('resource',fr.resource,'entry_date',fr.entry_date)) as resources
-            FROM fact f, fact_resource fr, entity e
-            WHERE f.fact = fr.fact
-            AND f.entity = e.entity
-            AND f.fact = '{fact}'
-            GROUP BY f.entity, f.fact, f.field,f.value;"""
-
-    params = {"sql": sql, "_shape": "array"}
-
+async def get_dataset_fields_async(dataset, entity=None):
+    query, params = _get_dataset_fields_query(entity)
     try:
-        http = get_datasette_http()
-        resp = http.get(url, params=params)
-        resp.raise_for_status()
-        rows = resp.json()
-        # datasette returns empty strings for nulls. is there
-        # a datasette config way to prevent this? for now set empties
-        # to None.
-        for r in rows:
-            for key, val in r.items():
-                if not val:
-                    r[key] = None
-        facts = [FactModel(**fact) for fact in rows]
-
+        rows = await query_datasette_async(dataset, query, params)
+        fields = [DatasetFieldModel(**field) for field in rows]
+        return fields
     except Exception as e:
         logger.warning(e)
         return None
 
+
+def _get_single_fact(facts: List[FactModel]) -> Optional[FactModel]:
     if len(facts) > 1:
         raise Exception("Multiple facts returned when one or zero is expected")
     elif len(facts) == 0:
@@ -95,59 +124,135 @@ def get_fact_query(fact: str, dataset: str) -> Optional[FactModel]:
         return facts[0]
 
 
+def get_fact_query(fact: str, dataset: str) -> Optional[FactModel]:
+    try:
+        rows = query_datasette(dataset, FACT_QUERY, {"fact": fact})
+        facts = [FactModel(**fact) for fact in rows]
+    except Exception as e:
+        logger.warning(e)
+        return None
+    return _get_single_fact(facts)
+
+
+async def get_fact_query_async(fact: str, dataset: str) -> Optional[FactModel]:
+    try:
+        rows = await query_datasette_async(dataset, FACT_QUERY, {"fact": fact})
+        facts = [FactModel(**fact) for fact in rows]
+    except Exception as e:
+        logger.warning(e)
+        return None
+    return _get_single_fact(facts)
+
+
+def _get_search_facts_params(query_params: dict) -> dict:
+    return {
+        "entity": query_params["entity"],
+        "fields": json.dumps(sorted(query_params["field"] or [])),
+    }
+
+
 def get_search_facts_query(query_params: List) -> Optional[FactModel]:
     """
     A function that can take a single entity and retrieve all facts related to it.
     """
-    # now using the entity information retrieve the facts for the entity
-    url = f"{settings.DATASETTE_URL}/{query_params['dataset']}.json"
-    sql = f"""SELECT
-                f.fact,
-                f.entity,
-                e.name as entity_name,
-                e.prefix as entity_prefix,
-                e.reference as entity_reference,
-                f.reference_entity,
-                f.field,
-                f.value,
-                min(fr.entry_date) as earliest_entry_date,
-                max(fr.entry_date) as latest_entry_date,
-                fr.resource as latest_resource
-            FROM fact f, fact_resource fr, entity e
-            WHERE f.fact = fr.fact
-            AND f.entity = e.entity
-            AND f.entity = {query_params['entity']}"""
-
-    if query_params["field"]:
-        sql = (
-            sql
-            + f"""
-        AND f.field in ('{"','".join(query_params['field'])}')
-        """
-        )
+    params = _get_search_facts_params(query_params)
 
-    sql = (
-        sql
-        + """
-        GROUP BY f.entity, f.fact, f.field,f.value;
-    """
-    )
-    params = {"sql": sql, "_shape": "array"}
+    try:
+        rows = query_datasette(query_params["dataset"], ENTITY_FACTS_QUERY, params)
+        facts = [FactModel(**fact) for fact in rows]
+        return facts
+    except Exception as e:
+        logger.warning(e)
+        return None
+
+
+async def get_search_facts_query_async(query_params: dict) -> Optional[FactModel]:
+    params = _get_search_facts_params(query_params)
 
     try:
-        http = get_datasette_http()
-        resp = http.get(url, params=params)
-        resp.raise_for_status()
-        rows = resp.json()
-        # datasette returns empty strings for nulls. is there
-        # a datasette config way to prevent this? for now set empties
-        # to None.
-        for r in rows:
-            for key, val in r.items():
-                if not val:
-                    r[key] = None
+        rows = await query_datasette_async(
+            query_params["dataset"], ENTITY_FACTS_QUERY, params
+        )
         facts = [FactModel(**fact) for fact in rows]
         return facts
     except Exception as e:
         logger.warning(e)
         return None
+
+
+# the fact and fact_resource tables in postgres hold the same rows as the
+# datasette databases, the functions below return the same models from them
+
+
+def _get_facts_statement(resources: bool = False):
+    newest_first = FactResourceOrm.entry_date.desc()
+    columns = [
+        FactOrm.fact,
+        FactOrm.entity,
+        EntityOrm.name.label("entity_name"),
+        EntityOrm.prefix.label("entity_prefix"),
+        EntityOrm.reference.label("entity_reference"),
+        FactOrm.reference_entity,
+        FactOrm.field,
+        FactOrm.value,
+        func.min(FactResourceOrm.entry_date).label("earliest_entry_date"),
+        func.max(FactResourceOrm.entry_date).label("latest_entry_date"),
+        array_agg(aggregate_order_by(FactResourceOrm.resource, newest_first))[1].label(
+            "latest_resource"
+        ),
+    ]
+    if resources:
+        # keys are literals as asyncpg can't infer a type for them as parameters
+        resource = func.json_build_object(
+            literal_column("'resource'"),
+            FactResourceOrm.resource,
+            literal_column("'entry_date'"),
+            FactResourceOrm.entry_date,
+        )
+        columns.append(
+            cast(func.json_agg(aggregate_order_by(resource, newest_first)), Text).label(
+                "resources"
+            )
+        )
+    return (
+        select(*columns)
+        .join(FactResourceOrm, FactResourceOrm.fact == FactOrm.fact)
+        .join(EntityOrm, EntityOrm.entity == FactOrm.entity)
+        .group_by(FactOrm.fact, EntityOrm.entity)
+    )
+
+
+def get_fact_by_id(session: Session, fact: str, dataset: str) -> Optional[FactModel]:
+    # facts don't have a dataset, it's the dataset of the fact's entity, like
+    # the datasette query only finding facts in the dataset's database
+    sql = (
+        _get_facts_statement(resources=True)
+        .where(FactOrm.fact == fact)
+        .where(EntityOrm.dataset == dataset)
+    )
+    row = session.execute(sql).one_or_none()
+    return FactModel(**row._mapping) if row is not None else None
+
+
+def get_facts_for_entity(
+    session: Session, entity: int, fields: Optional[List[str]] = None
+) -> List[FactModel]:
+    sql = _get_facts_statement().where(FactOrm.entity == entity)
+    if fields:
+        sql = sql.where(FactOrm.field.in_(fields))
+    sql = sql.order_by(FactOrm.field, FactOrm.fact)
+    return [FactModel(**row._mapping) for row in session.execute(sql)]
+
+
+def get_fact_fields(
+    session: Session, dataset: str, entity: Optional[int] = None
+) -> List[DatasetFieldModel]:
+    sql = select(FactOrm.field).distinct()
+    if entity is not None:
+        sql = sql.where(FactOrm.entity == entity)
+    else:
+        sql = sql.join(EntityOrm, EntityOrm.entity == FactOrm.entity).where(
+            EntityOrm.dataset == dataset
+        )
+    sql = sql.where(FactOrm.field.is_not(None)).order_by(FactOrm.field)
+    return [DatasetFieldModel(field=field) for field in session.execute(sql).scalars()]
@@ -0,0 +1,126 @@
+"""
+In process cache for the reference tables (dataset, typology and organisation).
+
+These tables only change when the nightly load runs but are read on nearly
+every request to validate parameters and build the search facets. Results are
+kept in a bounded LRU cache for REFERENCE_DATA_CACHE_TTL seconds.
+
+The tables are loaded by a separate process, so loads are seen through the
+dataset versions. They're read again every REFERENCE_DATA_VERSION_CHECK_INTERVAL
+seconds and the cache is invalidated as soon as they change.
+invalidate_reference_data can be used to drop the cache at any other time.
+"""
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from application.data_access import dataset_queries, digital_land_queries
+from application.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+_cache: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+# the dataset versions last read and when they're next read again
+_versions: Optional[Tuple[float, Dict[str, Optional[str]]]] = None
+_lock = threading.Lock()
+
+
+def invalidate_reference_data():
+    global _versions
+    with _lock:
+        _cache.clear()
+        _versions = None
+
+
+def _hashable(value):
+    # lists of dataset names and the like are keyed regardless of order
+    if isinstance(value, str) or not isinstance(value, Iterable):
+        return value
+    return tuple(sorted(value))
+
+
+def _make_key(func: Callable, args: tuple, kwargs: dict) -> Tuple:
+    return (
+        func,
+        tuple(_hashable(arg) for arg in args),
+        tuple(sorted((k, _hashable(v)) for k, v in kwargs.items())),
+    )
+
+
+def _copy(value):
+    # callers are free to modify the models they get back so hand out copies
+    if isinstance(value, list):
+        return [v.copy() if isinstance(v, BaseModel) else v for v in value]
+    if isinstance(value, BaseModel):
+        return value.copy()
+    return value
+
+
+def cached_reference_data(func: Callable) -> Callable:
+    @wraps(func)
+    def wrapper(session: Session, *args, **kwargs):
+        ttl = get_settings().REFERENCE_DATA_CACHE_TTL
+        if not ttl:
+            return func(session, *args, **kwargs)
+
+        key = _make_key(func, args, kwargs)
+        now = time.monotonic()
+        with _lock:
+            entry = _cache.get(key)
+            if entry is not None and entry[0] > now:
+                _cache.move_to_end(key)
+                return _copy(entry[1])
+
+        value = func(session, *args, **kwargs)
+        size = get_settings().REFERENCE_DATA_CACHE_SIZE
+        with _lock:
+            _cache[key] = (now + ttl, value)
+            _cache.move_to_end(key)
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+        return _copy(value)
+
+    return wrapper
+
+
+def get_dataset_versions(session: Session) -> Dict[str, Optional[str]]:
+    """
+    Returns the version of each dataset, read again at most every
+    REFERENCE_DATA_VERSION_CHECK_INTERVAL seconds. A change means a load has
+    happened so the rest of the reference data is invalidated too
+    """
+    global _versions
+    now = time.monotonic()
+    with _lock:
+        entry = _versions
+    if entry is not None and entry[0] > now:
+        return dict(entry[1])
+
+    versions = digital_land_queries.get_dataset_versions(session)
+    if entry is not None and versions != entry[1]:
+        logger.info("dataset versions have changed, invalidating reference data")
+        invalidate_reference_data()
+    interval = get_settings().REFERENCE_DATA_VERSION_CHECK_INTERVAL
+    with _lock:
+        _versions = (now + interval, versions)
+    return dict(versions)
+
+
+get_dataset_names = cached_reference_data(dataset_queries.get_dataset_names)
+get_datasets = cached_reference_data(digital_land_queries.get_datasets)
+get_dataset_query = cached_reference_data(digital_land_queries.get_dataset_query)
+get_last_updated = cached_reference_data(digital_land_queries.get_last_updated)
+get_typology_names = cached_reference_data(digital_land_queries.get_typology_names)
+get_typologies_with_entities = cached_reference_data(
+    digital_land_queries.get_typologies_with_entities
+)
+get_local_authorities = cached_reference_data(
+    digital_land_queries.get_local_authorities
+)
@@ -0,0 +1,79 @@
+"""
+Mapbox vector tiles built from the entity geometries with ST_AsMVT.
+
+Tiles are kept in a bounded in process LRU cache. The cache is keyed on the
+dataset version so tiles for a dataset stop being used as soon as a load
+changes its version, invalidate_tiles can be used to drop them sooner.
+"""
+import threading
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from application.db.models import EntityOrm
+from application.settings import get_settings
+
+_cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def invalidate_tiles(dataset: Optional[str] = None):
+    with _lock:
+        if dataset is None:
+            _cache.clear()
+        else:
+            for key in [key for key in _cache if key[0] == dataset]:
+                del _cache[key]
+
+
+def _get_tile_statement(dataset: str, z: int, x: int, y: int):
+    envelope = func.ST_TileEnvelope(z, x, y)
+    bounds = func.ST_Transform(envelope, 4326)
+    geometry = func.coalesce(EntityOrm.geometry, EntityOrm.point)
+    tile_rows = (
+        select(
+            EntityOrm.entity,
+            EntityOrm.name,
+            EntityOrm.reference,
+            EntityOrm.dataset,
+            func.ST_AsMVTGeom(func.ST_Transform(geometry, 3857), envelope).label(
+                "geometry"
+            ),
+        )
+        .where(EntityOrm.dataset == dataset)
+        # && is a bounding box test so the spatial indexes are used
+        .where(
+            or_(
+                EntityOrm.geometry.intersects(bounds),
+                EntityOrm.point.intersects(bounds),
+            )
+        )
+        .subquery("tile")
+    )
+    # each dataset is a layer named after the dataset like the datasette tiles
+    return select(func.ST_AsMVT(tile_rows.table_valued(), dataset, 4096, "geometry"))
+
+
+def get_tile(
+    session: Session, dataset: str, version: Optional[str], z: int, x: int, y: int
+) -> bytes:
+    key = (dataset, version, z, x, y)
+    with _lock:
+        tile = _cache.get(key)
+        if tile is not None:
+            _cache.move_to_end(key)
+            return tile
+
+    tile = session.execute(_get_tile_statement(dataset, z, x, y)).scalar()
+    tile = bytes(tile) if tile is not None else b""
+
+    size = get_settings().TILE_CACHE_SIZE
+    if size:
+        with _lock:
+            _cache[key] = tile
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+    return tile
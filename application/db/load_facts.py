@@ -0,0 +1,99 @@
+"""
+Loads a dataset's facts into the fact and fact_resource tables from the
+dataset's sqlite database, the same database datasette serves for it.
+
+    python -m application.db.load_facts <dataset> <path to dataset sqlite3>
+
+The facts already held for the dataset are found through its entities, so the
+entities should be loaded first. The dataset's facts are replaced in a single
+transaction, requests see either the old facts or the new ones.
+"""
+import logging
+import sqlite3
+import sys
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from application.db.models import EntityOrm, FactOrm, FactResourceOrm
+from application.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+
+def read_rows(path: str, table: str, columns: List[str]) -> Iterator[dict]:
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    try:
+        names = {
+            row["name"] for row in connection.execute(f"PRAGMA table_info({table})")
+        }
+        selected = ", ".join(c if c in names else f"NULL AS {c}" for c in columns)
+        for row in connection.execute(f"SELECT {selected} FROM {table}"):
+            # the sqlite databases use empty strings for missing values
+            yield {key: (None if row[key] == "" else row[key]) for key in columns}
+    finally:
+        connection.close()
+
+
+def _batches(rows: Iterator[dict]) -> Iterator[List[dict]]:
+    while batch := list(islice(rows, BATCH_SIZE)):
+        yield batch
+
+
+def _upsert(session: Session, table, rows: Iterator[dict]) -> int:
+    count = 0
+    for batch in _batches(rows):
+        sql = insert(table)
+        keys = [column.name for column in table.primary_key]
+        sql = sql.on_conflict_do_update(
+            index_elements=keys,
+            set_={k: v for k, v in sql.excluded.items() if k not in keys},
+        )
+        session.execute(sql, batch)
+        count += len(batch)
+    return count
+
+
+def load_facts(session: Session, dataset: str, path: str) -> Tuple[int, int]:
+    """
+    Replaces the facts for the dataset's entities with the facts in the sqlite
+    database at path, returns the number of facts and fact resources loaded
+    """
+    entities = select(EntityOrm.entity).where(EntityOrm.dataset == dataset)
+    facts = select(FactOrm.fact).where(FactOrm.entity.in_(entities))
+    session.execute(delete(FactResourceOrm).where(FactResourceOrm.fact.in_(facts)))
+    session.execute(delete(FactOrm).where(FactOrm.entity.in_(entities)))
+
+    fact_table = FactOrm.__table__
+    fact_resource_table = FactResourceOrm.__table__
+    fact_count = _upsert(
+        session,
+        fact_table,
+        read_rows(path, "fact", [c.name for c in fact_table.columns]),
+    )
+    fact_resource_count = _upsert(
+        session,
+        fact_resource_table,
+        read_rows(path, "fact_resource", [c.name for c in fact_resource_table.columns]),
+    )
+    return fact_count, fact_resource_count
+
+
+def main(dataset: str, path: str):
+    engine = create_engine(get_settings().WRITE_DATABASE_URL)
+    with Session(engine) as session, session.begin():
+        fact_count, fact_resource_count = load_facts(session, dataset, path)
+    logger.info(
+        f"loaded {fact_count} facts and {fact_resource_count} fact resources for {dataset}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(*sys.argv[1:])
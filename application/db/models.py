@@ -1,15 +1,25 @@
 import json
 from datetime import datetime
 from geoalchemy2 import Geometry
-from sqlalchemy import Column, Date, BIGINT, Text, Index, Integer, cast, func
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Computed,
+    Date,
+    BIGINT,
+    Text,
+    Index,
+    Integer,
+    cast,
+    inspect,
+)
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import (
+    deferred,
     relationship,
     foreign,
     remote,
-    column_property,
 )
 
 Base = declarative_base()
@@ -31,16 +41,56 @@ class EntityOrm(Base):
     typology = Column(Text, nullable=True)
     geometry = Column(Geometry(geometry_type="MULTIPOLYGON", srid=4326), nullable=True)
     point = Column(Geometry(geometry_type="POINT", srid=4326), nullable=True)
-    _geometry_geojson = column_property(func.ST_AsGeoJSON(geometry))
-    _point_geojson = column_property(func.ST_AsGeoJSON(point))
+    # maintained by postgres whenever the geometry or point changes, the geometry
+    # takes priority over the point
+    geometry_geojson = Column(
+        Text,
+        Computed("ST_AsGeoJSON(COALESCE(geometry, point))", persisted=True),
+        nullable=True,
+    )
+
+    # validity worked out once as entities are loaded rather than for every row
+    # a spatial search looks at, null when there's no geometry or point
+    geometry_is_valid = Column(
+        Boolean, Computed("ST_IsValid(geometry)", persisted=True), nullable=True
+    )
+    point_is_valid = Column(
+        Boolean, Computed("ST_IsValid(point)", persisted=True), nullable=True
+    )
 
-    @hybrid_property
+    # simplified copies of the geometry for lighter responses, tolerances are
+    # in degrees, roughly 10m, 100m and 1km. Deferred so they're only loaded
+    # when asked for
+    geometry_simplified_low = deferred(
+        Column(
+            Geometry(srid=4326, spatial_index=False),
+            Computed("ST_SimplifyPreserveTopology(geometry, 0.0001)", persisted=True),
+            nullable=True,
+        )
+    )
+    geometry_simplified_medium = deferred(
+        Column(
+            Geometry(srid=4326, spatial_index=False),
+            Computed("ST_SimplifyPreserveTopology(geometry, 0.001)", persisted=True),
+            nullable=True,
+        )
+    )
+    geometry_simplified_high = deferred(
+        Column(
+            Geometry(srid=4326, spatial_index=False),
+            Computed("ST_SimplifyPreserveTopology(geometry, 0.01)", persisted=True),
+            nullable=True,
+        )
+    )
+
+    @property
     def geojson(self):
-        if self._geometry_geojson is not None:
-            geometry = json.loads(self._geometry_geojson)
-            return {"geometry": geometry, "type": "Feature"}
-        elif self._point_geojson is not None:
-            geometry = json.loads(self._point_geojson)
+        # the geojson can be deferred, in which case it's left out rather
+        # than being lazy loaded one row at a time
+        if "geometry_geojson" in inspect(self).unloaded:
+            return None
+        if self.geometry_geojson is not None:
+            geometry = json.loads(self.geometry_geojson)
             return {"geometry": geometry, "type": "Feature"}
         return None
 
@@ -215,6 +265,14 @@ class DatasetPublicationCountOrm(Base):
     publisher_count = Column(Integer, nullable=False)
 
 
+# maintained by triggers on entity, see migration 7a3e5b9c1f24
+class DatasetEntityCountOrm(Base):
+    __tablename__ = "dataset_entity_count"
+
+    dataset = Column(Text, primary_key=True)
+    entity_count = Column(BIGINT, nullable=False)
+
+
 class LookupOrm(Base):
     __tablename__ = "lookup"
 
@@ -246,3 +304,32 @@ class LicenceOrm(Base):
     entry_date = Column(Date, nullable=True)
     start_date = Column(Date, nullable=True)
     end_date = Column(Date, nullable=True)
+
+
+class FactOrm(Base):
+    __tablename__ = "fact"
+
+    fact = Column(Text, primary_key=True)
+    entity = Column(BIGINT, nullable=False)
+    field = Column(Text, nullable=True)
+    value = Column(Text, nullable=True)
+    reference_entity = Column(BIGINT, nullable=True)
+    priority = Column(Integer, nullable=True)
+    entry_date = Column(Date, nullable=True)
+    start_date = Column(Date, nullable=True)
+    end_date = Column(Date, nullable=True)
+
+
+# facts are looked up for an entity, often for a few of its fields
+idx_fact_entity_field = Index("idx_fact_entity_field", FactOrm.entity, FactOrm.field)
+
+
+class FactResourceOrm(Base):
+    __tablename__ = "fact_resource"
+
+    fact = Column(Text, primary_key=True)
+    resource = Column(Text, primary_key=True)
+    priority = Column(Integer, nullable=True)
+    entry_date = Column(Date, nullable=True)
+    start_date = Column(Date, nullable=True)
+    end_date = Column(Date, nullable=True)
@@ -0,0 +1,176 @@
+"""
+Spreads read traffic across the databases in READ_REPLICA_URLS.
+
+Each replica's lag is checked every READ_REPLICA_CHECK_INTERVAL seconds on a
+background thread. Replicas that can't be reached, or that are more than
+READ_REPLICA_MAX_LAG seconds behind, are left out until a later check finds
+them healthy again. With no healthy replicas, or none configured, sessions
+use READ_DATABASE_URL.
+"""
+import itertools
+import logging
+import os
+import threading
+
+from functools import cached_property, lru_cache
+from typing import List, Optional
+
+import sqlalchemy as sa
+from fastapi_utils.session import FastAPISessionMaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from application.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# seconds since the last replayed transaction, 0 when there's nothing to replay
+# so an idle replica isn't treated as lagging
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery()
+        OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+    )
+END
+"""
+
+
+def _get_pool_options() -> dict:
+    settings = get_settings()
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+class _SessionMaker(FastAPISessionMaker):
+    def get_new_engine(self) -> sa.engine.Engine:
+        timeout = get_settings().DB_STATEMENT_TIMEOUT
+        return sa.create_engine(
+            self.database_uri,
+            connect_args={"options": f"-c statement_timeout={timeout}"},
+            **_get_pool_options(),
+        )
+
+
+class ReadDatabase:
+    def __init__(self, database_uri: str):
+        self.database_uri = database_uri
+        self.sessionmaker = _SessionMaker(database_uri)
+        self.healthy = True
+        self.lag: Optional[float] = None
+
+    @cached_property
+    def async_sessionmaker(self) -> sessionmaker:
+        database_uri = make_url(self.database_uri).set(drivername="postgresql+asyncpg")
+        timeout = get_settings().DB_STATEMENT_TIMEOUT
+        engine = create_async_engine(
+            database_uri,
+            connect_args={"server_settings": {"statement_timeout": str(timeout)}},
+            **_get_pool_options(),
+        )
+        return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    def connections_in_use(self) -> int:
+        in_use = 0
+        if self.sessionmaker._cached_engine is not None:
+            in_use += self.sessionmaker._cached_engine.pool.checkedout()
+        if "async_sessionmaker" in self.__dict__:
+            in_use += self.async_sessionmaker.kw["bind"].sync_engine.pool.checkedout()
+        return in_use
+
+    def check(self, max_lag: float):
+        try:
+            with self.sessionmaker.cached_engine.connect() as connection:
+                self.lag = float(connection.exec_driver_sql(REPLICA_LAG_SQL).scalar())
+        except sa.exc.SQLAlchemyError as e:
+            if self.healthy:
+                logger.warning(f"read replica unavailable: {e}")
+            self.healthy = False
+            self.lag = None
+            return
+
+        healthy = self.lag <= max_lag
+        if self.healthy and not healthy:
+            logger.warning(f"read replica is {self.lag} seconds behind")
+        self.healthy = healthy
+
+    async def dispose(self):
+        if self.sessionmaker._cached_engine is not None:
+            self.sessionmaker._cached_engine.dispose()
+        if "async_sessionmaker" in self.__dict__:
+            await self.async_sessionmaker.kw["bind"].dispose()
+
+
+class ReadDatabaseRouter:
+    def __init__(
+        self,
+        primary: ReadDatabase,
+        replicas: List[ReadDatabase],
+        strategy: str = "round_robin",
+        max_lag: float = 30,
+        check_interval: float = 10,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._counter = itertools.count()
+        self._checker_pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def get_database(self) -> ReadDatabase:
+        if not self.replicas:
+            return self.primary
+        self._start_checker()
+
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return self.primary
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.connections_in_use())
+        return healthy[next(self._counter) % len(healthy)]
+
+    def check_replicas(self):
+        for replica in self.replicas:
+            replica.check(self.max_lag)
+
+    def _start_checker(self):
+        # threads don't survive a fork so each worker starts its own
+        if self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+            threading.Thread(target=self._run_checker, daemon=True).start()
+
+    def _run_checker(self):
+        while not self._stopped.is_set():
+            self.check_replicas()
+            self._stopped.wait(self.check_interval)
+
+    async def dispose(self):
+        self._stopped.set()
+        for database in [self.primary, *self.replicas]:
+            await database.dispose()
+
+
+@lru_cache()
+def get_read_database_router() -> ReadDatabaseRouter:
+    settings = get_settings()
+    return ReadDatabaseRouter(
+        ReadDatabase(settings.READ_DATABASE_URL),
+        [ReadDatabase(url) for url in settings.READ_REPLICA_URLS],
+        strategy=settings.READ_REPLICA_STRATEGY,
+        max_lag=settings.READ_REPLICA_MAX_LAG,
+        check_interval=settings.READ_REPLICA_CHECK_INTERVAL,
+    )
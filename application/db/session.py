@@ -1,24 +1,64 @@
-from functools import lru_cache
-from typing import Iterator
+from typing import AsyncIterator, Iterator, Optional
 
-from fastapi_utils.session import FastAPISessionMaker
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from application.db.replicas import get_read_database_router
 from application.settings import get_settings
 
 
 # this can be used in fast api path functions using Depends to inject a db session
-def get_session() -> Iterator[Session]:
-    yield from _get_fastapi_sessionmaker().get_db()
+# the session is for one of the read replicas when there are any, see replicas.py
+def get_session(request: Request = None) -> Iterator[Session]:
+    database = get_read_database_router().get_database()
+    with database.sessionmaker.context_session() as session:
+        _apply_statement_timeout(session, request)
+        yield session
+
+
+# async equivalent of get_session for async path functions, queries are run
+# through asyncpg so waiting on the database doesn't hold a threadpool thread
+async def get_async_session(request: Request = None) -> AsyncIterator[AsyncSession]:
+    database = get_read_database_router().get_database()
+    async with database.async_sessionmaker() as session:
+        _apply_statement_timeout(session.sync_session, request)
+        yield session
 
 
 # this can be used in non path functions to create a context manager for a db session
 # see https://github.com/dmontagu/fastapi-utils/blob/master/fastapi_utils/session.py#L77:L91
 def get_context_session() -> Iterator[Session]:
-    return _get_fastapi_sessionmaker().context_session()
+    return get_read_database_router().primary.sessionmaker.context_session()
+
+
+def get_statement_timeout(path: str) -> Optional[int]:
+    """
+    Returns the statement timeout for requests to the path when it differs from
+    the default, the longest matching prefix in DB_STATEMENT_TIMEOUTS is used
+    """
+    timeouts = get_settings().DB_STATEMENT_TIMEOUTS
+    prefixes = [prefix for prefix in timeouts if path.startswith(prefix)]
+    if not prefixes:
+        return None
+    return timeouts[max(prefixes, key=len)]
+
+
+def _apply_statement_timeout(session: Session, request: Optional[Request]):
+    if request is None:
+        return
+    timeout = get_statement_timeout(request.url.path)
+    if timeout is None:
+        return
+
+    # set at the start of each transaction so it only lasts as long as it does
+    @event.listens_for(session, "after_begin")
+    def set_statement_timeout(session, transaction, connection):
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
 
 
-@lru_cache()
-def _get_fastapi_sessionmaker() -> FastAPISessionMaker:
-    database_uri = get_settings().READ_DATABASE_URL
-    return FastAPISessionMaker(database_uri)
+async def close_database_engines():
+    if get_read_database_router.cache_info().currsize:
+        await get_read_database_router().dispose()
+        get_read_database_router.cache_clear()
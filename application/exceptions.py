@@ -22,3 +22,8 @@ class TypologyValueNotFound(DigitalLandValidationError):
 class InvalidGeometry(DigitalLandValidationError):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+
+
+class QueryCostExceeded(Exception):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
@@ -1,8 +1,14 @@
+import hashlib
+import json
 import logging
+import re
 import sentry_sdk
 
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional, Tuple
 
+from sqlalchemy.exc import DBAPIError, TimeoutError as SQLAlchemyTimeoutError
 from sqlalchemy.orm import Session
 from fastapi import FastAPI, Request, status, Depends
 from fastapi.encoders import jsonable_encoder
@@ -13,15 +19,26 @@ from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import ValidationError
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.responses import Response
 from http import HTTPStatus
 
-from application.db.session import get_session
+from application.data_access.datasette_query_helpers import close_datasette_http
+from application.data_access.reference_data import (
+    get_dataset_versions,
+    get_last_updated,
+)
+from application.db.session import (
+    close_database_engines,
+    get_context_session,
+    get_session,
+)
+from application.core.filters import get_asset_manifest
 from application.core.templates import templates
 from application.db.models import EntityOrm
-from application.exceptions import DigitalLandValidationError
+from application.exceptions import DigitalLandValidationError, QueryCostExceeded
 from application.routers import (
     entity,
     dataset,
@@ -32,6 +49,7 @@ from application.routers import (
     guidance_,
     about_,
     osMapOAuth,
+    tiles,
 )
 from application.settings import get_settings
 
@@ -40,6 +58,16 @@ settings = get_settings()
 
 SECONDS_IN_TWO_YEARS = timedelta(days=365 * 2).total_seconds()
 
+# postgres error code for a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+# seconds clients are asked to wait before retrying a 503 or 504
+RETRY_AFTER = 30
+
+# json responses that only change when datasets are loaded
+CACHEABLE_PATH = re.compile(
+    r"^/(entity|dataset|organisation)(/[^/]+)?\.(json|geojson)$"
+)
+
 # Add markdown here
 description = """
 ## About this API
@@ -86,6 +114,7 @@ def create_app():
     )
     add_base_routes(app)
     add_routers(app)
+    add_events(app)
     add_static(app)
     app = add_middleware(app)
     return app
@@ -121,8 +150,6 @@ def add_base_routes(app):
     def invalid_geometries(session: Session = Depends(get_session)):
         from application.core.models import entity_factory
         from sqlalchemy import func
-        from sqlalchemy import and_
-        from sqlalchemy import not_
 
         try:
             query_args = [
@@ -130,12 +157,7 @@ def add_base_routes(app):
                 func.ST_IsValidReason(EntityOrm.geometry).label("invalid_reason"),
             ]
             query = session.query(*query_args)
-            query = query.filter(
-                and_(
-                    EntityOrm.geometry.is_not(None),
-                    not_(func.ST_IsValid(EntityOrm.geometry)),
-                )
-            )
+            query = query.filter(EntityOrm.geometry_is_valid.is_(False))
             entities = query.all()
             return [
                 {
@@ -248,6 +270,35 @@ def add_base_routes(app):
                 "404.html", {"request": request}, status_code=404
             )
 
+    @app.exception_handler(SQLAlchemyTimeoutError)
+    async def pool_timeout_exception_handler(
+        request: Request, exc: SQLAlchemyTimeoutError
+    ):
+        logger.warning(f"timed out waiting for a database connection: {exc}")
+        return _unavailable_response(
+            request, status.HTTP_503_SERVICE_UNAVAILABLE, "Service busy"
+        )
+
+    @app.exception_handler(QueryCostExceeded)
+    async def query_cost_exception_handler(request: Request, exc: QueryCostExceeded):
+        logger.warning(f"{exc}: {request.url}")
+        return _unavailable_response(
+            request,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Query too expensive, try narrowing the search",
+        )
+
+    @app.exception_handler(DBAPIError)
+    async def statement_timeout_exception_handler(request: Request, exc: DBAPIError):
+        if getattr(exc.orig, "pgcode", None) != QUERY_CANCELED:
+            return templates.TemplateResponse(
+                "500.html", {"request": request}, status_code=500
+            )
+        logger.warning(f"statement timeout: {request.url}")
+        return _unavailable_response(
+            request, status.HTTP_504_GATEWAY_TIMEOUT, "Query timed out"
+        )
+
     # catch all handler - for any unhandled exceptions return 500 template
     @app.exception_handler(Exception)
     async def custom_catch_all_exception_handler(request: Request, exc: Exception):
@@ -256,6 +307,17 @@ def add_base_routes(app):
         )
 
 
+def _unavailable_response(request: Request, status_code: int, detail: str):
+    headers = {"Retry-After": str(RETRY_AFTER)}
+    if request.path_params.get("extension") is not None:
+        return JSONResponse(
+            status_code=status_code, content={"detail": detail}, headers=headers
+        )
+    return templates.TemplateResponse(
+        "500.html", {"request": request}, status_code=status_code, headers=headers
+    )
+
+
 def add_routers(app):
     app.include_router(entity.router, prefix="/entity")
     app.include_router(dataset.router, prefix="/dataset")
@@ -267,19 +329,100 @@ def add_routers(app):
     # not added to /docs
     app.include_router(osMapOAuth.router, prefix="/os", include_in_schema=False)
     app.include_router(map_.router, prefix="/map", include_in_schema=False)
+    app.include_router(tiles.router, prefix="/tiles", include_in_schema=False)
     app.include_router(guidance_.router, prefix="/guidance", include_in_schema=False)
     app.include_router(about_.router, prefix="/about", include_in_schema=False)
 
 
+def add_events(app):
+    @app.on_event("shutdown")
+    async def close_http_clients():
+        await close_datasette_http()
+
+    @app.on_event("shutdown")
+    async def close_database_connections():
+        await close_database_engines()
+
+
 def add_static(app):
     app.mount(
         "/static",
         StaticFiles(directory="static"),
         name="static",
     )
+    # built before the workers are forked when the app is preloaded
+    get_asset_manifest()
+
+
+def _get_cache_validators(request: Request) -> Tuple[str, Optional[date]]:
+    """
+    Returns a strong ETag and the last modified date for the response to the
+    request. The ETag is a hash of the request and the versions of the datasets
+    it's for, all of them unless dataset parameters are given, along with the
+    release so it changes whenever either the data or the code does
+    """
+    with get_context_session() as session:
+        versions = get_dataset_versions(session)
+        last_updated = get_last_updated(session)
+
+    datasets = request.query_params.getlist("dataset")
+    if datasets:
+        versions = {dataset: versions.get(dataset) for dataset in datasets}
+
+    key = json.dumps(
+        [
+            settings.RELEASE_TAG,
+            request.url.path,
+            request.url.query,
+            sorted(versions.items()),
+        ]
+    )
+    etag = f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+    return etag, last_updated
+
+
+def _is_not_modified(request: Request, etag: str) -> bool:
+    # every response given validators has an ETag so If-Modified-Since is
+    # ignored, see RFC 7232 section 3.3. Last-Modified is a date so it doesn't
+    # change for data loaded later the same day
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _to_datetime(d: date) -> datetime:
+    return datetime.combine(d, time.min, tzinfo=timezone.utc)
 
 
 def add_middleware(app):
+    # added first so it sits inside the CORS middleware and 304s get CORS headers
+    @app.middleware("http")
+    async def add_cache_validators(request: Request, call_next):
+        if request.method not in ["GET", "HEAD"] or not CACHEABLE_PATH.match(
+            request.url.path
+        ):
+            return await call_next(request)
+
+        etag, last_modified = await run_in_threadpool(_get_cache_validators, request)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={settings.HTTP_CACHE_MAX_AGE}",
+        }
+        if last_modified is not None:
+            headers["Last-Modified"] = format_datetime(
+                _to_datetime(last_modified), usegmt=True
+            )
+
+        if _is_not_modified(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = await call_next(request)
+        if response.status_code == status.HTTP_200_OK:
+            response.headers.update(headers)
+        return response
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -1,6 +1,7 @@
 import os
 import logging
 from fastapi import APIRouter, Request
+from application.core.page_cache import cached_page
 from application.core.templates import templates
 
 router = APIRouter()
@@ -67,6 +68,7 @@ def get_breadcrumbs(path):
 
 
 @router.get("/{url_path:path}")
+@cached_page(data_version=False)
 async def catch_all(request: Request, url_path: str):
     index_file = "index"
 
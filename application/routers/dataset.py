@@ -14,6 +14,7 @@ from application.data_access.digital_land_queries import (
 
 from pydantic import Required
 from application.data_access.entity_queries import get_entity_count, get_entity_search
+from application.core.page_cache import cached_page
 from application.core.templates import templates
 from application.core.utils import DigitalLandJSONResponse
 from application.search.enum import SuffixDataset
@@ -36,6 +37,7 @@ def get_datasets_by_typology(datasets):
     return typologies
 
 
+@cached_page()
 def list_datasets(
     request: Request,
     extension: Optional[SuffixDataset] = None,
@@ -1,34 +1,47 @@
+import csv
+import io
+import json
 import logging
 
 from dataclasses import asdict
-from typing import Optional, List, Set, Dict, Union
+from typing import Optional, List, Set, Dict, Iterator, Union
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Path
 from pydantic import Required
 from pydantic.error_wrappers import ErrorWrapper
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.exceptions import RequestValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from application.core.models import GeoJSON, EntityModel
-from application.data_access.digital_land_queries import (
+from application.core.models import GeoJSON, EntityModel, to_kebab
+from application.data_access.reference_data import (
+    get_dataset_names,
+    get_dataset_query,
     get_datasets,
     get_local_authorities,
     get_typologies_with_entities,
-    get_dataset_query,
     get_typology_names,
 )
 from application.data_access.entity_queries import (
-    get_entity_query,
-    get_entity_search,
-    lookup_entity_link,
+    get_entity_links,
+    get_entity_query_async,
+    get_entity_search_async,
+    get_entity_search_stream,
 )
-from application.data_access.dataset_queries import get_dataset_names
+from application.data_access.facet_queries import get_entity_facets_async
 
-from application.search.enum import SuffixEntity
+from application.search.enum import SuffixEntity, SuffixEntityExport
 from application.search.filters import QueryFilters
 from application.core.templates import templates
 from application.core.utils import (
     DigitalLandJSONResponse,
+    NoneToEmptyStringEncoder,
     to_snake,
     entity_attribute_sort_key,
     make_links,
@@ -37,7 +50,8 @@ from application.exceptions import (
     DatasetValueNotFound,
     TypologyValueNotFound,
 )
-from application.db.session import get_session
+from application.db.session import get_async_session, get_session
+from application.settings import get_settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -60,7 +74,7 @@ def _get_geojson(
 
 
 def _get_entity_json(
-    data: List[EntityModel],
+    data: List[Union[EntityModel, dict]],
     include: Optional[Set] = None,
     exclude: Optional[List[str]] = None,
 ):
@@ -69,15 +83,144 @@ def _get_entity_json(
         if include is not None:
             # always return at least the entity (id)
             include.add("entity")
-            e = entity.dict(include=include, by_alias=True)
+            if isinstance(entity, dict):
+                # already rendered from the row, see entity_json
+                e = {k: v for k, v in entity.items() if to_snake(k) in include}
+            else:
+                e = entity.dict(include=include, by_alias=True)
         else:
             exclude = set(exclude) if exclude else set()
             exclude.add("geojson")  # Always exclude 'geojson'
-            e = entity.dict(exclude=exclude, by_alias=True)
+            if isinstance(entity, dict):
+                e = {k: v for k, v in entity.items() if to_snake(k) not in exclude}
+            else:
+                e = entity.dict(exclude=exclude, by_alias=True)
         entities.append(e)
     return entities
 
 
+def _to_json_text(data) -> str:
+    return json.dumps(
+        data,
+        default=str,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        cls=NoneToEmptyStringEncoder,
+    )
+
+
+def _get_geojson_feature_text(
+    entity: EntityModel, exclude: Optional[Set] = None
+) -> Optional[str]:
+    # the stored geometry is written out as it is rather than being parsed and
+    # serialised again, the entity needs to have been loaded with raw_geojson
+    if entity.geojson_text is None:
+        return None
+    exclude = set(exclude) if exclude else set()
+    exclude.update(["geojson", "geometry", "point"])
+    properties = entity.dict(exclude=exclude, by_alias=True)
+    return (
+        '{"geometry":'
+        + entity.geojson_text
+        + ',"type":"Feature","properties":'
+        + _to_json_text(properties)
+        + "}"
+    )
+
+
+def _get_geojson_text(
+    data: List[EntityModel], links: dict, exclude: Optional[Set] = None
+) -> str:
+    features = [_get_geojson_feature_text(entity, exclude) for entity in data]
+    return (
+        '{"type":"FeatureCollection","features":['
+        + ",".join(feature for feature in features if feature is not None)
+        + '],"links":'
+        + _to_json_text(links)
+        + "}"
+    )
+
+
+def _stream_ndjson(
+    entities: Iterator[EntityModel],
+    include: Optional[Set] = None,
+    exclude: Optional[Set] = None,
+) -> Iterator[str]:
+    for entity in entities:
+        e = _get_entity_json([entity], include=include, exclude=exclude)[0]
+        yield _to_json_text(e) + "\n"
+
+
+def _stream_geojson_sequence(
+    entities: Iterator[EntityModel],
+    exclude: Optional[Set] = None,
+    raw_geojson: bool = False,
+) -> Iterator[str]:
+    # RFC 8142, each feature is prefixed with a record separator
+    for entity in entities:
+        if raw_geojson:
+            feature = _get_geojson_feature_text(entity, exclude)
+            if feature is not None:
+                yield "\x1e" + feature + "\n"
+        else:
+            for feature in _get_geojson([entity], exclude=exclude)["features"]:
+                yield "\x1e" + _to_json_text(feature.dict()) + "\n"
+
+
+def _stream_csv(
+    entities: Iterator[EntityModel],
+    include: Optional[Set] = None,
+    exclude: Optional[Set] = None,
+) -> Iterator[str]:
+    # fields held in the json column vary between datasets so unless they have
+    # been asked for by name they're gathered into a single json column
+    if include is not None:
+        columns = ["entity"] + [
+            to_kebab(field) for field in sorted(include) if field != "entity"
+        ]
+    else:
+        excluded = set(exclude) if exclude else set()
+        excluded.add("geojson")
+        columns = [
+            field.alias
+            for field in EntityModel.__fields__.values()
+            if field.name not in excluded
+        ]
+        columns.append("json")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for entity in entities:
+        e = _get_entity_json([entity], include=include, exclude=exclude)[0]
+        if include is None:
+            extra = {k: v for k, v in e.items() if k not in columns}
+            e["json"] = _to_json_text(extra) if extra else None
+        writer.writerow([e.get(column) for column in columns])
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def _get_field_selection(params: dict):
+    """
+    Returns the include and exclude sets for the field and exclude_field
+    parameters, field takes priority over exclude_field
+    """
+    if params.get("field"):
+        return set([to_snake(field) for field in params["field"]]), None
+    if params.get("exclude_field"):
+        return None, set(
+            [
+                to_snake(field.strip())
+                for field in ",".join(params["exclude_field"]).split(",")
+            ]
+        )
+    return None, None
+
+
 def handle_gone_entity(
     request: Request, entity: int, extension: Optional[SuffixEntity]
 ):
@@ -109,8 +252,50 @@ def prepare_geojson(e):
     return geojson
 
 
+def get_entity_page_data(session: Session, e: EntityModel) -> dict:
+    """
+    Loads what the entity page shows besides the entity itself, the datasets
+    and the linked entities, kept apart from the rendering so only the queries
+    run on the session
+    """
+    e_dict = e.dict(by_alias=True, exclude={"geojson"})
+
+    # the fields which have linked datasets and the entity's own dataset come
+    # from the list of every dataset, cached and shared with the search page,
+    # rather than a lookup for each entity's fields
+    datasets = {dataset.dataset: dataset for dataset in get_datasets(session)}
+    dataset_fields = sorted(field for field in e_dict if field in datasets)
+
+    # specification datasets aren't in the list
+    dataset = datasets.get(e.dataset) or get_dataset_query(session, e.dataset)
+
+    entityLinkFields = [
+        "article-4-direction",
+        "permitted-development-rights",
+        "tree-preservation-order",
+    ]
+
+    # resolve the organisation and any linked entities together rather than
+    # querying for each of them
+    organisation_entity, linked_entities = get_entity_links(
+        session,
+        {field: e_dict[field] for field in entityLinkFields if field in e_dict},
+        e.organisation_entity,
+    )
+
+    return {
+        "dataset_fields": dataset_fields,
+        "dataset": dataset,
+        "organisation_entity": organisation_entity,
+        "linked_entities": linked_entities,
+    }
+
+
 def handle_entity_response(
-    request: Request, e, extension: Optional[SuffixEntity], session: Session
+    request: Request,
+    e,
+    extension: Optional[SuffixEntity],
+    page_data: Optional[dict] = None,
 ):
     if extension is not None and extension.value == "json":
         return e.dict(by_alias=True, exclude={"geojson"})
@@ -138,40 +323,12 @@ def handle_entity_response(
     #     fields = [field.dict(by_alias=True) for field in fields]
     #     fields = {field["field"]: field for field in fields}
 
-    # get dictionary of fields which have linked datasets
-    dataset_fields = get_datasets(session, datasets=e_dict_sorted.keys())
-    dataset_fields = [
-        dataset_field.dict(by_alias=True) for dataset_field in dataset_fields
-    ]
-    dataset_fields = [dataset_field["dataset"] for dataset_field in dataset_fields]
-
-    dataset = get_dataset_query(session, e.dataset)
-    organisation_entity, _, _ = get_entity_query(session, e.organisation_entity)
-
-    entityLinkFields = [
-        "article-4-direction",
-        "permitted-development-rights",
-        "tree-preservation-order",
-    ]
-
-    linked_entities = {}
-
-    # for each entityLinkField, if that key exists in the entity dict, then
-    # lookup the entity and add it to the linked_entities dict
-    for field in entityLinkFields:
-        if field in e_dict_sorted:
-            linked_entity = lookup_entity_link(
-                session, e_dict_sorted[field], field, e_dict_sorted["dataset"]
-            )
-            if linked_entity is not None:
-                linked_entities[field] = linked_entity
-
     return templates.TemplateResponse(
         "entity.html",
         {
             "request": request,
             "row": e_dict_sorted,
-            "linked_entities": linked_entities,
+            "linked_entities": page_data["linked_entities"],
             "entity": e,
             "pipeline_name": e.dataset,
             "references": [],
@@ -182,27 +339,34 @@ def handle_entity_response(
             "geojson_features": e.geojson if e.geojson is not None else None,
             "geojson": geojson.dict() if geojson else None,
             "fields": fields,
-            "dataset_fields": dataset_fields,
-            "dataset": dataset,
-            "organisation_entity": organisation_entity,
+            "dataset_fields": page_data["dataset_fields"],
+            "dataset": page_data["dataset"],
+            "organisation_entity": page_data["organisation_entity"],
         },
     )
 
 
-def get_entity(
+async def get_entity(
     request: Request,
     entity: int = Path(default=Required, description="Entity id"),
     extension: Optional[SuffixEntity] = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    e, old_entity_status, new_entity_id = get_entity_query(session, entity)
+    e, old_entity_status, new_entity_id = await get_entity_query_async(session, entity)
 
     if old_entity_status == 410:
         return handle_gone_entity(request, entity, extension)
     elif old_entity_status == 301:
         return handle_moved_entity(entity, new_entity_id, extension)
     elif e is not None:
-        return handle_entity_response(request, e, extension, session)
+        page_data = None
+        if extension is None or extension.value == "html":
+            page_data = await session.run_sync(get_entity_page_data, e)
+        # the page is rendered on a worker thread, run_sync would keep it on
+        # the event loop and hold up every other request while it rendered
+        return await run_in_threadpool(
+            handle_entity_response, request, e, extension, page_data
+        )
     else:
         raise HTTPException(status_code=404, detail="entity not found")
 
@@ -253,24 +417,56 @@ def validate_typologies(typologies, typology_names):
     return
 
 
-def search_entities(
+def get_search_reference_data(session: Session, html: bool) -> dict:
+    """
+    Looks up the reference data the search needs, the names used to validate
+    the parameters and for the html page the facets. They're mostly served from
+    the reference data cache so are fetched in one go rather than each one
+    making its own trip through run_sync
+    """
+    data = {
+        "dataset_names": get_dataset_names(session),
+        "typology_names": get_typology_names(session),
+    }
+    if html:
+        data["typologies"] = get_typologies_with_entities(session)
+        data["datasets"] = get_datasets(session)
+        data["local_authorities"] = get_local_authorities(session, "local-authority")
+    return data
+
+
+async def search_entities(
     request: Request,
     query_filters: QueryFilters = Depends(),
     extension: Optional[SuffixEntity] = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     # get query_filters as a dict
     query_params = asdict(query_filters)
-    # TODO minimse queries by using normal queries below rather than returning the names
-    # queries required for additional validations
-    dataset_names = get_dataset_names(session)
-    typology_names = get_typology_names(session)
+    is_html = extension is None or extension.value == "html"
+    reference_data = await session.run_sync(get_search_reference_data, is_html)
 
     # additional validations
-    validate_dataset(query_params.get("dataset", None), dataset_names)
-    validate_typologies(query_params.get("typology", None), typology_names)
-    # Run entity query
-    data = get_entity_search(session, query_params)
+    validate_dataset(query_params.get("dataset", None), reference_data["dataset_names"])
+    validate_typologies(
+        query_params.get("typology", None), reference_data["typology_names"]
+    )
+    # Run entity query, json only includes the geojson when it's asked for
+    load_geojson = True
+    raw_geojson = False
+    if extension is not None and extension.value == "json":
+        fields = query_params.get("field") or []
+        load_geojson = "geojson" in [to_snake(field) for field in fields]
+    elif extension is not None and extension.value == "geojson":
+        raw_geojson = get_settings().RAW_GEOJSON
+    # json is rendered straight from the rows, skipping the models
+    data = await get_entity_search_async(
+        session,
+        query_params,
+        load_geojson=load_geojson,
+        raw_geojson=raw_geojson,
+        as_json=extension is not None and extension.value == "json",
+    )
 
     # the query does some normalisation to remove empty
     # params and they get returned from search
@@ -295,7 +491,12 @@ def search_entities(
             entities = _get_entity_json(data["entities"], exclude=exclude_fields)
         else:
             entities = _get_entity_json(data["entities"])
-        return {"entities": entities, "links": links, "count": data["count"]}
+        response = {"entities": entities, "links": links, "count": data["count"]}
+        if params.get("facet") is not None:
+            response["facets"] = await get_entity_facets_async(
+                session, query_params, params["facet"]
+            )
+        return response
 
     if extension is not None and extension.value == "geojson":
         if params.get("exclude_field") is not None:
@@ -305,21 +506,25 @@ def search_entities(
                     for field in ",".join(params.get("exclude_field")).split(",")
                 ]
             )
-            geojson = _get_geojson(data["entities"], exclude=exclude_fields)
         else:
-            geojson = _get_geojson(data["entities"])
+            exclude_fields = None
+        if raw_geojson:
+            return Response(
+                _get_geojson_text(data["entities"], links, exclude=exclude_fields),
+                media_type=DigitalLandJSONResponse.media_type,
+            )
+        geojson = _get_geojson(data["entities"], exclude=exclude_fields)
         geojson["links"] = links
         return geojson
 
-    typologies = get_typologies_with_entities(session)
-    typologies = [t.dict() for t in typologies]
+    typologies = [t.dict() for t in reference_data["typologies"]]
     # dataset facet
-    response = get_datasets(session)
     columns = ["dataset", "name", "plural", "typology", "themes", "paint_options"]
-    datasets = [dataset.dict(include=set(columns)) for dataset in response]
+    datasets = [
+        dataset.dict(include=set(columns)) for dataset in reference_data["datasets"]
+    ]
 
-    local_authorities = get_local_authorities(session, "local-authority")
-    local_authorities = [la.dict() for la in local_authorities]
+    local_authorities = [la.dict() for la in reference_data["local_authorities"]]
 
     if links.get("prev") is not None:
         prev_url = links["prev"]
@@ -332,7 +537,9 @@ def search_entities(
         next_url = None
     # default is HTML
     has_geographies = any((e.typology == "geography" for e in data["entities"]))
-    return templates.TemplateResponse(
+    # rendered on a worker thread so the event loop isn't held up, as for entities
+    return await run_in_threadpool(
+        templates.TemplateResponse,
         "search.html",
         {
             "request": request,
@@ -364,6 +571,45 @@ def search_entities(
     )
 
 
+def export_entities(
+    extension: SuffixEntityExport,
+    query_filters: QueryFilters = Depends(),
+    session: Session = Depends(get_session),
+):
+    query_params = asdict(query_filters)
+    dataset_names = get_dataset_names(session)
+    typology_names = get_typology_names(session)
+
+    validate_dataset(query_params.get("dataset", None), dataset_names)
+    validate_typologies(query_params.get("typology", None), typology_names)
+
+    include, exclude = _get_field_selection(query_params)
+    is_geojson = extension == SuffixEntityExport.geojsonseq
+    raw_geojson = is_geojson and get_settings().RAW_GEOJSON
+    entities = get_entity_search_stream(
+        session,
+        query_params,
+        load_geojson=is_geojson or (include is not None and "geojson" in include),
+        raw_geojson=raw_geojson,
+        # ndjson and csv rows are rendered straight from the rows
+        as_json=not is_geojson,
+    )
+
+    if extension == SuffixEntityExport.ndjson:
+        content = _stream_ndjson(entities, include=include, exclude=exclude)
+        media_type = "application/x-ndjson"
+    elif is_geojson:
+        content = _stream_geojson_sequence(
+            entities, exclude=exclude, raw_geojson=raw_geojson
+        )
+        media_type = "application/geo+json-seq"
+    else:
+        content = _stream_csv(entities, include=include, exclude=exclude)
+        media_type = "text/csv"
+
+    return StreamingResponse(content, media_type=media_type)
+
+
 # Route ordering in important. Match routes with extensions first
 router.add_api_route(
     ".{extension}",
@@ -389,6 +635,14 @@ router.add_api_route(
     include_in_schema=False,
 )
 
+router.add_api_route(
+    "/export.{extension}",
+    endpoint=export_entities,
+    response_class=StreamingResponse,
+    tags=["Search entity"],
+    summary="This endpoint streams every entity matching the specified parameters, without a limit, as newline delimited JSON, a GeoJSON text sequence or CSV.",  # noqa: E501
+)
+
 router.add_api_route(
     "/{entity}.{extension}",
     get_entity,
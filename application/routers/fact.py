@@ -1,9 +1,11 @@
+import asyncio
 import logging
 import json
 
 from typing import Optional
 from dataclasses import asdict
 from urllib.parse import urlencode
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from fastapi import APIRouter, HTTPException, Request, Depends
@@ -14,12 +16,18 @@ from application.search.filters import (
     FactQueryFilters,
 )
 
-from application.db.session import get_session
-from application.data_access.entity_queries import get_entity_query
+from application.db.session import get_async_session
+from application.data_access.entity_queries import (
+    get_entity_query,
+    get_entity_query_async,
+)
 from application.data_access.fact_queries import (
-    get_fact_query,
-    get_search_facts_query,
-    get_dataset_fields,
+    get_fact_by_id,
+    get_fact_fields,
+    get_fact_query_async,
+    get_facts_for_entity,
+    get_search_facts_query_async,
+    get_dataset_fields_async,
 )
 
 from application.search.enum import SuffixEntity
@@ -27,6 +35,7 @@ from application.core.templates import templates
 from application.core.utils import (
     DigitalLandJSONResponse,
 )
+from application.settings import get_settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -49,15 +58,21 @@ def _convert_model_to_dict(models):
         return models.dict(by_alias=True)
 
 
-def get_fact(
+async def get_fact(
     request: Request,
     path_params: FactPathParams = Depends(),
     query_filters: FactDatasetQueryFilters = Depends(),
     extension: Optional[SuffixEntity] = None,
+    session: AsyncSession = Depends(get_async_session),
 ):
     query_params = asdict(query_filters)
     path_params = asdict(path_params)
-    fact = get_fact_query(path_params["fact"], query_params["dataset"])
+    if get_settings().FACTS_FROM_POSTGRES:
+        fact = await session.run_sync(
+            get_fact_by_id, path_params["fact"], query_params["dataset"]
+        )
+    else:
+        fact = await get_fact_query_async(path_params["fact"], query_params["dataset"])
 
     if fact is not None:
         if extension is not None and extension.value == "json":
@@ -95,26 +110,72 @@ def get_fact(
         raise HTTPException(status_code=404, detail="fact not found")
 
 
-def search_facts(
+async def _with_deadline(awaitable, default=None):
+    # each datasette call gets its own deadline so one slow call can't hold up
+    # the page. Database queries aren't given one, cancelling them would leave
+    # the session's connection mid statement, they have the statement_timeout
+    deadline = get_settings().FACT_SEARCH_DEADLINE
+    try:
+        return await asyncio.wait_for(awaitable, deadline)
+    except asyncio.TimeoutError:
+        logger.warning(f"fact search call took longer than {deadline} seconds")
+        return default
+
+
+def _search_facts_in_postgres(session: Session, query_params: dict, details: bool):
+    facts = get_facts_for_entity(session, query_params["entity"], query_params["field"])
+    if not details:
+        return facts, None, (None, None, None)
+    dataset_fields = get_fact_fields(
+        session, query_params["dataset"], entity=query_params["entity"]
+    )
+    return facts, dataset_fields, get_entity_query(session, query_params["entity"])
+
+
+async def _search_facts(session: AsyncSession, query_params: dict, details: bool):
+    """
+    Returns the facts for the entity and, with details, the fields with facts
+    and the entity for the page. The calls don't depend on each other so they
+    are made at the same time and the page waits for the slowest of them
+    """
+    no_entity = (None, None, None)
+    if get_settings().FACTS_FROM_POSTGRES:
+        # a session can only run one query at a time
+        return await session.run_sync(_search_facts_in_postgres, query_params, details)
+
+    if not details:
+        facts = await _with_deadline(get_search_facts_query_async(query_params))
+        return facts, None, no_entity
+
+    return await asyncio.gather(
+        _with_deadline(get_search_facts_query_async(query_params)),
+        _with_deadline(
+            get_dataset_fields_async(
+                dataset=query_params["dataset"], entity=query_params["entity"]
+            )
+        ),
+        get_entity_query_async(session, query_params["entity"]),
+    )
+
+
+async def search_facts(
     request: Request,
     query_filters: FactQueryFilters = Depends(),
     extension: Optional[SuffixEntity] = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     query_params = asdict(query_filters)
-
-    facts = get_search_facts_query(query_params)
+    is_json = extension is not None and extension.value == "json"
+    facts, dataset_fields, (entity, _, _) = await _search_facts(
+        session, query_params, details=not is_json
+    )
 
     if facts is not None:
-        if extension is not None and extension.value == "json":
+        if is_json:
             return facts
 
         facts_dicts = _convert_model_to_dict(facts)
 
-        dataset_fields = get_dataset_fields(
-            dataset=query_params["dataset"], entity=query_params["entity"]
-        )
-
         dataset_fields_dicts = _convert_model_to_dict(dataset_fields)
 
         if dataset_fields_dicts is None or len(dataset_fields_dicts) == 0:
@@ -130,18 +191,14 @@ def search_facts(
             entity_name = facts_dicts[0]["entity-name"]
             entity_prefix = facts_dicts[0]["entity-prefix"]
             entity_reference = facts_dicts[0]["entity-reference"]
+        elif entity:
+            entity_name = entity.name
+            entity_prefix = entity.prefix
+            entity_reference = entity.reference
         else:
-            e, old_entity_status, new_entity_id = get_entity_query(
-                session, query_params["entity"]
-            )
-            if e:
-                entity_name = e.name
-                entity_prefix = e.prefix
-                entity_reference = e.reference
-            else:
-                entity_name = None
-                entity_prefix = None
-                entity_reference = None
+            entity_name = None
+            entity_prefix = None
+            entity_reference = None
 
         return templates.TemplateResponse(
             "fact-search.html",
@@ -161,7 +218,7 @@ def search_facts(
     else:
         logging.warning("facts cannot be retrieved")
 
-        if extension is not None and extension.value == "json":
+        if is_json:
             return []
         else:
             raise HTTPException(status_code=404, detail="fact not found")
@@ -2,6 +2,7 @@ import os
 import logging
 from fastapi import APIRouter, Request
 from starlette.responses import RedirectResponse
+from application.core.page_cache import cached_page
 from application.core.templates import templates
 
 router = APIRouter()
@@ -78,6 +79,7 @@ def handleGuidanceRedirects(url_path, redirects):
 
 
 @router.get("/{url_path:path}")
+@cached_page(data_version=False)
 async def catch_all(request: Request, url_path: str):
     index_file = "index"
 
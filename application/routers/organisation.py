@@ -8,6 +8,7 @@ from starlette.responses import HTMLResponse
 from sqlalchemy.orm import Session
 
 from application.core.models import OrganisationModel, OrganisationsByTypeModel
+from application.core.page_cache import cached_page
 from application.core.templates import templates
 from application.core.utils import DigitalLandJSONResponse
 from application.db.models import OrganisationOrm
@@ -31,6 +32,7 @@ display_names = {
 
 
 # TODO move data access to separate functions in data access folder
+@cached_page()
 def get_organisations(
     request: Request,
     extension: Optional[SuffixOrganisation] = None,
@@ -0,0 +1,44 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+from application.data_access.reference_data import get_dataset_versions
+from application.data_access.tile_queries import get_tile
+from application.db.session import get_session
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def get_dataset_tile(
+    dataset: str,
+    z: int = Path(..., description="Zoom level", ge=0, le=22),
+    x: int = Path(..., description="Tile column", ge=0),
+    y: int = Path(..., description="Tile row", ge=0),
+    session: Session = Depends(get_session),
+):
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(status_code=404, detail="tile not found")
+
+    # the versions are read again regularly so a load is seen, see reference_data
+    versions = get_dataset_versions(session)
+    if dataset not in versions:
+        raise HTTPException(status_code=404, detail="dataset not found")
+
+    tile = get_tile(session, dataset, versions[dataset], z, x, y)
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile")
+
+
+router.add_api_route(
+    "/{dataset}/{z}/{x}/{y}.mvt",
+    endpoint=get_dataset_tile,
+    response_class=Response,
+    responses={
+        200: {
+            "content": {"application/vnd.mapbox-vector-tile": {}},
+            "description": "Mapbox vector tile of the entities in the dataset",
+        }
+    },
+)
@@ -11,6 +11,12 @@ class SuffixEntity(str, Enum):
     geojson = "geojson"
 
 
+class SuffixEntityExport(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+    geojsonseq = "geojsonseq"
+
+
 class SuffixDataset(str, Enum):
     json = "json"
     html = "html"
@@ -48,8 +54,29 @@ class PeriodOption(str, Enum):
     historical = "historical"
 
 
+class CountOption(str, Enum):
+    exact = "exact"  # our default
+    estimated = "estimated"
+    none = "none"
+
+
+# how far geometries are simplified, from low for detailed local maps to high
+# for country wide views, see EntityOrm for the tolerances
+class SimplifyOption(str, Enum):
+    low = "low"
+    medium = "medium"
+    high = "high"
+
+
 class DateOption(str, Enum):
     match = "match"
     before = "before"
     since = "since"
     empty = "empty"
+
+
+# entity fields the search results can be counted by, see facet_queries.py
+class FacetOption(str, Enum):
+    dataset = "dataset"
+    typology = "typology"
+    organisation_entity = "organisation_entity"
@@ -4,16 +4,18 @@ from typing import Optional, List
 from fastapi import Query, Header
 from pydantic import validator
 from pydantic.dataclasses import dataclass
-from sqlalchemy import text
 
-from application.db.session import get_context_session
+from application.data_access.entity_query_helpers import get_geometry
 from application.exceptions import (
     InvalidGeometry,
 )
 from application.search.enum import (
     PeriodOption,
     DateOption,
+    FacetOption,
+    CountOption,
     GeometryRelation,
+    SimplifyOption,
     SuffixEntity,
 )
 from application.search.custom_data_types import FormInt
@@ -195,12 +197,31 @@ class QueryFilters:
     geometry_relation: Optional[GeometryRelation] = Query(
         None, description="DE-9IM spatial relationship, default is 'within'"
     )
+    simplify: Optional[SimplifyOption] = Query(
+        None,
+        description="""
+        Return simplified geometries rather than the full resolution ones, low, medium
+        or high simplification suit local, regional and national scale maps respectively""",
+    )
 
     # pagination filters
     limit: Optional[int] = Query(
         10, description="limit for the number of results", ge=1, le=500
     )
     offset: Optional[int] = Query(None, description="paginate results from this entity")
+    after_entity: Optional[int] = Query(
+        None,
+        description="""
+        Paginate results from the entity after this entity number. Use in place of offset
+        to page through large result sets, offset is ignored when this is provided""",
+        ge=1,
+    )
+    count: Optional[CountOption] = Query(
+        None,
+        description="""
+        How the total number of results is calculated, either exact, estimated by the
+        query planner, or none to skip counting altogether. Default is 'exact'""",
+    )
 
     # response format filters
     accept: Optional[str] = Header(
@@ -217,6 +238,12 @@ class QueryFilters:
         None,
         description="field parameter will take over any fields specified in the exclude_field parameter",
     )
+    facet: Optional[List[FacetOption]] = Query(
+        None,
+        description="""
+        Count the matching entities by dataset, typology or organisation_entity,
+        the counts are returned in a facets block in json responses""",
+    )
 
     # validators
     _validate_entry_date_year = validator("entry_date_year", allow_reuse=True)(
@@ -259,19 +286,15 @@ class QueryFilters:
         validate_curies
     )
 
-    # TODO Replace with a solution that doesn't need a database?
     @validator("geometry", pre=True)
     def validate_geometry(cls, v: Optional[list]):
         if not v:
             return v
-        with get_context_session() as session:
-            for geometry in v:
-                try:
-                    stmt = text("SELECT ST_IsValid(:geometry);")
-                    stmt = stmt.bindparams(geometry=geometry)
-                    session.execute(stmt)
-                except Exception:
-                    raise InvalidGeometry(f"Invalid geometry {geometry}")
+        for geometry in v:
+            try:
+                get_geometry(geometry)
+            except Exception:
+                raise InvalidGeometry(f"Invalid geometry {geometry}")
         return v
 
 
@@ -1,12 +1,14 @@
 import re
 from typing import Optional, List
 
-from application.data_access.dataset_queries import get_dataset_names
+from application.data_access.reference_data import get_dataset_names
+from application.db.session import get_context_session
 from application.exceptions import DatasetValueNotFound, DigitalLandValidationError
 
 
 def validate_dataset_name(dataset):
-    dataset_names = get_dataset_names()
+    with get_context_session() as session:
+        dataset_names = get_dataset_names(session)
     if dataset not in dataset_names:
         raise DatasetValueNotFound(
             f"Requested dataset does not exist: {dataset}. "
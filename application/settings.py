@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseSettings, PostgresDsn, HttpUrl
@@ -11,16 +11,71 @@ load_dotenv()
 class Settings(BaseSettings):
     WRITE_DATABASE_URL: PostgresDsn
     READ_DATABASE_URL: PostgresDsn
+    # reads are spread across the healthy replicas, READ_DATABASE_URL is used
+    # when there are none. Replicas more than READ_REPLICA_MAX_LAG seconds
+    # behind are left out, they're checked every READ_REPLICA_CHECK_INTERVAL
+    READ_REPLICA_URLS: List[PostgresDsn] = []
+    READ_REPLICA_STRATEGY: Literal["round_robin", "least_connections"] = "round_robin"
+    READ_REPLICA_MAX_LAG: float = 30
+    READ_REPLICA_CHECK_INTERVAL: float = 10
     SENTRY_DSN: Optional[str] = None
     SENTRY_TRACE_SAMPLE_RATE: Optional[float] = 0.01
     RELEASE_TAG: Optional[str] = None
     ENVIRONMENT: str
     DATASETTE_URL: HttpUrl
     DATASETTE_TILES_URL: Optional[HttpUrl]
+    DATASETTE_POOL_SIZE: int = 10
+    DATASETTE_TIMEOUT: float = 10.0
+    DATASETTE_RETRIES: int = 3
+    DATASETTE_RETRY_BACKOFF: float = 0
+    # number of datasette query results kept in memory and for how many seconds
+    DATASETTE_CACHE_SIZE: int = 1024
+    DATASETTE_CACHE_TTL: int = 300
     DATA_FILE_URL: HttpUrl
+    # serve /fact from the fact tables in postgres, see application/db/load_facts.py,
+    # rather than datasette
+    FACTS_FROM_POSTGRES: bool = True
+    # seconds each datasette call for the fact search page has before it's abandoned
+    FACT_SEARCH_DEADLINE: float = 10
     GA_MEASUREMENT_ID: Optional[str] = None
     OS_CLIENT_KEY: Optional[str] = None
     OS_CLIENT_SECRET: Optional[str] = None
+    # number of reference table lookups kept in memory and for how many seconds,
+    # they're dropped sooner when the dataset versions, read again every
+    # REFERENCE_DATA_VERSION_CHECK_INTERVAL seconds, change
+    REFERENCE_DATA_CACHE_SIZE: int = 512
+    REFERENCE_DATA_CACHE_TTL: int = 300
+    REFERENCE_DATA_VERSION_CHECK_INTERVAL: int = 10
+    # read database connection pool, DB_POOL_TIMEOUT is how many seconds a
+    # request waits for a connection before a 503 is returned
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = True
+    # statement timeouts in milliseconds, queries running longer are cancelled
+    # and a 504 returned. DB_STATEMENT_TIMEOUTS overrides the default for paths
+    # starting with the key, e.g. {"/entity": 10000}, 0 is no timeout
+    DB_STATEMENT_TIMEOUT: int = 30000
+    DB_STATEMENT_TIMEOUTS: Dict[str, int] = {}
+    # searches the query planner estimates will cost more than this get a 503
+    DB_QUERY_COST_LIMIT: Optional[float] = None
+    # max-age sent with responses that carry an ETag
+    HTTP_CACHE_MAX_AGE: int = 300
+    # rendered html pages are cached in this directory when it's set
+    PAGE_CACHE_DIR: Optional[str] = None
+    PAGE_CACHE_SIZE: int = 1000
+    # hash assets again when they change, for local development
+    WATCH_ASSETS: bool = False
+    # number of rendered markdown documents kept in memory
+    MARKDOWN_CACHE_SIZE: int = 512
+    # number of search facet counts kept in memory and for how many seconds
+    FACET_CACHE_SIZE: int = 256
+    FACET_CACHE_TTL: int = 300
+    # number of vector tiles kept in memory, 0 disables the cache
+    TILE_CACHE_SIZE: int = 2048
+    # write the stored geojson into geojson responses as is, without parsing it
+    RAW_GEOJSON: bool = False
 
 
 @lru_cache()
@@ -0,0 +1,84 @@
+"""
+Rows per second turning entity rows into the dicts JSON responses are
+rendered from, for a page of entities that have json fields:
+
+    python -m benchmarks.entity_json [rows]
+
+before builds a model class per row as entity_factory used to, models uses
+the cached extended models and entity_json skips pydantic altogether.
+"""
+import sys
+import timeit
+
+from datetime import date
+from typing import Any
+
+from geoalchemy2.elements import WKTElement
+from pydantic import create_model
+
+from application.core.models import EntityModel, entity_factory, entity_json
+from application.core.utils import to_snake
+from application.db.models import EntityOrm
+
+
+def make_rows(count: int):
+    return [
+        EntityOrm(
+            entity=44000000 + i,
+            name=f"Conservation area {i}",
+            dataset="conservation-area",
+            typology="geography",
+            reference=f"CA{i}",
+            prefix="conservation-area",
+            organisation_entity=600001,
+            entry_date=date(2022, 3, 23),
+            geometry=WKTElement(
+                "MULTIPOLYGON(((-0.1 51.5, -0.09 51.5, -0.09 51.51, -0.1 51.5)))",
+                srid=4326,
+            ),
+            point=WKTElement("POINT(-0.095 51.505)", srid=4326),
+            json={
+                "documentation-url": "https://example.com/conservation-areas",
+                "designation-date": "1969-01-01",
+                "notes": "",
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def before(entity_orm: EntityOrm) -> dict:
+    e = EntityModel.from_orm(entity_orm)
+    field_definitions = {to_snake(key): (Any, None) for key in entity_orm.json.keys()}
+    ExtendedEntityModel = create_model(
+        "ExtendedEntityModel", **field_definitions, __base__=EntityModel
+    )
+    e = ExtendedEntityModel(**e.dict(by_alias=False), **entity_orm.json)
+    return e.dict(by_alias=True, exclude={"geojson"})
+
+
+def models(entity_orm: EntityOrm) -> dict:
+    return entity_factory(entity_orm).dict(by_alias=True, exclude={"geojson"})
+
+
+def fast_path(entity_orm: EntityOrm) -> dict:
+    e = entity_json(entity_orm)
+    e.pop("geojson")
+    return e
+
+
+def main(count: int = 500):
+    rows = make_rows(count)
+    for name, render in [
+        ("before", before),
+        ("models", models),
+        ("entity_json", fast_path),
+    ]:
+        seconds = min(
+            timeit.repeat(lambda: [render(row) for row in rows], number=1, repeat=5)
+        )
+        print(f"{name:12} {count / seconds:>10,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
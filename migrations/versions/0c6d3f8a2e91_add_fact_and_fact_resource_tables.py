@@ -0,0 +1,50 @@
+"""add fact and fact_resource tables
+
+Revision ID: 0c6d3f8a2e91
+Revises: e4a7c92b1d05
+Create Date: 2024-09-02 14:18:52.330417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0c6d3f8a2e91"
+down_revision = "e4a7c92b1d05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "fact",
+        sa.Column("fact", sa.Text(), nullable=False),
+        sa.Column("entity", sa.BIGINT(), nullable=False),
+        sa.Column("field", sa.Text(), nullable=True),
+        sa.Column("value", sa.Text(), nullable=True),
+        sa.Column("reference_entity", sa.BIGINT(), nullable=True),
+        sa.Column("priority", sa.Integer(), nullable=True),
+        sa.Column("entry_date", sa.Date(), nullable=True),
+        sa.Column("start_date", sa.Date(), nullable=True),
+        sa.Column("end_date", sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint("fact"),
+    )
+    op.create_index("idx_fact_entity_field", "fact", ["entity", "field"], unique=False)
+    # the primary key also indexes the resources for a fact
+    op.create_table(
+        "fact_resource",
+        sa.Column("fact", sa.Text(), nullable=False),
+        sa.Column("resource", sa.Text(), nullable=False),
+        sa.Column("priority", sa.Integer(), nullable=True),
+        sa.Column("entry_date", sa.Date(), nullable=True),
+        sa.Column("start_date", sa.Date(), nullable=True),
+        sa.Column("end_date", sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint("fact", "resource"),
+    )
+
+
+def downgrade():
+    op.drop_table("fact_resource")
+    op.drop_index("idx_fact_entity_field", table_name="fact")
+    op.drop_table("fact")
@@ -0,0 +1,100 @@
+"""add dataset_entity_count table
+
+Revision ID: 7a3e5b9c1f24
+Revises: 0c6d3f8a2e91
+Create Date: 2024-09-09 10:41:15.226093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7a3e5b9c1f24"
+down_revision = "0c6d3f8a2e91"
+branch_labels = None
+depends_on = None
+
+
+# the counts are kept up to date by statement level triggers on entity, the
+# changed rows are counted once per statement so bulk loads stay fast
+ADD_COUNTS_SQL = """
+INSERT INTO dataset_entity_count (dataset, entity_count)
+SELECT dataset, count(*) FROM new_entity WHERE dataset IS NOT NULL GROUP BY dataset
+ON CONFLICT (dataset) DO UPDATE
+SET entity_count = dataset_entity_count.entity_count + EXCLUDED.entity_count;
+"""
+
+SUBTRACT_COUNTS_SQL = """
+UPDATE dataset_entity_count c SET entity_count = c.entity_count - o.entity_count
+FROM (
+    SELECT dataset, count(*) AS entity_count FROM old_entity GROUP BY dataset
+) o
+WHERE c.dataset = o.dataset;
+DELETE FROM dataset_entity_count WHERE entity_count <= 0;
+"""
+
+TRIGGERS = {
+    "INSERT": ("REFERENCING NEW TABLE AS new_entity", ADD_COUNTS_SQL),
+    "UPDATE": (
+        "REFERENCING OLD TABLE AS old_entity NEW TABLE AS new_entity",
+        SUBTRACT_COUNTS_SQL + ADD_COUNTS_SQL,
+    ),
+    "DELETE": ("REFERENCING OLD TABLE AS old_entity", SUBTRACT_COUNTS_SQL),
+}
+
+
+def upgrade():
+    op.create_table(
+        "dataset_entity_count",
+        sa.Column("dataset", sa.Text(), nullable=False),
+        sa.Column("entity_count", sa.BIGINT(), nullable=False),
+        sa.PrimaryKeyConstraint("dataset"),
+    )
+    op.execute(
+        """
+        INSERT INTO dataset_entity_count (dataset, entity_count)
+        SELECT dataset, count(*) FROM entity
+        WHERE dataset IS NOT NULL
+        GROUP BY dataset
+        """
+    )
+
+    # transition tables can only be used by triggers for a single event
+    for event, (referencing, sql) in TRIGGERS.items():
+        name = f"dataset_entity_count_{event.lower()}"
+        op.execute(
+            f"""
+            CREATE FUNCTION {name}() RETURNS trigger AS $$
+            BEGIN
+                {sql}
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER {name} AFTER {event} ON entity
+            {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {name}();
+            """
+        )
+    op.execute(
+        """
+        CREATE FUNCTION dataset_entity_count_truncate() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM dataset_entity_count;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER dataset_entity_count_truncate AFTER TRUNCATE ON entity
+        FOR EACH STATEMENT EXECUTE FUNCTION dataset_entity_count_truncate();
+        """
+    )
+
+
+def downgrade():
+    for event in [*TRIGGERS, "TRUNCATE"]:
+        name = f"dataset_entity_count_{event.lower()}"
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON entity")
+        op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+    op.drop_table("dataset_entity_count")
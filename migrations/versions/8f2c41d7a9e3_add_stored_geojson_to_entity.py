@@ -0,0 +1,35 @@
+"""add stored geojson to entity
+
+Revision ID: 8f2c41d7a9e3
+Revises: 4703bef121cb
+Create Date: 2024-08-12 10:21:43.518206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8f2c41d7a9e3"
+down_revision = "4703bef121cb"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a stored generated column so postgres keeps it up to date as entities are
+    # loaded rather than serialising the geometry on every read
+    with op.batch_alter_table("entity", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "geometry_geojson",
+                sa.Text(),
+                sa.Computed("ST_AsGeoJSON(COALESCE(geometry, point))", persisted=True),
+                nullable=True,
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("entity", schema=None) as batch_op:
+        batch_op.drop_column("geometry_geojson")
@@ -0,0 +1,46 @@
+"""add simplified geometries to entity
+
+Revision ID: b5e07c3d1f62
+Revises: 8f2c41d7a9e3
+Create Date: 2024-08-19 09:47:05.112874
+
+"""
+from alembic import op
+import geoalchemy2
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5e07c3d1f62"
+down_revision = "8f2c41d7a9e3"
+branch_labels = None
+depends_on = None
+
+tolerances = {"low": 0.0001, "medium": 0.001, "high": 0.01}
+
+
+def upgrade():
+    with op.batch_alter_table("entity", schema=None) as batch_op:
+        for level, tolerance in tolerances.items():
+            batch_op.add_column(
+                sa.Column(
+                    f"geometry_simplified_{level}",
+                    geoalchemy2.types.Geometry(
+                        srid=4326,
+                        spatial_index=False,
+                        from_text="ST_GeomFromEWKT",
+                        name="geometry",
+                    ),
+                    sa.Computed(
+                        f"ST_SimplifyPreserveTopology(geometry, {tolerance})",
+                        persisted=True,
+                    ),
+                    nullable=True,
+                )
+            )
+
+
+def downgrade():
+    with op.batch_alter_table("entity", schema=None) as batch_op:
+        for level in reversed(list(tolerances)):
+            batch_op.drop_column(f"geometry_simplified_{level}")
@@ -0,0 +1,37 @@
+"""add geometry validity to entity
+
+Revision ID: e4a7c92b1d05
+Revises: b5e07c3d1f62
+Create Date: 2024-08-26 11:02:37.604918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e4a7c92b1d05"
+down_revision = "b5e07c3d1f62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # stored so spatial searches filter on a boolean rather than running
+    # ST_IsValid against every candidate row
+    with op.batch_alter_table("entity", schema=None) as batch_op:
+        for column in ["geometry", "point"]:
+            batch_op.add_column(
+                sa.Column(
+                    f"{column}_is_valid",
+                    sa.Boolean(),
+                    sa.Computed(f"ST_IsValid({column})", persisted=True),
+                    nullable=True,
+                )
+            )
+
+
+def downgrade():
+    with op.batch_alter_table("entity", schema=None) as batch_op:
+        batch_op.drop_column("point_is_valid")
+        batch_op.drop_column("geometry_is_valid")
@@ -1,15 +1,20 @@
-from application.data_access.entity_queries import lookup_entity_link
-from application.db.models import EntityOrm
+from application.data_access.entity_queries import (
+    get_entity_count,
+    get_entity_links,
+    refresh_entity_counts,
+)
+from application.data_access.facet_queries import get_entity_facets
+from application.db.models import DatasetEntityCountOrm, EntityOrm
 
 
-def test__lookup_entity_link_returns_nothing_when_the_entity_isnt_found(db_session):
-    linked_entity = lookup_entity_link(
-        db_session, "a-reference", "article-4-direction", 123
+def test_get_entity_links_returns_nothing_when_the_entity_isnt_found(db_session):
+    _, linked_entities = get_entity_links(
+        db_session, {"article-4-direction": "a-reference"}
     )
-    assert linked_entity is None
+    assert linked_entities == {}
 
 
-def test__lookup_entity_link_returns_the_looked_up_entity_when_the_link_exists(
+def test_get_entity_links_returns_the_looked_up_entity_when_the_link_exists(
     db_session,
 ):
     lookup_entity = {
@@ -30,12 +35,76 @@ def test__lookup_entity_link_returns_the_looked_up_entity_when_the_link_exists(
 
     db_session.add(EntityOrm(**lookup_entity))
 
-    linked_entity = lookup_entity_link(
-        db_session, "a-reference", "article-4-direction", 123
+    _, linked_entities = get_entity_links(
+        db_session, {"article-4-direction": "a-reference"}
     )
+    linked_entity = linked_entities["article-4-direction"]
     assert linked_entity["entity"] == lookup_entity["entity"]
     assert linked_entity["reference"] == lookup_entity["reference"]
     assert linked_entity["dataset"] == lookup_entity["dataset"]
     assert linked_entity["typology"] == lookup_entity["typology"]
     assert linked_entity["name"] == lookup_entity["name"]
     assert linked_entity["reference"] == lookup_entity["reference"]
+
+
+def test_get_entity_count_follows_entities_as_they_are_loaded(db_session):
+    db_session.add_all(
+        [
+            EntityOrm(entity=1, dataset="conservation-area"),
+            EntityOrm(entity=2, dataset="conservation-area"),
+            EntityOrm(entity=3, dataset="tree"),
+        ]
+    )
+    db_session.flush()
+
+    assert sorted(get_entity_count(db_session)) == [
+        ("conservation-area", 2),
+        ("tree", 1),
+    ]
+    assert tuple(get_entity_count(db_session, "tree")) == ("tree", 1)
+
+    db_session.query(EntityOrm).filter(EntityOrm.entity == 2).update(
+        {"dataset": "tree"}
+    )
+    assert tuple(get_entity_count(db_session, "tree")) == ("tree", 2)
+
+    db_session.query(EntityOrm).filter(
+        EntityOrm.dataset == "conservation-area"
+    ).delete()
+    # datasets without entities are left out
+    assert get_entity_count(db_session, "conservation-area") is None
+
+
+def test_refresh_entity_counts_counts_entities_again(db_session):
+    db_session.add(EntityOrm(entity=1, dataset="tree"))
+    db_session.flush()
+    db_session.query(DatasetEntityCountOrm).delete()
+
+    refresh_entity_counts(db_session)
+
+    assert tuple(get_entity_count(db_session, "tree")) == ("tree", 1)
+
+
+def test_get_entity_facets_counts_the_matching_entities(db_session):
+    db_session.add_all(
+        [
+            EntityOrm(
+                entity=1,
+                dataset="conservation-area",
+                typology="geography",
+                organisation_entity=16,
+            ),
+            EntityOrm(entity=2, dataset="conservation-area", typology="geography"),
+            EntityOrm(entity=3, dataset="tree", typology="geography"),
+            EntityOrm(entity=4, dataset="brownfield-land", typology="geography"),
+        ]
+    )
+    db_session.flush()
+
+    facets = get_entity_facets(db_session, {"dataset": ["conservation-area", "tree"]})
+
+    assert facets == {
+        "dataset": {"conservation-area": 2, "tree": 1},
+        "typology": {"geography": 3},
+        "organisation_entity": {"16": 1},
+    }
@@ -1,7 +1,13 @@
 import pytest
+from sqlalchemy import text
 from application.core.models import EntityModel
-from application.data_access.entity_queries import get_entity_search
-from application.search.enum import PeriodOption, GeometryRelation
+from application.data_access.entity_queries import (
+    _get_entity_search_query,
+    get_entity_search,
+)
+from application.data_access.entity_query_helpers import normalised_params
+from application.db.models import EntityOrm
+from application.search.enum import CountOption, PeriodOption, GeometryRelation
 
 
 @pytest.fixture(scope="module")
@@ -538,4 +544,71 @@ def test_search_entity_by_organisation_curie(test_data, params, db_session):
     assert entity.reference == expected_entity["reference"]
 
 
+def test_search_entity_count_is_exact_when_paging_past_the_last_result(
+    test_data, params, db_session
+):
+    params["offset"] = len(test_data["entities"]) + 10
+    result = get_entity_search(db_session, params)
+    assert result["count"] == len(test_data["entities"])
+    assert result["entities"] == []
+
+
+def test_search_entity_count_is_estimated(test_data, params, db_session):
+    params["count"] = CountOption.estimated
+    result = get_entity_search(db_session, params)
+    assert isinstance(result["count"], int)
+    assert len(result["entities"]) == min(params["limit"], len(test_data["entities"]))
+
+
+def test_search_entity_count_is_estimated_with_list_filters(
+    test_data, params, db_session
+):
+    params["count"] = CountOption.estimated
+    params["dataset"] = ["greenspace", "brownfield-land"]
+    params["typology"] = ["geography"]
+    result = get_entity_search(db_session, params)
+    assert isinstance(result["count"], int)
+
+
+def test_search_entity_count_none_skips_count(test_data, params, db_session):
+    params["count"] = CountOption.none
+    params["dataset"] = ["greenspace"]
+    result = get_entity_search(db_session, params)
+    assert result["count"] is None
+    assert len(result["entities"]) == 1
+
+
 # TODO test cases for contains, within
+
+
+@pytest.mark.parametrize(
+    "relation",
+    [
+        relation
+        for relation in GeometryRelation
+        # disjoint geometries can share a bounding box so it can't use the index
+        if relation != GeometryRelation.disjoint
+    ],
+)
+def test_search_entity_by_geometry_uses_spatial_indexes(
+    test_data, params, db_session, relation
+):
+    from tests.test_data.wkt_data import intersects_with_brownfield_entity as brownfield
+
+    params["geometry"] = [brownfield]
+    params["geometry_relation"] = relation.name
+    query = _get_entity_search_query(db_session, [EntityOrm], normalised_params(params))
+    compiled = query.statement.compile(dialect=db_session.get_bind().dialect)
+
+    # the test tables are small enough for postgres to prefer scanning them
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(
+        row[0]
+        for row in db_session.connection().exec_driver_sql(
+            f"EXPLAIN {compiled}", compiled.params
+        )
+    )
+
+    assert "idx_entity_geometry" in plan
+    assert "idx_entity_point" in plan
+    assert "ST_IsValid" not in plan
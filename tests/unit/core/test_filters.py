@@ -1,3 +1,7 @@
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
 from application.core.filters import (
     _remove_value_from_list,
     remove_param_from_param_dict,
@@ -6,6 +10,11 @@ from application.core.filters import (
     cacheBust,
     append_uri_param,
     hash_file,
+    get_os_oauth2_token,
+    get_asset_hash,
+    markdown_cache_clear,
+    markdown_cache_info,
+    render_markdown,
 )
 
 
@@ -134,3 +143,176 @@ def test_make_url_param_str_all_arguements():
     expected = "field=typology&test=test_value_1&test=test_value_2&test=test_value_3"
     result = make_url_param_str(input_param_dict, exclude_values, exclude_params)
     assert result == expected
+
+
+def test_render_markdown_gov_attributes():
+    text = "# A heading\n\nSome text with [a link](/link)\n\n* one\n* two"
+
+    result = render_markdown(text, govAttributes=True)
+
+    assert str(result) == (
+        '<h1 class="govuk-heading-xl" id="a-heading">A heading</h1>\n'
+        '<p class="govuk-body">Some text with '
+        '<a class="govuk-link" href="/link">a link</a></p>\n'
+        '<ul class="govuk-list govuk-list--bullet">\n'
+        "<li>one</li>\n<li>two</li>\n</ul>"
+    )
+
+
+def test_render_markdown_raw_html_gets_gov_attributes():
+    text = '<div class="govuk-inset-text">\n\n## Inset\n\n</div>\n\nSome text'
+
+    result = str(render_markdown(text, govAttributes=True))
+
+    assert '<div class="govuk-inset-text">' in result
+    assert '<p class="govuk-body">Some text</p>' in result
+    assert "<p><div" not in result
+
+
+def test_render_markdown_is_cached():
+    markdown_cache_clear()
+
+    first = render_markdown("Some *text*")
+    second = render_markdown("Some *text*")
+    render_markdown("Some *text*", govAttributes=True)
+
+    assert first == second == "<p>Some <em>text</em></p>"
+    info = markdown_cache_info()
+    assert info.hits == 1
+    assert info.misses == 2
+    assert info.currsize == 2
+
+
+def test_render_markdown_cache_is_bounded(monkeypatch):
+    markdown_cache_clear()
+    monkeypatch.setattr(
+        "application.core.filters.settings.MARKDOWN_CACHE_SIZE", 2, raising=False
+    )
+
+    for text in ["one", "two", "three"]:
+        render_markdown(text)
+    render_markdown("one")
+
+    info = markdown_cache_info()
+    assert info.currsize == 2
+    assert info.misses == 4
+
+
+def test_cacheBust_uses_asset_manifest(mocker):
+    mocker.patch(
+        "application.core.filters.get_asset_manifest",
+        return_value={"static/javascripts/MapController.js": "abc"},
+    )
+    hash_file = mocker.patch("application.core.filters.hash_file")
+
+    result = cacheBust("/static/javascripts/MapController.js")
+
+    assert result == "/static/javascripts/MapController.js?v=abc"
+    hash_file.assert_not_called()
+
+
+def test_get_asset_hash_adds_files_missing_from_manifest(mocker, monkeypatch, tmp_path):
+    (tmp_path / "static").mkdir()
+    (tmp_path / "static" / "app.js").write_text("console.log('app')")
+    monkeypatch.chdir(tmp_path)
+    manifest = {}
+    mocker.patch("application.core.filters.get_asset_manifest", return_value=manifest)
+
+    result = get_asset_hash("/static/app.js")
+
+    assert result == hash_file("static/app.js")
+    assert manifest == {"static/app.js": result}
+
+
+def test_get_asset_hash_watch_assets_rehashes_changed_files(mocker, monkeypatch):
+    monkeypatch.setattr(
+        "application.core.filters.settings.WATCH_ASSETS", True, raising=False
+    )
+    mocker.patch(
+        "application.core.filters.get_asset_manifest",
+        return_value={"static/app.js": "old"},
+    )
+    mocker.patch("application.core.filters._asset_mtimes", {})
+    mocker.patch("application.core.filters.hash_file", return_value="new")
+    stat = mocker.patch("application.core.filters.os.stat")
+    stat.return_value.st_mtime_ns = 1
+
+    assert get_asset_hash("/static/app.js") == "new"
+
+    mocker.patch("application.core.filters.hash_file", return_value="newer")
+    assert get_asset_hash("/static/app.js") == "new"
+
+    stat.return_value.st_mtime_ns = 2
+    assert get_asset_hash("/static/app.js") == "newer"
+
+
+@pytest.fixture
+def os_token(mocker, monkeypatch):
+    monkeypatch.setattr(
+        "application.core.filters.settings.OS_CLIENT_KEY", "key", raising=False
+    )
+    monkeypatch.setattr(
+        "application.core.filters.settings.OS_CLIENT_SECRET", "secret", raising=False
+    )
+    mocker.patch(
+        "application.core.filters._os_token",
+        {"token": None, "expires": 0.0, "refresh": 0.0},
+    )
+    post = mocker.patch("application.core.filters.requests.post")
+    post.return_value.json.side_effect = lambda: {
+        "access_token": f"token-{post.call_count}",
+        "expires_in": "299",
+    }
+    return post
+
+
+def test_get_os_oauth2_token_is_cached(os_token, mocker):
+    mocker.patch("application.core.filters.time.monotonic", return_value=1000)
+
+    first = get_os_oauth2_token()
+    second = get_os_oauth2_token()
+
+    assert first["access_token"] == second["access_token"] == "token-1"
+    assert os_token.call_count == 1
+
+
+def test_get_os_oauth2_token_refreshes_expired_token(os_token, mocker):
+    monotonic = mocker.patch("application.core.filters.time.monotonic")
+    monotonic.return_value = 1000
+    get_os_oauth2_token()
+
+    monotonic.return_value = 1000 + 299 - 30
+    result = get_os_oauth2_token()
+
+    assert result["access_token"] == "token-2"
+    assert os_token.call_count == 2
+
+
+def test_get_os_oauth2_token_refreshes_in_background(os_token, mocker):
+    monotonic = mocker.patch("application.core.filters.time.monotonic")
+    monotonic.return_value = 1000
+    get_os_oauth2_token()
+    thread = mocker.patch("application.core.filters.threading.Thread")
+
+    monotonic.return_value = 1000 + 299 - 60
+    result = get_os_oauth2_token()
+
+    assert result["access_token"] == "token-1"
+    thread.assert_called_once()
+    thread.call_args.kwargs["target"]()
+    assert get_os_oauth2_token()["access_token"] == "token-2"
+
+
+def test_get_os_oauth2_token_concurrent_requests_make_one_request(os_token):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: get_os_oauth2_token(), range(8)))
+
+    assert os_token.call_count == 1
+    assert all(result["access_token"] == "token-1" for result in results)
+
+
+def test_get_os_oauth2_token_error(os_token):
+    os_token.return_value.json.side_effect = None
+    os_token.return_value.json.return_value = {"Error": "Invalid credentials"}
+
+    assert get_os_oauth2_token() == "null"
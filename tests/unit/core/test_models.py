@@ -0,0 +1,117 @@
+from datetime import date
+
+from geoalchemy2.elements import WKTElement
+
+from application.core.models import (
+    EntityModel,
+    entity_factory,
+    entity_json,
+    get_extended_entity_model,
+)
+from application.db.models import EntityOrm
+from application.search.enum import SimplifyOption
+
+
+def test_get_extended_entity_model_reuses_model_for_same_keys():
+    model_1 = get_extended_entity_model(frozenset(["notes", "documentation-url"]))
+    model_2 = get_extended_entity_model(frozenset(["documentation-url", "notes"]))
+    assert model_1 is model_2
+    assert issubclass(model_1, EntityModel)
+
+
+def test_entity_factory_extends_model_with_json_fields():
+    entity_orm = EntityOrm(
+        entity=11000000,
+        name="Abbotswood Shaw",
+        organisation_entity=123,
+        json={"documentation-url": "https://example.com", "notes": "some notes"},
+    )
+    entity = entity_factory(entity_orm)
+    result = entity.dict(by_alias=True)
+    assert result["entity"] == 11000000
+    assert result["organisation-entity"] == "123"
+    assert result["documentation-url"] == "https://example.com"
+    assert result["notes"] == "some notes"
+
+
+def test_entity_factory_without_json_returns_entity_model():
+    entity = entity_factory(EntityOrm(entity=11000000, name="Abbotswood Shaw"))
+    assert type(entity) is EntityModel
+
+
+def test_entity_factory_parses_stored_geojson():
+    entity_orm = EntityOrm(
+        entity=11000000, geometry_geojson='{"type":"Point","coordinates":[1,2]}'
+    )
+    entity = entity_factory(entity_orm)
+    assert entity.geojson.geometry == {"type": "Point", "coordinates": [1, 2]}
+    assert entity.geojson_text is None
+
+
+def test_entity_factory_with_raw_geojson_keeps_stored_text():
+    geojson = '{"type":"Point","coordinates":[1.000000001,2]}'
+    entity_orm = EntityOrm(entity=11000000, geometry_geojson=geojson, json={"a": 1})
+    entity = entity_factory(entity_orm, raw_geojson=True)
+    assert entity.geojson is None
+    assert entity.geojson_text == geojson
+    assert "geojson_text" not in entity.dict()
+
+
+def test_entity_factory_with_simplify_uses_simplified_geometry():
+    entity_orm = EntityOrm(
+        entity=11000000,
+        geometry_simplified_low=WKTElement(
+            "MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)))", srid=4326
+        ),
+        point=WKTElement("POINT(0.5 0.5)", srid=4326),
+    )
+    entity = entity_factory(entity_orm, simplify=SimplifyOption.low)
+    assert entity.geometry == "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)))"
+    assert entity.geojson.geometry["type"] == "MultiPolygon"
+    assert entity.point == "POINT (0.5 0.5)"
+
+
+def test_entity_factory_with_simplify_falls_back_to_point_for_geojson():
+    entity_orm = EntityOrm(
+        entity=11000000, point=WKTElement("POINT(0.5 0.5)", srid=4326)
+    )
+    entity = entity_factory(entity_orm, raw_geojson=True, simplify=SimplifyOption.high)
+    assert entity.geometry is None
+    assert entity.geojson_text == '{"type":"Point","coordinates":[0.5,0.5]}'
+
+
+def test_entity_json_matches_the_entity_model_dict():
+    entity_orm = EntityOrm(
+        entity=11000000,
+        name="Abbotswood Shaw",
+        entry_date=date(2022, 3, 23),
+        organisation_entity=123,
+        geometry=WKTElement("MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)))", srid=4326),
+        point=WKTElement("POINT(0.5 0.5)", srid=4326),
+        geometry_geojson='{"type":"Point","coordinates":[1,2]}',
+        json={"notes": "some notes", "documentation_url": "https://example.com"},
+    )
+    expected = entity_factory(entity_orm).dict(by_alias=True)
+    result = entity_json(entity_orm)
+    assert result == expected
+    assert list(result) == list(expected)
+    assert result["documentation-url"] == "https://example.com"
+
+
+def test_entity_json_without_json_matches_the_entity_model_dict():
+    entity_orm = EntityOrm(entity=11000000, name="Abbotswood Shaw")
+    assert entity_json(entity_orm) == entity_factory(entity_orm).dict(by_alias=True)
+
+
+def test_entity_json_with_simplify_matches_the_entity_model_dict():
+    entity_orm = EntityOrm(
+        entity=11000000,
+        geometry_simplified_low=WKTElement(
+            "MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)))", srid=4326
+        ),
+        point=WKTElement("POINT(0.5 0.5)", srid=4326),
+    )
+    expected = entity_factory(entity_orm, simplify=SimplifyOption.low)
+    result = entity_json(entity_orm, SimplifyOption.low)
+    assert result == expected.dict(by_alias=True)
+    assert result["geometry"] == "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)))"
@@ -0,0 +1,139 @@
+import asyncio
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from fastapi.responses import HTMLResponse
+from starlette.requests import Request
+
+from application.core import page_cache as page_cache_module
+from application.core.page_cache import cached_page
+
+
+def make_request(path="/dataset/"):
+    return Request(
+        {
+            "type": "http",
+            "scheme": "https",
+            "server": ("www.planning.data.gov.uk", 443),
+            "path": path,
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+
+
+@pytest.fixture
+def page_cache(mocker, tmp_path):
+    mocker.patch(
+        "application.core.page_cache.get_settings",
+        return_value=MagicMock(
+            PAGE_CACHE_DIR=str(tmp_path), PAGE_CACHE_SIZE=2, RELEASE_TAG="v1"
+        ),
+    )
+    versions = mocker.patch(
+        "application.core.page_cache.get_dataset_versions",
+        return_value={"tree": "1"},
+    )
+    mocker.patch("application.core.page_cache.get_last_updated", return_value=None)
+    mocker.patch("application.core.page_cache._page_counts", {})
+    return tmp_path, versions
+
+
+def test_cached_page_serves_rendered_page_from_cache(page_cache):
+    calls = []
+
+    @cached_page()
+    def page(request, extension=None, session=None):
+        calls.append(request.url.path)
+        return HTMLResponse("<p>datasets</p>")
+
+    page(request=make_request(), session=MagicMock())
+    result = page(request=make_request(), session=MagicMock())
+
+    assert result.body == b"<p>datasets</p>"
+    assert len(calls) == 1
+
+
+def test_cached_page_renders_again_when_data_version_changes(page_cache):
+    _, versions = page_cache
+    calls = []
+
+    @cached_page()
+    def page(request, extension=None, session=None):
+        calls.append(request.url.path)
+        return HTMLResponse("<p>datasets</p>")
+
+    page(request=make_request(), session=MagicMock())
+    versions.return_value = {"tree": "2"}
+    page(request=make_request(), session=MagicMock())
+
+    assert len(calls) == 2
+
+
+def test_cached_page_does_not_cache_json(page_cache):
+    calls = []
+
+    @cached_page()
+    def page(request, extension=None, session=None):
+        calls.append(request.url.path)
+        return {"datasets": []}
+
+    page(request=make_request(), extension="json", session=MagicMock())
+    page(request=make_request(), extension="json", session=MagicMock())
+
+    assert len(calls) == 2
+
+
+def test_cached_page_async_route_and_eviction(page_cache):
+    directory, _ = page_cache
+
+    @cached_page(data_version=False)
+    async def page(request, url_path):
+        return HTMLResponse(f"<p>{url_path}</p>")
+
+    for path in ["a", "b", "c"]:
+        asyncio.run(page(request=make_request(f"/guidance/{path}"), url_path=path))
+
+    assert len(list(directory.glob("*.html"))) == 2
+
+
+def test_cached_page_only_evicts_once_the_cache_could_be_full(page_cache, mocker):
+    evict = mocker.spy(page_cache_module, "_evict")
+
+    @cached_page(data_version=False)
+    async def page(request, url_path):
+        return HTMLResponse(f"<p>{url_path}</p>")
+
+    for path in ["a", "b"]:
+        asyncio.run(page(request=make_request(f"/guidance/{path}"), url_path=path))
+    evict.assert_not_called()
+
+    asyncio.run(page(request=make_request("/guidance/c"), url_path="c"))
+    evict.assert_called_once()
+
+
+def test_cached_page_async_route_does_file_io_off_the_event_loop(page_cache, mocker):
+    run_in_threadpool = mocker.spy(page_cache_module, "run_in_threadpool")
+
+    @cached_page(data_version=False)
+    async def page(request, url_path):
+        return HTMLResponse(f"<p>{url_path}</p>")
+
+    asyncio.run(page(request=make_request("/guidance/a"), url_path="a"))
+
+    functions = [call.args[0].__name__ for call in run_in_threadpool.call_args_list]
+    assert functions == ["get_page", "store"]
+
+
+def test_cached_page_does_not_cache_errors(page_cache):
+    directory, _ = page_cache
+
+    @cached_page(data_version=False)
+    async def page(request, url_path):
+        return HTMLResponse("<p>not found</p>", status_code=404)
+
+    asyncio.run(page(request=make_request("/guidance/missing"), url_path="missing"))
+
+    assert list(directory.glob("*.html")) == []
@@ -0,0 +1,91 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from application.data_access.datasette_query_helpers import (
+    get_datasette_http,
+    get_datasette_rows,
+    query_datasette,
+    query_datasette_async,
+)
+from application.data_access.fact_queries import ENTITY_FIELDS_QUERY, FACT_QUERY
+
+
+def test_get_datasette_http_reuses_session():
+    assert get_datasette_http() is get_datasette_http()
+
+
+def test_get_datasette_rows_sets_empty_values_to_none(mocker):
+    response = mocker.MagicMock()
+    response.json.return_value = [{"field": "name", "value": ""}]
+    http = mocker.patch(
+        "application.data_access.datasette_query_helpers.get_datasette_http"
+    )
+    http.return_value.get.return_value = response
+
+    rows = get_datasette_rows("https://datasette.example.org/db.json", {})
+
+    assert rows == [{"field": "name", "value": None}]
+    response.raise_for_status.assert_called_once()
+
+
+def _mock_rows(mocker, rows):
+    return mocker.patch(
+        "application.data_access.datasette_query_helpers.get_datasette_rows",
+        side_effect=lambda url, params: [dict(row) for row in rows],
+    )
+
+
+def test_query_datasette_sends_named_parameters_with_stable_sql(mocker):
+    get_rows = _mock_rows(mocker, [{"field": "name"}])
+
+    query_datasette("ancient-woodland", ENTITY_FIELDS_QUERY, {"entity": 1})
+    query_datasette("ancient-woodland", ENTITY_FIELDS_QUERY, {"entity": 2})
+
+    first, second = [c.args for c in get_rows.call_args_list]
+    assert first[0].endswith("/ancient-woodland.json")
+    assert first[1]["sql"] == second[1]["sql"]
+    assert ":entity" in first[1]["sql"]
+    assert first[1]["entity"] == 1 and second[1]["entity"] == 2
+
+
+def test_query_datasette_caches_rows(mocker):
+    get_rows = _mock_rows(mocker, [{"field": "name"}])
+
+    rows = query_datasette("ancient-woodland", ENTITY_FIELDS_QUERY, {"entity": 1})
+    rows[0]["field"] = "changed"
+    rows = query_datasette("ancient-woodland", ENTITY_FIELDS_QUERY, {"entity": 1})
+
+    assert rows == [{"field": "name"}]
+    assert get_rows.call_count == 1
+
+    # the same parameters for another dataset aren't served from the cache
+    query_datasette("conservation-area", ENTITY_FIELDS_QUERY, {"entity": 1})
+    assert get_rows.call_count == 2
+
+
+def test_query_datasette_cache_can_be_turned_off(mocker):
+    mocker.patch(
+        "application.data_access.datasette_query_helpers.get_settings",
+        return_value=MagicMock(DATASETTE_CACHE_SIZE=0),
+    )
+    get_rows = _mock_rows(mocker, [{"field": "name"}])
+
+    query_datasette("ancient-woodland", ENTITY_FIELDS_QUERY, {"entity": 1})
+    query_datasette("ancient-woodland", ENTITY_FIELDS_QUERY, {"entity": 1})
+
+    assert get_rows.call_count == 2
+
+
+def test_query_datasette_async_shares_the_cache(mocker):
+    _mock_rows(mocker, [{"fact": "abc"}])
+    get_rows_async = mocker.patch(
+        "application.data_access.datasette_query_helpers.get_datasette_rows_async",
+    )
+
+    query_datasette("ancient-woodland", FACT_QUERY, {"fact": "abc"})
+    rows = asyncio.run(
+        query_datasette_async("ancient-woodland", FACT_QUERY, {"fact": "abc"})
+    )
+
+    assert rows == [{"fact": "abc"}]
+    get_rows_async.assert_not_called()
@@ -1,9 +1,220 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import asyncpg
 from sqlalchemy.orm import Query
-from application.data_access.entity_queries import _apply_limit_and_pagination_filters
+from application.data_access.entity_queries import (
+    _apply_geometry_options,
+    _apply_location_filters,
+    _apply_limit_and_pagination_filters,
+    _check_query_cost,
+    _get_estimated_count,
+    get_entity_count,
+    get_entity_links,
+    get_entity_search_async,
+)
 from application.db.models import EntityOrm
+from application.exceptions import QueryCostExceeded
+from application.search.enum import GeometryRelation, SimplifyOption
 
 
 def test__apply_limit_and_pagination_filters_with_no_filters_applied():
     query = Query(EntityOrm)
     result = _apply_limit_and_pagination_filters(query, params={"dataset": "testing"})
     assert result._limit_clause is None
+
+
+def test__apply_limit_and_pagination_filters_with_after_entity_seeks_past_entity():
+    query = Query(EntityOrm)
+    result = _apply_limit_and_pagination_filters(
+        query, params={"limit": 10, "offset": 20, "after_entity": 1000}
+    )
+    assert "entity.entity > " in str(result.statement)
+    assert result._offset_clause is None
+
+
+def test_get_entity_links_resolves_organisation_and_links_in_one_query():
+    session = MagicMock()
+    session.query.return_value.filter.return_value = [
+        EntityOrm(entity=600001, dataset="local-authority", reference="LBH"),
+        EntityOrm(entity=7010000001, dataset="article-4-direction", reference="A4D1"),
+        EntityOrm(entity=19100001, dataset="tree-preservation-order", reference="TPO"),
+        EntityOrm(entity=19100002, dataset="tree-preservation-order", reference="TPO"),
+    ]
+
+    organisation, linked_entities = get_entity_links(
+        session,
+        {"article-4-direction": "A4D1", "tree-preservation-order": "TPO"},
+        # as held on EntityModel and passed by the entity page
+        "600001",
+    )
+
+    assert session.query.call_count == 1
+    assert organisation.entity == 600001
+    assert linked_entities["article-4-direction"]["entity"] == 7010000001
+    # ambiguous links aren't resolved
+    assert "tree-preservation-order" not in linked_entities
+
+
+def test_get_entity_links_without_links_or_organisation_does_not_query():
+    session = MagicMock()
+    assert get_entity_links(session, {"article-4-direction": None}) == (None, {})
+    session.query.assert_not_called()
+
+
+def test__apply_geometry_options_defers_stored_geojson():
+    query = Query(EntityOrm)
+    loaded = str(_apply_geometry_options(query, {}, True).statement)
+    deferred = str(_apply_geometry_options(query, {}, False).statement)
+    assert "geometry_geojson" in loaded
+    assert "geometry_simplified" not in loaded
+    assert "geometry_geojson" not in deferred
+
+
+def test__apply_geometry_options_loads_simplified_geometry_in_place_of_geometry():
+    query = Query(EntityOrm)
+    params = {"simplify": SimplifyOption.medium}
+    statement = str(_apply_geometry_options(query, params, True).statement)
+    assert "geometry_simplified_medium" in statement
+    assert "entity.geometry," not in statement
+    assert "geometry_geojson" not in statement
+
+
+def test_get_entity_search_async_runs_search_on_the_async_session(mocker):
+    get_entity_search = mocker.patch(
+        "application.data_access.entity_queries.get_entity_search",
+        return_value={"params": {}, "count": 0, "entities": []},
+    )
+    session = MagicMock()
+    session.run_sync = AsyncMock(
+        side_effect=lambda fn, *args, **kwargs: fn("sync session", *args, **kwargs)
+    )
+
+    result = asyncio.run(
+        get_entity_search_async(session, {"dataset": ["conservation-area"]})
+    )
+
+    assert result["count"] == 0
+    get_entity_search.assert_called_once_with(
+        "sync session",
+        {"dataset": ["conservation-area"]},
+        load_geojson=True,
+        raw_geojson=False,
+        as_json=False,
+    )
+
+
+def test__get_estimated_count_passes_positional_parameters():
+    session = MagicMock()
+    session.get_bind.return_value.dialect = asyncpg.dialect()
+    session.connection.return_value.exec_driver_sql.return_value.scalar.return_value = [
+        {"Plan": {"Plan Rows": 42}}
+    ]
+    query = Query(EntityOrm.entity).filter(EntityOrm.dataset == "conservation-area")
+
+    assert _get_estimated_count(session, query) == 42
+    _, params = session.connection.return_value.exec_driver_sql.call_args.args
+    assert params == ("conservation-area",)
+
+
+def test__get_estimated_count_with_in_list_filters():
+    session = MagicMock()
+    session.get_bind.return_value.dialect = asyncpg.dialect()
+    session.connection.return_value.exec_driver_sql.return_value.scalar.return_value = [
+        {"Plan": {"Plan Rows": 7}}
+    ]
+    query = Query(EntityOrm.entity).filter(
+        EntityOrm.dataset.in_(["conservation-area", "tree"]),
+        EntityOrm.typology.in_(["geography"]),
+    )
+
+    assert _get_estimated_count(session, query) == 7
+    sql, params = session.connection.return_value.exec_driver_sql.call_args.args
+    assert "POSTCOMPILE" not in sql
+    assert params == ("conservation-area", "tree", "geography")
+
+
+def test__check_query_cost_refuses_expensive_queries(mocker):
+    mocker.patch(
+        "application.data_access.entity_queries.get_settings",
+        return_value=MagicMock(DB_QUERY_COST_LIMIT=1000),
+    )
+    session = MagicMock()
+    session.get_bind.return_value.dialect = asyncpg.dialect()
+    session.connection.return_value.exec_driver_sql.return_value.scalar.return_value = [
+        {"Plan": {"Total Cost": 5000.5, "Plan Rows": 10}}
+    ]
+
+    with pytest.raises(QueryCostExceeded):
+        _check_query_cost(session, Query(EntityOrm))
+
+
+def test__check_query_cost_explains_in_list_filters(mocker):
+    mocker.patch(
+        "application.data_access.entity_queries.get_settings",
+        return_value=MagicMock(DB_QUERY_COST_LIMIT=1000),
+    )
+    session = MagicMock()
+    session.get_bind.return_value.dialect = postgresql.dialect()
+    session.connection.return_value.exec_driver_sql.return_value.scalar.return_value = [
+        {"Plan": {"Total Cost": 10, "Plan Rows": 10}}
+    ]
+    query = Query(EntityOrm).filter(
+        EntityOrm.dataset.in_(["conservation-area", "tree"])
+    )
+
+    _check_query_cost(session, query)
+
+    sql, params = session.connection.return_value.exec_driver_sql.call_args.args
+    assert "POSTCOMPILE" not in sql
+    assert "entity.dataset IN (%(dataset_1_1)s, %(dataset_1_2)s)" in sql
+    assert params == {"dataset_1_1": "conservation-area", "dataset_1_2": "tree"}
+
+
+def test__check_query_cost_without_limit_does_not_explain(mocker):
+    mocker.patch(
+        "application.data_access.entity_queries.get_settings",
+        return_value=MagicMock(DB_QUERY_COST_LIMIT=None),
+    )
+    session = MagicMock()
+
+    _check_query_cost(session, Query(EntityOrm))
+
+    session.connection.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "relation, operator",
+    [
+        (GeometryRelation.within, "@"),
+        (GeometryRelation.intersects, "&&"),
+        (GeometryRelation.contains, "~"),
+        (GeometryRelation.disjoint, None),
+    ],
+)
+def test__apply_location_filters_prefilters_on_bounding_box(relation, operator):
+    query = _apply_location_filters(
+        MagicMock(),
+        Query(EntityOrm),
+        {"geometry": ["POINT(-0.1 51.5)"], "geometry_relation": relation},
+    )
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    assert "ST_IsValid" not in sql
+    assert "entity.geometry_is_valid IS true" in sql
+    if operator is not None:
+        assert f"entity.geometry {operator} ST_GeomFromWKB" in sql
+        assert f"entity.point {operator} ST_GeomFromWKB" in sql
+    else:
+        assert "&&" not in sql
+
+
+def test_get_entity_count_reads_the_maintained_counts():
+    session = MagicMock()
+    get_entity_count(session, "conservation-area")
+
+    sql = str(session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "FROM dataset_entity_count" in sql
+    assert "count(" not in sql
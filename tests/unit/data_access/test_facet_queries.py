@@ -0,0 +1,110 @@
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from application.data_access.facet_queries import (
+    _get_facets_query,
+    get_entity_facets,
+    invalidate_facets,
+)
+from application.search.enum import FacetOption
+
+
+@pytest.fixture(autouse=True)
+def facet_cache(mocker):
+    invalidate_facets()
+    mocker.patch(
+        "application.data_access.facet_queries.get_dataset_versions",
+        return_value={"conservation-area": "1"},
+    )
+    yield
+    invalidate_facets()
+
+
+def _row(count, dataset=None, typology=None, organisation_entity=None):
+    return MagicMock(
+        count=count,
+        dataset=dataset,
+        dataset_grouping=0 if dataset is not None else 1,
+        typology=typology,
+        typology_grouping=0 if typology is not None else 1,
+        organisation_entity=organisation_entity,
+        organisation_entity_grouping=0 if organisation_entity is not None else 1,
+    )
+
+
+@pytest.fixture
+def facets_query(mocker):
+    mocker.patch("application.data_access.facet_queries._check_query_cost")
+    query = MagicMock()
+    query.all.return_value = [
+        _row(3, dataset="conservation-area"),
+        _row(1, dataset="tree"),
+        _row(4, typology="geography"),
+        _row(2, organisation_entity=16),
+    ]
+    return mocker.patch(
+        "application.data_access.facet_queries._get_facets_query",
+        return_value=query,
+    )
+
+
+def test_get_facets_query_counts_every_facet_in_one_query():
+    query = _get_facets_query(
+        Session(), {"dataset": ["conservation-area"]}, list(FacetOption)
+    )
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+    assert (
+        "GROUP BY GROUPING SETS(entity.dataset, entity.typology, "
+        "entity.organisation_entity)" in sql
+    )
+    assert "grouping(entity.dataset) AS dataset_grouping" in sql
+    assert "entity.dataset IN" in sql
+
+
+def test_get_facets_query_isnt_grouped_by_entity_for_geometry_reference():
+    query = _get_facets_query(
+        Session(),
+        {"dataset": ["tree"], "geometry_reference": ["E09000001"]},
+        list(FacetOption),
+    )
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+    outer_group_by = sql.rsplit("GROUP BY", 1)[1]
+    assert outer_group_by.strip().startswith("GROUPING SETS(")
+    assert "entity.entity IN (SELECT matching.entity" in sql
+
+
+def test_get_entity_facets_returns_counts_by_facet(facets_query):
+    facets = get_entity_facets(MagicMock(), {"dataset": ["conservation-area", "tree"]})
+
+    assert facets == {
+        "dataset": {"conservation-area": 3, "tree": 1},
+        "typology": {"geography": 4},
+        "organisation_entity": {"16": 2},
+    }
+
+
+def test_get_entity_facets_ignores_paging_when_caching(facets_query):
+    session = MagicMock()
+    facets = get_entity_facets(session, {"dataset": ["tree"], "limit": 10})
+    facets["dataset"]["tree"] = 100
+    facets = get_entity_facets(session, {"dataset": ["tree"], "offset": 10})
+
+    assert facets["dataset"]["tree"] == 1
+    assert facets_query.call_count == 1
+    # paging isn't passed on to the query
+    assert facets_query.call_args.args[1] == {"dataset": ["tree"]}
+
+    get_entity_facets(session, {"dataset": ["conservation-area"]})
+    assert facets_query.call_count == 2
+
+
+def test_get_entity_facets_only_counts_the_facets_asked_for(facets_query):
+    get_entity_facets(
+        MagicMock(),
+        {},
+        [FacetOption.typology, FacetOption.dataset, FacetOption.dataset],
+    )
+    assert facets_query.call_args.args[2] == [FacetOption.dataset, FacetOption.typology]
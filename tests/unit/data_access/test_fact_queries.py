@@ -0,0 +1,136 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+from sqlalchemy.dialects import postgresql
+
+from application.core.models import DatasetFieldModel, FactModel
+from application.data_access.fact_queries import (
+    ENTITY_FACTS_QUERY,
+    _get_facts_statement,
+    get_fact_by_id,
+    get_fact_fields,
+    get_facts_for_entity,
+    get_search_facts_query,
+)
+
+
+def _compile(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def _row(**values):
+    row = MagicMock()
+    row._mapping = values
+    return row
+
+
+def test_get_facts_statement_takes_the_newest_resource():
+    sql = _compile(_get_facts_statement())
+    assert "ORDER BY fact_resource.entry_date DESC))[" in sql
+    assert "GROUP BY fact.fact, entity.entity" in sql
+    assert "resources" not in sql
+
+
+def test_get_facts_statement_with_resources_aggregates_them_as_json():
+    sql = _compile(_get_facts_statement(resources=True))
+    assert "json_agg(json_build_object('resource', fact_resource.resource" in sql
+    assert "AS resources" in sql
+
+
+def test_get_fact_by_id_returns_fact_model():
+    session = MagicMock()
+    session.execute.return_value.one_or_none.return_value = _row(
+        fact="180b185fbe277e7ae6d0da63b57eb46549d21fd6424e9890c4cd73f9490dde93",
+        entity=110000000,
+        entity_name="Abbotswood Shaw",
+        entity_prefix="ancient-woodland",
+        entity_reference="1481207",
+        reference_entity=None,
+        field="name",
+        value="Abbotswood Shaw",
+        earliest_entry_date=date(2021, 5, 26),
+        latest_entry_date=date(2022, 3, 23),
+        latest_resource="80709f04",
+        resources='[{"resource" : "80709f04", "entry_date" : "2022-03-23"}]',
+    )
+
+    fact = get_fact_by_id(session, "180b185f", "ancient-woodland")
+
+    assert isinstance(fact, FactModel)
+    assert fact.latest_resource == "80709f04"
+    sql = _compile(session.execute.call_args.args[0])
+    assert "fact.fact = %(fact_1)s" in sql
+    assert "entity.dataset = %(dataset_1)s" in sql
+
+
+def test_get_fact_by_id_returns_none_when_not_found():
+    session = MagicMock()
+    session.execute.return_value.one_or_none.return_value = None
+    assert get_fact_by_id(session, "180b185f", "ancient-woodland") is None
+
+
+def test_get_facts_for_entity_filters_by_fields():
+    session = MagicMock()
+    session.execute.return_value = []
+
+    assert get_facts_for_entity(session, 110000000, ["name", "reference"]) == []
+
+    sql = _compile(session.execute.call_args.args[0])
+    assert "fact.entity = %(entity_1)s" in sql
+    assert "fact.field IN (__[POSTCOMPILE_field_1])" in sql
+
+
+def test_get_fact_fields_for_dataset_joins_entity():
+    session = MagicMock()
+    session.execute.return_value.scalars.return_value = ["name", "reference"]
+
+    fields = get_fact_fields(session, "ancient-woodland")
+
+    assert fields == [
+        DatasetFieldModel(field="name"),
+        DatasetFieldModel(field="reference"),
+    ]
+    sql = _compile(session.execute.call_args.args[0])
+    assert "entity.dataset = %(dataset_1)s" in sql
+
+
+def test_get_fact_fields_for_entity_does_not_join_entity():
+    session = MagicMock()
+    session.execute.return_value.scalars.return_value = []
+
+    get_fact_fields(session, "ancient-woodland", entity=110000000)
+
+    sql = _compile(session.execute.call_args.args[0])
+    assert "JOIN entity" not in sql
+    assert "fact.entity = %(entity_1)s" in sql
+
+
+def test_get_search_facts_query_sends_fields_as_a_json_parameter(mocker):
+    query_datasette = mocker.patch(
+        "application.data_access.fact_queries.query_datasette", return_value=[]
+    )
+
+    get_search_facts_query(
+        {
+            "dataset": "ancient-woodland",
+            "entity": 110000000,
+            "field": ["reference", "name"],
+        }
+    )
+
+    dataset, query, params = query_datasette.call_args.args
+    assert dataset == "ancient-woodland"
+    assert query is ENTITY_FACTS_QUERY
+    assert params == {"entity": 110000000, "fields": '["name", "reference"]'}
+
+
+def test_get_search_facts_query_without_fields_asks_for_all_of_them(mocker):
+    query_datasette = mocker.patch(
+        "application.data_access.fact_queries.query_datasette", return_value=[]
+    )
+
+    get_search_facts_query(
+        {"dataset": "ancient-woodland", "entity": 110000000, "field": None}
+    )
+
+    assert query_datasette.call_args.args[2]["fields"] == "[]"
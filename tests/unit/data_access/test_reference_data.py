@@ -0,0 +1,133 @@
+from unittest.mock import MagicMock
+
+from application.core.models import DatasetModel
+from application.data_access.reference_data import (
+    cached_reference_data,
+    get_dataset_versions,
+    invalidate_reference_data,
+)
+from application.settings import get_settings
+
+
+def test_cached_reference_data_only_queries_once():
+    query = MagicMock(return_value=["ancient-woodland"], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    assert cached_query(MagicMock()) == ["ancient-woodland"]
+    assert cached_query(MagicMock()) == ["ancient-woodland"]
+    assert query.call_count == 1
+
+
+def test_cached_reference_data_keys_on_arguments():
+    query = MagicMock(side_effect=lambda session, region: [region], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    assert cached_query(MagicMock(), "local-authority") == ["local-authority"]
+    assert cached_query(MagicMock(), "national-park") == ["national-park"]
+    assert query.call_count == 2
+
+
+def test_cached_reference_data_returns_copies_of_models():
+    query = MagicMock(
+        return_value=[DatasetModel(dataset="ancient-woodland")], __name__="query"
+    )
+    cached_query = cached_reference_data(query)
+
+    cached_query(MagicMock())[0].entity_count = 10
+    assert cached_query(MagicMock())[0].entity_count is None
+
+
+def test_cached_reference_data_expires_after_ttl(mocker):
+    ttl = get_settings().REFERENCE_DATA_CACHE_TTL
+    monotonic = mocker.patch(
+        "application.data_access.reference_data.time.monotonic", return_value=1000.0
+    )
+    query = MagicMock(return_value=["ancient-woodland"], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    cached_query(MagicMock())
+    monotonic.return_value = 1000.0 + ttl - 1
+    cached_query(MagicMock())
+    assert query.call_count == 1
+
+    monotonic.return_value = 1000.0 + ttl + 1
+    cached_query(MagicMock())
+    assert query.call_count == 2
+
+
+def test_invalidate_reference_data_clears_cache():
+    query = MagicMock(return_value=["ancient-woodland"], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    cached_query(MagicMock())
+    invalidate_reference_data()
+    cached_query(MagicMock())
+    assert query.call_count == 2
+
+
+def test_cached_reference_data_drops_least_recently_used(mocker):
+    mocker.patch(
+        "application.data_access.reference_data.get_settings",
+        return_value=MagicMock(
+            REFERENCE_DATA_CACHE_TTL=300, REFERENCE_DATA_CACHE_SIZE=2
+        ),
+    )
+    query = MagicMock(side_effect=lambda session, dataset: [dataset], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    cached_query(MagicMock(), "tree")
+    cached_query(MagicMock(), "conservation-area")
+    cached_query(MagicMock(), "tree")
+    cached_query(MagicMock(), "ancient-woodland")
+    assert query.call_count == 3
+
+    # conservation-area was the least recently used so it was dropped
+    cached_query(MagicMock(), "tree")
+    cached_query(MagicMock(), "conservation-area")
+    assert query.call_count == 4
+
+
+def test_get_dataset_versions_invalidates_reference_data_when_they_change(mocker):
+    interval = get_settings().REFERENCE_DATA_VERSION_CHECK_INTERVAL
+    monotonic = mocker.patch(
+        "application.data_access.reference_data.time.monotonic", return_value=1000.0
+    )
+    read_versions = mocker.patch(
+        "application.data_access.reference_data.digital_land_queries.get_dataset_versions",
+        return_value={"tree": "1"},
+    )
+    query = MagicMock(return_value=["tree"], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    assert get_dataset_versions(MagicMock()) == {"tree": "1"}
+    cached_query(MagicMock())
+
+    # the versions are only read again after the interval
+    read_versions.return_value = {"tree": "2"}
+    assert get_dataset_versions(MagicMock()) == {"tree": "1"}
+    monotonic.return_value = 1000.0 + interval + 1
+    assert get_dataset_versions(MagicMock()) == {"tree": "2"}
+    assert read_versions.call_count == 2
+
+    cached_query(MagicMock())
+    assert query.call_count == 2
+
+
+def test_get_dataset_versions_keeps_reference_data_when_unchanged(mocker):
+    interval = get_settings().REFERENCE_DATA_VERSION_CHECK_INTERVAL
+    monotonic = mocker.patch(
+        "application.data_access.reference_data.time.monotonic", return_value=1000.0
+    )
+    mocker.patch(
+        "application.data_access.reference_data.digital_land_queries.get_dataset_versions",
+        return_value={"tree": "1"},
+    )
+    query = MagicMock(return_value=["tree"], __name__="query")
+    cached_query = cached_reference_data(query)
+
+    get_dataset_versions(MagicMock())
+    cached_query(MagicMock())
+    monotonic.return_value = 1000.0 + interval + 1
+    get_dataset_versions(MagicMock())
+    cached_query(MagicMock())
+    assert query.call_count == 1
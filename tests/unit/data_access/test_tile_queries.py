@@ -0,0 +1,47 @@
+from unittest.mock import MagicMock
+
+from sqlalchemy.dialects import postgresql
+
+from application.data_access.tile_queries import (
+    _get_tile_statement,
+    get_tile,
+    invalidate_tiles,
+)
+
+
+def test__get_tile_statement_uses_bounding_box_filter():
+    sql = str(
+        _get_tile_statement("conservation-area", 10, 511, 340).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "ST_AsMVT(tile" in sql
+    assert "entity.geometry && ST_Transform(ST_TileEnvelope" in sql
+    assert "entity.point && ST_Transform(ST_TileEnvelope" in sql
+
+
+def test_get_tile_is_cached_per_dataset_version():
+    invalidate_tiles()
+    session = MagicMock()
+    session.execute.return_value.scalar.return_value = memoryview(b"tile")
+
+    assert get_tile(session, "conservation-area", "1", 10, 511, 340) == b"tile"
+    assert get_tile(session, "conservation-area", "1", 10, 511, 340) == b"tile"
+    assert session.execute.call_count == 1
+
+    # a new version of the dataset isn't served the old tile
+    get_tile(session, "conservation-area", "2", 10, 511, 340)
+    assert session.execute.call_count == 2
+
+
+def test_invalidate_tiles_for_dataset():
+    invalidate_tiles()
+    session = MagicMock()
+    session.execute.return_value.scalar.return_value = None
+
+    assert get_tile(session, "conservation-area", "1", 0, 0, 0) == b""
+    get_tile(session, "tree", "1", 0, 0, 0)
+    invalidate_tiles("conservation-area")
+    get_tile(session, "conservation-area", "1", 0, 0, 0)
+    get_tile(session, "tree", "1", 0, 0, 0)
+    assert session.execute.call_count == 3
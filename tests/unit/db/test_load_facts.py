@@ -0,0 +1,64 @@
+import sqlite3
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from application.db.load_facts import load_facts, read_rows
+
+
+def _compile(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+@pytest.fixture
+def dataset_sqlite(tmp_path):
+    path = tmp_path / "ancient-woodland.sqlite3"
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        """
+        CREATE TABLE fact (
+            fact TEXT, entity INTEGER, field TEXT, value TEXT,
+            reference_entity TEXT, entry_date TEXT, start_date TEXT, end_date TEXT
+        );
+        CREATE TABLE fact_resource (
+            fact TEXT, resource TEXT, entry_date TEXT, start_date TEXT, end_date TEXT
+        );
+        INSERT INTO fact VALUES
+            ('180b185f', 110000000, 'name', 'Abbotswood Shaw', '', '2022-03-23', '', ''),
+            ('2d6c1f3a', 110000000, 'reference', '1481207', '', '2022-03-23', '', '');
+        INSERT INTO fact_resource VALUES ('180b185f', '80709f04', '2022-03-23', '', '');
+        """
+    )
+    connection.commit()
+    connection.close()
+    return str(path)
+
+
+def test_read_rows_reads_missing_values_and_columns_as_null(dataset_sqlite):
+    rows = list(read_rows(dataset_sqlite, "fact", ["fact", "value", "priority"]))
+    assert rows[0] == {"fact": "180b185f", "value": "Abbotswood Shaw", "priority": None}
+
+    rows = list(read_rows(dataset_sqlite, "fact", ["reference_entity", "start_date"]))
+    assert rows[0] == {"reference_entity": None, "start_date": None}
+
+
+def test_load_facts_replaces_the_datasets_facts(dataset_sqlite):
+    session = MagicMock()
+
+    assert load_facts(session, "ancient-woodland", dataset_sqlite) == (2, 1)
+
+    statements = [_compile(call.args[0]) for call in session.execute.call_args_list]
+    # the facts held for the dataset's entities are deleted before loading
+    assert statements[0].startswith("DELETE FROM fact_resource")
+    assert statements[1].startswith("DELETE FROM fact ")
+    assert "entity.dataset = %(dataset_1)s" in statements[1]
+    assert statements[2].startswith("INSERT INTO fact ")
+    assert "ON CONFLICT (fact) DO UPDATE" in statements[2]
+    assert statements[3].startswith("INSERT INTO fact_resource")
+    assert "ON CONFLICT (fact, resource) DO UPDATE" in statements[3]
+
+    facts = session.execute.call_args_list[2].args[1]
+    assert [fact["fact"] for fact in facts] == ["180b185f", "2d6c1f3a"]
+    assert facts[0]["entity"] == 110000000
+    assert facts[0]["reference_entity"] is None
@@ -0,0 +1,83 @@
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from application.db.replicas import ReadDatabase, ReadDatabaseRouter
+
+
+def _database(name, healthy=True, in_use=0):
+    database = MagicMock(spec=ReadDatabase)
+    database.name = name
+    database.healthy = healthy
+    database.connections_in_use.return_value = in_use
+    return database
+
+
+@pytest.fixture(autouse=True)
+def no_checker(mocker):
+    mocker.patch.object(ReadDatabaseRouter, "_start_checker")
+
+
+def test_get_database_without_replicas_uses_primary():
+    primary = _database("primary")
+    router = ReadDatabaseRouter(primary, [])
+    assert router.get_database() is primary
+
+
+def test_get_database_round_robin_skips_unhealthy_replicas():
+    replicas = [_database("a"), _database("b", healthy=False), _database("c")]
+    router = ReadDatabaseRouter(_database("primary"), replicas)
+
+    chosen = [router.get_database().name for _ in range(4)]
+
+    assert chosen == ["a", "c", "a", "c"]
+
+
+def test_get_database_least_connections():
+    replicas = [_database("a", in_use=4), _database("b", in_use=1)]
+    router = ReadDatabaseRouter(
+        _database("primary"), replicas, strategy="least_connections"
+    )
+    assert router.get_database().name == "b"
+
+
+def test_get_database_falls_back_to_primary_when_no_replica_is_healthy():
+    primary = _database("primary")
+    router = ReadDatabaseRouter(primary, [_database("a", healthy=False)])
+    assert router.get_database() is primary
+
+
+def _checked_database(mocker, lag=None, error=None):
+    database = ReadDatabase("postgresql://localhost/replica")
+    connection = mocker.patch.object(
+        database.sessionmaker, "_cached_engine"
+    ).connect.return_value.__enter__.return_value
+    if error is not None:
+        connection.exec_driver_sql.side_effect = error
+    else:
+        connection.exec_driver_sql.return_value.scalar.return_value = lag
+    return database, connection
+
+
+def test_check_marks_lagging_replica_unhealthy_until_it_catches_up(mocker):
+    database, connection = _checked_database(mocker, lag=45.0)
+
+    database.check(max_lag=30)
+    assert database.healthy is False
+    assert database.lag == 45.0
+
+    connection.exec_driver_sql.return_value.scalar.return_value = 2.5
+    database.check(max_lag=30)
+    assert database.healthy is True
+
+
+def test_check_marks_unreachable_replica_unhealthy(mocker):
+    database, _ = _checked_database(
+        mocker, error=OperationalError("SELECT 1", {}, Exception("refused"))
+    )
+
+    database.check(max_lag=30)
+
+    assert database.healthy is False
+    assert database.lag is None
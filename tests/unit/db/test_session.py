@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock
+
+from sqlalchemy.orm import Session
+
+from application.db.session import _apply_statement_timeout, get_statement_timeout
+
+
+def test_get_statement_timeout_uses_longest_matching_prefix(monkeypatch):
+    monkeypatch.setattr(
+        "application.db.session.get_settings",
+        lambda: MagicMock(
+            DB_STATEMENT_TIMEOUTS={"/entity": 10000, "/entity/export": 60000}
+        ),
+    )
+
+    assert get_statement_timeout("/entity.json") == 10000
+    assert get_statement_timeout("/entity/export.csv") == 60000
+    assert get_statement_timeout("/dataset") is None
+
+
+def test_apply_statement_timeout_sets_timeout_for_each_transaction(monkeypatch):
+    monkeypatch.setattr(
+        "application.db.session.get_settings",
+        lambda: MagicMock(DB_STATEMENT_TIMEOUTS={"/entity": 10000}),
+    )
+    session = Session()
+    request = MagicMock()
+    request.url.path = "/entity.json"
+    connection = MagicMock()
+
+    _apply_statement_timeout(session, request)
+    session.dispatch.after_begin(session, None, connection)
+
+    connection.exec_driver_sql.assert_called_once_with(
+        "SET LOCAL statement_timeout = 10000"
+    )
+
+
+def test_apply_statement_timeout_without_override_leaves_default(monkeypatch):
+    monkeypatch.setattr(
+        "application.db.session.get_settings",
+        lambda: MagicMock(DB_STATEMENT_TIMEOUTS={}),
+    )
+    session = Session()
+    request = MagicMock()
+    request.url.path = "/entity.json"
+
+    _apply_statement_timeout(session, request)
+
+    assert not session.dispatch.after_begin
@@ -1,3 +1,7 @@
+import asyncio
+import csv
+import io
+import json
 import logging
 import pytest
 from application.data_access.entity_query_helpers import normalised_params
@@ -6,25 +10,39 @@ from dataclasses import asdict
 from application.routers.entity import (
     _get_entity_json,
     _get_geojson,
+    _get_geojson_text,
+    _stream_csv,
+    _stream_geojson_sequence,
+    _stream_ndjson,
+    export_entities,
     get_entity,
+    get_entity_page_data,
+    get_search_reference_data,
+    handle_entity_response,
     search_entities,
 )
 
 from fastapi.exceptions import HTTPException
 
+from application.db.models import EntityOrm
+
 from unittest.mock import MagicMock
 
+from tests.utils.database import RunSyncSession
+
 from application.core.models import (
     EntityModel,
     DatasetModel,
+    entity_factory,
     GeoJSON,
     OrganisationModel,
     TypologyModel,
 )
+from application.search.enum import FacetOption, SuffixEntityExport
 from application.search.filters import QueryFilters
 
 
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 
 
 @pytest.fixture
@@ -180,7 +198,8 @@ def test_get_entity_json_with_multiple_exclude_fields(multiple_entity_models):
 
 def test_get_entity_no_entity_returned_html(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, None, None)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, None, None),
     )
     mocker.patch(
         "application.routers.entity.get_dataset_names",
@@ -188,10 +207,13 @@ def test_get_entity_no_entity_returned_html(mocker):
     )
     request = MagicMock()
     try:
-        get_entity(
-            request=request,
-            entity="11000000",
-            extension=None,
+        asyncio.run(
+            get_entity(
+                request=request,
+                entity="11000000",
+                extension=None,
+                session=RunSyncSession(MagicMock()),
+            )
         )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
@@ -200,16 +222,20 @@ def test_get_entity_no_entity_returned_html(mocker):
 
 def test_get_entity_no_entity_returned_json(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, None, None)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, None, None),
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
     try:
-        get_entity(
-            request=request,
-            entity="11000000",
-            extension=extension,
+        asyncio.run(
+            get_entity(
+                request=request,
+                entity="11000000",
+                extension=extension,
+                session=RunSyncSession(MagicMock()),
+            )
         )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
@@ -218,16 +244,20 @@ def test_get_entity_no_entity_returned_json(mocker):
 
 def test_get_entity_no_entity_returned_geojson(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, None, None)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, None, None),
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "geojson"
     try:
-        get_entity(
-            request=request,
-            entity="11000000",
-            extension=extension,
+        asyncio.run(
+            get_entity(
+                request=request,
+                entity="11000000",
+                extension=extension,
+                session=RunSyncSession(MagicMock()),
+            )
         )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
@@ -236,10 +266,18 @@ def test_get_entity_no_entity_returned_geojson(mocker):
 
 def test_get_entity_old_entity_gone_returned_html(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, 410, None)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, 410, None),
     )
     request = MagicMock()
-    result = get_entity(request=request, entity="11000000", extension=None)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=None,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
     try:
         result.template.render(result.context)
         assert True
@@ -253,13 +291,21 @@ def test_get_entity_old_entity_gone_returned_html(mocker):
 
 def test_get_entity_old_entity_gone_returned_json(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, 410, None)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, 410, None),
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
     try:
-        get_entity(request=request, entity="11000000", extension=extension)
+        asyncio.run(
+            get_entity(
+                request=request,
+                entity="11000000",
+                extension=extension,
+                session=RunSyncSession(MagicMock()),
+            )
+        )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
         assert True
@@ -267,13 +313,21 @@ def test_get_entity_old_entity_gone_returned_json(mocker):
 
 def test_get_entity_old_entity_gone_returned_geojson(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, 410, None)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, 410, None),
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "geojson"
     try:
-        get_entity(request=request, entity="11000000", extension=extension)
+        asyncio.run(
+            get_entity(
+                request=request,
+                entity="11000000",
+                extension=extension,
+                session=RunSyncSession(MagicMock()),
+            )
+        )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
         assert True
@@ -281,10 +335,18 @@ def test_get_entity_old_entity_gone_returned_geojson(mocker):
 
 def test_get_entity_old_entity_redirect_returned_html(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, 301, 1100000)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, 301, 1100000),
     )
     request = MagicMock()
-    result = get_entity(request=request, entity="11000000", extension=None)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=None,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
     assert isinstance(
         result, RedirectResponse
     ), f"expected a redirect response not {type(result)}"
@@ -292,12 +354,20 @@ def test_get_entity_old_entity_redirect_returned_html(mocker):
 
 def test_get_entity_old_entity_redirect_returned_json(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, 301, 1100000)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, 301, 1100000),
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = get_entity(request=request, entity="11000000", extension=extension)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
     assert isinstance(
         result, RedirectResponse
     ), f"expected a redirect response not {type(result)}"
@@ -305,12 +375,20 @@ def test_get_entity_old_entity_redirect_returned_json(mocker):
 
 def test_get_entity_old_entity_redirect_returned_geojson(mocker):
     mocker.patch(
-        "application.routers.entity.get_entity_query", return_value=(None, 301, 1100000)
+        "application.routers.entity.get_entity_query_async",
+        return_value=(None, 301, 1100000),
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "geojson"
-    result = get_entity(request=request, entity="11000000", extension=extension)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
     assert isinstance(
         result, RedirectResponse
     ), f"expected a redirect response not {type(result)}"
@@ -377,7 +455,7 @@ def test_get_entity_entity_returned_html(
     mocker, single_entity_model, multiple_dataset_models, ancient_woodland_dataset
 ):
     mocker.patch(
-        "application.routers.entity.get_entity_query",
+        "application.routers.entity.get_entity_query_async",
         return_value=(single_entity_model, None, None),
     )
     mocker.patch(
@@ -389,7 +467,14 @@ def test_get_entity_entity_returned_html(
     )
 
     request = MagicMock()
-    result = get_entity(request=request, entity="11000000", extension=None)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=None,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
 
     assert (
         result.status_code == 200
@@ -405,11 +490,44 @@ def test_get_entity_entity_returned_html(
         assert False, "template unable to render, missing variable(s) from context"
 
 
+def test_get_entity_entity_returned_html_looks_up_datasets_once(
+    mocker, single_entity_model, multiple_dataset_models
+):
+    mocker.patch(
+        "application.routers.entity.get_entity_query_async",
+        return_value=(single_entity_model, None, None),
+    )
+    get_datasets = mocker.patch(
+        "application.routers.entity.get_datasets", return_value=multiple_dataset_models
+    )
+    get_dataset_query = mocker.patch("application.routers.entity.get_dataset_query")
+    get_entity_links = mocker.patch(
+        "application.routers.entity.get_entity_links", return_value=(None, {})
+    )
+    session = MagicMock()
+
+    result = asyncio.run(
+        get_entity(
+            request=MagicMock(),
+            entity="11000000",
+            extension=None,
+            session=RunSyncSession(session),
+        )
+    )
+
+    # the entity's dataset and the linked datasets come from one lookup
+    get_datasets.assert_called_once_with(session)
+    get_dataset_query.assert_not_called()
+    get_entity_links.assert_called_once()
+    assert result.context["dataset"].dataset == "ancient-woodland"
+    assert result.context["dataset_fields"] == []
+
+
 def test_get_entity_entity_returned_json(
     mocker, single_entity_model, multiple_dataset_models, ancient_woodland_dataset
 ):
     mocker.patch(
-        "application.routers.entity.get_entity_query",
+        "application.routers.entity.get_entity_query_async",
         return_value=(single_entity_model, None, None),
     )
     mocker.patch(
@@ -422,7 +540,14 @@ def test_get_entity_entity_returned_json(
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = get_entity(request=request, entity="11000000", extension=extension)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
 
     assert isinstance(
         result, dict
@@ -434,7 +559,7 @@ def test_get_entity_entity_returned_geojson(
     mocker, single_entity_model, multiple_dataset_models, ancient_woodland_dataset
 ):
     mocker.patch(
-        "application.routers.entity.get_entity_query",
+        "application.routers.entity.get_entity_query_async",
         return_value=(single_entity_model, None, None),
     )
     mocker.patch(
@@ -447,7 +572,14 @@ def test_get_entity_entity_returned_geojson(
     request = MagicMock()
     extension = MagicMock()
     extension.value = "geojson"
-    result = get_entity(request=request, entity="11000000", extension=extension)
+    result = asyncio.run(
+        get_entity(
+            request=request,
+            entity="11000000",
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
     assert isinstance(result, GeoJSON), f"{type(result)} is expected to be a GeoJSON"
 
 
@@ -485,7 +617,7 @@ def test_search_entities_no_entities_returned_no_query_params_html(
 ):
     normalised_query_params = normalised_params(asdict(QueryFilters()))
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={"params": normalised_query_params, "count": 0, "entities": []},
     )
     mocker.patch(
@@ -508,10 +640,13 @@ def test_search_entities_no_entities_returned_no_query_params_html(
     )
 
     request = MagicMock()
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(),
-        extension=None,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=None,
+            session=RunSyncSession(MagicMock()),
+        )
     )
     try:
         result.template.render(result.context)
@@ -527,7 +662,7 @@ def test_search_entities_no_entities_returned_no_query_params_html(
 def test_search_entities_no_entities_returned_no_query_params_json(mocker):
     normalised_query_params = normalised_params(asdict(QueryFilters()))
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={"params": normalised_query_params, "count": 0, "entities": []},
     )
     mocker.patch(
@@ -540,10 +675,13 @@ def test_search_entities_no_entities_returned_no_query_params_json(mocker):
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(),
-        extension=extension,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
     )
     assert isinstance(
         result, dict
@@ -555,7 +693,7 @@ def test_search_entities_no_entities_returned_no_query_params_json(mocker):
 def test_search_entities_no_entities_returned_no_query_params_geojson(mocker):
     normalised_query_params = normalised_params(asdict(QueryFilters()))
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={"params": normalised_query_params, "count": 0, "entities": []},
     )
     mocker.patch(
@@ -568,10 +706,13 @@ def test_search_entities_no_entities_returned_no_query_params_geojson(mocker):
     request = MagicMock()
     extension = MagicMock()
     extension.value = "geojson"
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(),
-        extension=extension,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
     )
     assert isinstance(
         result, dict
@@ -591,7 +732,7 @@ def test_search_entities_multiple_entities_returned_no_query_params_html(
 ):
     normalised_query_params = normalised_params(asdict(QueryFilters()))
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={
             "params": normalised_query_params,
             "count": 2,
@@ -618,10 +759,13 @@ def test_search_entities_multiple_entities_returned_no_query_params_html(
     )
 
     request = MagicMock()
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(),
-        extension=None,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=None,
+            session=RunSyncSession(MagicMock()),
+        )
     )
     try:
         result.template.render(result.context)
@@ -639,7 +783,7 @@ def test_search_entities_multiple_entities_returned_no_query_params_json(
 ):
     normalised_query_params = normalised_params(asdict(QueryFilters()))
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={
             "params": normalised_query_params,
             "count": 0,
@@ -656,10 +800,13 @@ def test_search_entities_multiple_entities_returned_no_query_params_json(
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(),
-        extension=extension,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
     )
     assert isinstance(
         result, dict
@@ -673,7 +820,7 @@ def test_search_entities_multiple_entities_returned_no_query_params_geojson(
 ):
     normalised_query_params = normalised_params(asdict(QueryFilters()))
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={
             "params": normalised_query_params,
             "count": 0,
@@ -690,10 +837,13 @@ def test_search_entities_multiple_entities_returned_no_query_params_geojson(
     request = MagicMock()
     extension = MagicMock()
     extension.value = "geojson"
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(),
-        extension=extension,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
     )
     assert isinstance(
         result, dict
@@ -707,7 +857,7 @@ def test_search_entities_exclude_field(mocker, multiple_entity_models):
     exclude_field = ["geojson"]
 
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={
             "params": normalised_params(
                 asdict(QueryFilters(exclude_field=exclude_field))
@@ -728,10 +878,13 @@ def test_search_entities_exclude_field(mocker, multiple_entity_models):
     extension = MagicMock()
     extension.value = "json"
 
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(exclude_field=exclude_field),
-        extension=extension,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(exclude_field=exclude_field),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
     )
 
     assert "geojson" not in result["entities"][0]
@@ -739,7 +892,7 @@ def test_search_entities_exclude_field(mocker, multiple_entity_models):
 
 def test_search_entities_no_exclude_field(mocker, multiple_entity_models):
     mocker.patch(
-        "application.routers.entity.get_entity_search",
+        "application.routers.entity.get_entity_search_async",
         return_value={
             "params": normalised_params(asdict(QueryFilters())),
             "count": len(multiple_entity_models),
@@ -759,11 +912,288 @@ def test_search_entities_no_exclude_field(mocker, multiple_entity_models):
     extension = MagicMock()
     extension.value = "json"
 
-    result = search_entities(
-        request=request,
-        query_filters=QueryFilters(exclude_field=None),
-        extension=extension,
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(exclude_field=None),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
     )
 
     for entity in result["entities"]:
         assert "geometry" in entity
+
+
+def test__stream_ndjson_writes_one_entity_per_line(multiple_entity_models):
+    lines = list(_stream_ndjson(iter(multiple_entity_models)))
+    assert len(lines) == 2
+    for line in lines:
+        assert line.endswith("\n")
+        entity = json.loads(line)
+        assert entity["entity"] == 11000000
+        assert "geojson" not in entity
+
+
+def test__stream_geojson_sequence_prefixes_features_with_record_separator(
+    multiple_entity_models,
+):
+    records = list(_stream_geojson_sequence(iter(multiple_entity_models)))
+    assert len(records) == 2
+    for record in records:
+        assert record.startswith("\x1e")
+        feature = json.loads(record[1:])
+        assert feature["type"] == "Feature"
+        assert feature["properties"]["entity"] == 11000000
+
+
+def test__get_geojson_text_writes_stored_geometry_as_is():
+    geometry = '{"type":"Point","coordinates":[-0.337379,53.745418]}'
+    entities = [
+        entity_factory(
+            EntityOrm(entity=11000000, geometry_geojson=geometry), raw_geojson=True
+        ),
+        entity_factory(EntityOrm(entity=11000001), raw_geojson=True),
+    ]
+    text = _get_geojson_text(entities, {"first": "/entity.geojson"})
+    assert '"geometry":' + geometry in text
+    data = json.loads(text)
+    assert data["type"] == "FeatureCollection"
+    assert len(data["features"]) == 1
+    assert data["features"][0]["properties"]["entity"] == 11000000
+    assert data["links"] == {"first": "/entity.geojson"}
+
+
+def test_search_entities_geojson_uses_raw_geojson_when_configured(mocker):
+    normalised_query_params = normalised_params(asdict(QueryFilters()))
+    get_entity_search_mock = mocker.patch(
+        "application.routers.entity.get_entity_search_async",
+        return_value={"params": normalised_query_params, "count": 0, "entities": []},
+    )
+    mocker.patch("application.routers.entity.get_dataset_names", return_value=[])
+    mocker.patch("application.routers.entity.get_typology_names", return_value=[])
+    mocker.patch(
+        "application.routers.entity.get_settings",
+        return_value=MagicMock(RAW_GEOJSON=True),
+    )
+    request = MagicMock()
+    request.url.query = ""
+    extension = MagicMock()
+    extension.value = "geojson"
+    result = asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
+    assert get_entity_search_mock.call_args.kwargs["raw_geojson"] is True
+    assert json.loads(result.body)["features"] == []
+
+
+def test_search_entities_json_defers_geojson(mocker):
+    normalised_query_params = normalised_params(asdict(QueryFilters()))
+    get_entity_search_mock = mocker.patch(
+        "application.routers.entity.get_entity_search_async",
+        return_value={"params": normalised_query_params, "count": 0, "entities": []},
+    )
+    mocker.patch("application.routers.entity.get_dataset_names", return_value=[])
+    mocker.patch("application.routers.entity.get_typology_names", return_value=[])
+    request = MagicMock()
+    request.url.query = ""
+    extension = MagicMock()
+    extension.value = "json"
+    asyncio.run(
+        search_entities(
+            request=request,
+            query_filters=QueryFilters(),
+            extension=extension,
+            session=RunSyncSession(MagicMock()),
+        )
+    )
+    assert get_entity_search_mock.call_args.kwargs["load_geojson"] is False
+    # json is rendered straight from the rows
+    assert get_entity_search_mock.call_args.kwargs["as_json"] is True
+
+
+def test__get_entity_json_selects_fields_of_entities_as_dicts():
+    entity = {
+        "entity": 1,
+        "name": "A",
+        "geojson": {"type": "Feature"},
+        "documentation-url": "https://example.com",
+    }
+    assert _get_entity_json([entity], include={"documentation_url"}) == [
+        {"entity": 1, "documentation-url": "https://example.com"}
+    ]
+    assert _get_entity_json([entity], exclude=["name"]) == [
+        {"entity": 1, "documentation-url": "https://example.com"}
+    ]
+
+
+def test__stream_csv_writes_entities_as_dicts(multiple_entity_models):
+    entities = [e.dict(by_alias=True) for e in multiple_entity_models]
+    from_models = "".join(_stream_csv(iter(multiple_entity_models)))
+    assert "".join(_stream_csv(iter(entities))) == from_models
+
+
+def test__stream_csv_writes_header_then_rows(multiple_entity_models):
+    rows = list(
+        csv.reader(io.StringIO("".join(_stream_csv(iter(multiple_entity_models)))))
+    )
+    assert "geojson" not in rows[0]
+    assert rows[0][-1] == "json"
+    assert len(rows) == 3
+    assert rows[1][rows[0].index("entity")] == "11000000"
+
+
+def test__stream_csv_only_includes_requested_fields(multiple_entity_models):
+    rows = list(
+        csv.reader(
+            io.StringIO(
+                "".join(_stream_csv(iter(multiple_entity_models), include={"name"}))
+            )
+        )
+    )
+    assert rows[0] == ["entity", "name"]
+    assert rows[1] == ["11000000", "Abbotswood Shaw"]
+
+
+def test_export_entities_returns_streaming_response(mocker, multiple_entity_models):
+    mocker.patch(
+        "application.routers.entity.get_entity_search_stream",
+        return_value=iter(multiple_entity_models),
+    )
+    mocker.patch(
+        "application.routers.entity.get_dataset_names",
+        return_value=["ancient-woodland"],
+    )
+    mocker.patch(
+        "application.routers.entity.get_typology_names", return_value=["geography"]
+    )
+    result = export_entities(
+        extension=SuffixEntityExport.ndjson, query_filters=QueryFilters()
+    )
+    assert isinstance(result, StreamingResponse)
+    assert result.media_type == "application/x-ndjson"
+
+
+def test_search_entities_json_includes_facets_when_asked_for(mocker):
+    query_filters = QueryFilters(facet=[FacetOption.dataset])
+    mocker.patch(
+        "application.routers.entity.get_entity_search_async",
+        return_value={
+            "params": normalised_params(asdict(query_filters)),
+            "count": 0,
+            "entities": [],
+        },
+    )
+    mocker.patch(
+        "application.routers.entity.get_dataset_names",
+        return_value=["ancient-woodland"],
+    )
+    mocker.patch(
+        "application.routers.entity.get_typology_names", return_value=["geography"]
+    )
+    get_entity_facets = mocker.patch(
+        "application.routers.entity.get_entity_facets_async",
+        return_value={"dataset": {"ancient-woodland": 2}},
+    )
+    extension = MagicMock()
+    extension.value = "json"
+    session = RunSyncSession(MagicMock())
+    result = asyncio.run(
+        search_entities(
+            request=MagicMock(),
+            query_filters=query_filters,
+            extension=extension,
+            session=session,
+        )
+    )
+    assert result["facets"] == {"dataset": {"ancient-woodland": 2}}
+    assert get_entity_facets.call_args.args[2] == [FacetOption.dataset]
+
+
+class RecordingRunSyncSession(RunSyncSession):
+    def __init__(self, session):
+        super().__init__(session)
+        self.calls = []
+
+    async def run_sync(self, fn, *args, **kwargs):
+        self.calls.append(fn)
+        return await super().run_sync(fn, *args, **kwargs)
+
+
+def test_get_entity_html_only_loads_data_on_the_session(
+    mocker, single_entity_model, multiple_dataset_models
+):
+    mocker.patch(
+        "application.routers.entity.get_entity_query_async",
+        return_value=(single_entity_model, None, None),
+    )
+    mocker.patch(
+        "application.routers.entity.get_datasets", return_value=multiple_dataset_models
+    )
+    mocker.patch("application.routers.entity.get_entity_links", return_value=(None, {}))
+    run_in_threadpool = mocker.patch(
+        "application.routers.entity.run_in_threadpool",
+        side_effect=lambda fn, *args: fn(*args),
+    )
+    session = RecordingRunSyncSession(MagicMock())
+
+    result = asyncio.run(
+        get_entity(
+            request=MagicMock(), entity="11000000", extension=None, session=session
+        )
+    )
+
+    assert result.status_code == 200
+    assert session.calls == [get_entity_page_data]
+    # the template is rendered on a worker thread rather than in run_sync
+    assert run_in_threadpool.call_args.args[0] is handle_entity_response
+
+
+def test_search_entities_html_looks_up_reference_data_in_one_call(
+    mocker, typologies, local_authorities, multiple_dataset_models
+):
+    mocker.patch(
+        "application.routers.entity.get_entity_search_async",
+        return_value={
+            "params": normalised_params(asdict(QueryFilters())),
+            "count": 0,
+            "entities": [],
+        },
+    )
+    mocker.patch(
+        "application.routers.entity.get_dataset_names",
+        return_value=["ancient-woodland"],
+    )
+    mocker.patch(
+        "application.routers.entity.get_typology_names", return_value=["geography"]
+    )
+    mocker.patch(
+        "application.routers.entity.get_typologies_with_entities",
+        return_value=typologies,
+    )
+    mocker.patch(
+        "application.routers.entity.get_datasets", return_value=multiple_dataset_models
+    )
+    get_local_authorities = mocker.patch(
+        "application.routers.entity.get_local_authorities",
+        return_value=local_authorities,
+    )
+    session = RecordingRunSyncSession(MagicMock())
+
+    result = asyncio.run(
+        search_entities(
+            request=MagicMock(),
+            query_filters=QueryFilters(),
+            extension=None,
+            session=session,
+        )
+    )
+
+    assert session.calls == [get_search_reference_data]
+    get_local_authorities.assert_called_once_with(session.session, "local-authority")
+    assert len(result.context["datasets"]) == 2
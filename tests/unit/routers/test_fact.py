@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from fastapi.exceptions import HTTPException
@@ -7,6 +8,7 @@ from pydantic import BaseModel
 import pytest
 from application.routers.fact import _convert_model_to_dict, get_fact, search_facts
 from application.core.models import DatasetFieldModel, EntityModel, FactModel
+from tests.utils.database import RunSyncSession
 from application.search.filters import (
     FactDatasetQueryFilters,
     FactQueryFilters,
@@ -59,32 +61,48 @@ def path_params(mocker):
     return output
 
 
-def test_get_fact_no_fact_returned_for_html(mocker, query_params, path_params):
-    mocker.patch("application.routers.fact.get_fact_query", return_value=None)
+@pytest.fixture
+def facts_from_datasette(mocker):
+    mocker.patch(
+        "application.routers.fact.get_settings",
+        return_value=MagicMock(FACTS_FROM_POSTGRES=False, FACT_SEARCH_DEADLINE=10),
+    )
+
+
+def test_get_fact_no_fact_returned_for_html(
+    mocker, facts_from_datasette, query_params, path_params
+):
+    mocker.patch("application.routers.fact.get_fact_query_async", return_value=None)
     request = MagicMock()
     try:
-        get_fact(
-            request=request,
-            path_params=path_params,
-            query_filters=query_params,
-            extension=None,
+        asyncio.run(
+            get_fact(
+                request=request,
+                path_params=path_params,
+                query_filters=query_params,
+                extension=None,
+            )
         )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
         assert True
 
 
-def test_get_fact_no_facts_returned_for_json(mocker, query_params, path_params):
-    mocker.patch("application.routers.fact.get_fact_query", return_value=None)
+def test_get_fact_no_facts_returned_for_json(
+    mocker, facts_from_datasette, query_params, path_params
+):
+    mocker.patch("application.routers.fact.get_fact_query_async", return_value=None)
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
     try:
-        get_fact(
-            request=request,
-            path_params=path_params,
-            query_filters=query_params,
-            extension=extension,
+        asyncio.run(
+            get_fact(
+                request=request,
+                path_params=path_params,
+                query_filters=query_params,
+                extension=extension,
+            )
         )
         assert False, "Expected HTTPException to be raised"
     except HTTPException:
@@ -117,17 +135,19 @@ def single_fact_model():
 
 
 def test_get_fact_fact_returned_for_html(
-    mocker, single_fact_model, query_params, path_params
+    mocker, facts_from_datasette, single_fact_model, query_params, path_params
 ):
     mocker.patch(
-        "application.routers.fact.get_fact_query", return_value=single_fact_model
+        "application.routers.fact.get_fact_query_async", return_value=single_fact_model
     )
     request = MagicMock()
-    result = get_fact(
-        request=request,
-        path_params=path_params,
-        query_filters=query_params,
-        extension=None,
+    result = asyncio.run(
+        get_fact(
+            request=request,
+            path_params=path_params,
+            query_filters=query_params,
+            extension=None,
+        )
     )
     # check response code and response type are correct
     assert (
@@ -141,19 +161,21 @@ def test_get_fact_fact_returned_for_html(
 
 
 def test_get_fact_fact_returned_for_json(
-    mocker, single_fact_model, query_params, path_params
+    mocker, facts_from_datasette, single_fact_model, query_params, path_params
 ):
     mocker.patch(
-        "application.routers.fact.get_fact_query", return_value=single_fact_model
+        "application.routers.fact.get_fact_query_async", return_value=single_fact_model
     )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = get_fact(
-        request=request,
-        path_params=path_params,
-        query_filters=query_params,
-        extension=extension,
+    result = asyncio.run(
+        get_fact(
+            request=request,
+            path_params=path_params,
+            query_filters=query_params,
+            extension=extension,
+        )
     )
     assert isinstance(
         result, dict
@@ -246,27 +268,37 @@ def search_query_parameters(mocker):
 
 
 def test_search_facts_no_facts_returned_html(
-    mocker, search_query_parameters, multiple_dataset_field_models, single_entity_model
+    mocker,
+    facts_from_datasette,
+    search_query_parameters,
+    multiple_dataset_field_models,
+    single_entity_model,
 ):
-    mocker.patch("application.routers.fact.get_search_facts_query", return_value=[])
     mocker.patch(
-        "application.routers.fact.get_dataset_fields",
+        "application.routers.fact.get_search_facts_query_async", return_value=[]
+    )
+    mocker.patch(
+        "application.routers.fact.get_dataset_fields_async",
         return_value=multiple_dataset_field_models,
     )
     mocker.patch(
-        "application.routers.fact.get_entity_query",
+        "application.routers.fact.get_entity_query_async",
         return_value=(single_entity_model, None, None),
     )
     request = MagicMock()
-    result = search_facts(
-        request=request,
-        query_filters=search_query_parameters,
-        extension=None,
+    result = asyncio.run(
+        search_facts(
+            request=request,
+            query_filters=search_query_parameters,
+            extension=None,
+            session=MagicMock(),
+        )
     )
     # check response code and response type are correct
     assert (
         result.status_code == 200
     ), f"result status code should be 200 not {result.status_code}"
+    assert result.context["entity_name"] == single_entity_model.name
     try:
         result.template.render(result.context)
     except Exception:
@@ -275,55 +307,73 @@ def test_search_facts_no_facts_returned_html(
 
 
 def test_search_facts_no_facts_returned_json(
-    mocker, search_query_parameters, multiple_dataset_field_models, single_entity_model
+    mocker,
+    facts_from_datasette,
+    search_query_parameters,
+    multiple_dataset_field_models,
+    single_entity_model,
 ):
-    mocker.patch("application.routers.fact.get_search_facts_query", return_value=[])
     mocker.patch(
-        "application.routers.fact.get_dataset_fields",
+        "application.routers.fact.get_search_facts_query_async", return_value=[]
+    )
+    mocker.patch(
+        "application.routers.fact.get_dataset_fields_async",
         return_value=multiple_dataset_field_models,
     )
     mocker.patch(
-        "application.routers.fact.get_entity_query",
+        "application.routers.fact.get_entity_query_async",
         return_value=(single_entity_model, None, None),
     )
 
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = search_facts(
-        request=request,
-        query_filters=search_query_parameters,
-        extension=extension,
+    result = asyncio.run(
+        search_facts(
+            request=request,
+            query_filters=search_query_parameters,
+            extension=extension,
+            session=MagicMock(),
+        )
     )
     # check response code and response type are correct
     assert isinstance(result, list), f"{type(result)} is expected to be a python list"
 
 
 def test_search_facts_multiple_facts_returned_html(
-    mocker, multiple_fact_models, search_query_parameters, multiple_dataset_field_models
+    mocker,
+    facts_from_datasette,
+    multiple_fact_models,
+    search_query_parameters,
+    multiple_dataset_field_models,
 ):
     mocker.patch(
-        "application.routers.fact.get_search_facts_query",
+        "application.routers.fact.get_search_facts_query_async",
         return_value=multiple_fact_models,
     )
     mocker.patch(
-        "application.routers.fact.get_dataset_fields",
+        "application.routers.fact.get_dataset_fields_async",
         return_value=multiple_dataset_field_models,
     )
-    get_entity_query_mock = MagicMock()
-    get_entity_query_mock.return_value = (None, None, None)
-    mocker.patch("application.routers.fact.get_entity_query", get_entity_query_mock)
+    mocker.patch(
+        "application.routers.fact.get_entity_query_async",
+        return_value=(None, None, None),
+    )
     request = MagicMock()
-    result = search_facts(
-        request=request,
-        query_filters=search_query_parameters,
-        extension=None,
+    result = asyncio.run(
+        search_facts(
+            request=request,
+            query_filters=search_query_parameters,
+            extension=None,
+            session=MagicMock(),
+        )
     )
     # check response code and response type are correct
     assert (
         result.status_code == 200
     ), f"result status code should be 200 not {result.status_code}"
-    get_entity_query_mock.assert_not_called()
+    # the entity details come from the facts when there are some
+    assert result.context["entity_name"] == "Abbotswood Shaw"
     try:
         result.template.render(result.context)
     except Exception:
@@ -332,24 +382,184 @@ def test_search_facts_multiple_facts_returned_html(
 
 
 def test_search_facts_multiple_facts_returned_json(
-    mocker, multiple_fact_models, search_query_parameters, multiple_dataset_field_models
+    mocker,
+    facts_from_datasette,
+    multiple_fact_models,
+    search_query_parameters,
+    multiple_dataset_field_models,
 ):
-    mocker.patch("application.routers.fact.get_search_facts_query", return_value=[])
     mocker.patch(
-        "application.routers.fact.get_dataset_fields",
+        "application.routers.fact.get_search_facts_query_async",
+        return_value=multiple_fact_models,
+    )
+    get_dataset_fields_mock = mocker.patch(
+        "application.routers.fact.get_dataset_fields_async",
         return_value=multiple_dataset_field_models,
     )
-    get_entity_query_mock = MagicMock()
-    get_entity_query_mock.return_value = (None, None, None)
-    mocker.patch("application.routers.fact.get_entity_query", get_entity_query_mock)
+    get_entity_query_mock = mocker.patch(
+        "application.routers.fact.get_entity_query_async",
+        return_value=(None, None, None),
+    )
     request = MagicMock()
     extension = MagicMock()
     extension.value = "json"
-    result = search_facts(
-        request=request,
-        query_filters=search_query_parameters,
-        extension=extension,
+    result = asyncio.run(
+        search_facts(
+            request=request,
+            query_filters=search_query_parameters,
+            extension=extension,
+            session=MagicMock(),
+        )
     )
-    # check get_entity_query isn;t being called
+    # only the facts are needed for json
+    get_dataset_fields_mock.assert_not_called()
     get_entity_query_mock.assert_not_called()
-    assert isinstance(result, list), f"{type(result)} is expected to be a python list"
+    assert result == multiple_fact_models
+
+
+def test_search_facts_calls_are_made_concurrently(
+    mocker,
+    facts_from_datasette,
+    multiple_fact_models,
+    search_query_parameters,
+    multiple_dataset_field_models,
+):
+    started = []
+
+    def slow(value):
+        async def call(*args, **kwargs):
+            started.append(value)
+            await asyncio.sleep(0.1)
+            # every call has started before any of them finishes
+            assert len(started) == 3
+            return value
+
+        return call
+
+    mocker.patch(
+        "application.routers.fact.get_search_facts_query_async",
+        side_effect=slow(multiple_fact_models),
+    )
+    mocker.patch(
+        "application.routers.fact.get_dataset_fields_async",
+        side_effect=slow(multiple_dataset_field_models),
+    )
+    mocker.patch(
+        "application.routers.fact.get_entity_query_async",
+        side_effect=slow((None, None, None)),
+    )
+    result = asyncio.run(
+        search_facts(
+            request=MagicMock(),
+            query_filters=search_query_parameters,
+            extension=None,
+            session=MagicMock(),
+        )
+    )
+    assert result.status_code == 200
+    assert result.context["dataset_fields"] == ["geometry", "name", "reference"]
+
+
+def test_search_facts_gives_up_on_slow_calls(
+    mocker, multiple_fact_models, search_query_parameters
+):
+    mocker.patch(
+        "application.routers.fact.get_settings",
+        return_value=MagicMock(FACTS_FROM_POSTGRES=False, FACT_SEARCH_DEADLINE=0.01),
+    )
+
+    async def never_returns(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    mocker.patch(
+        "application.routers.fact.get_search_facts_query_async",
+        return_value=multiple_fact_models,
+    )
+    mocker.patch(
+        "application.routers.fact.get_dataset_fields_async", side_effect=never_returns
+    )
+    get_entity_query = mocker.patch(
+        "application.routers.fact.get_entity_query_async",
+        return_value=(None, None, None),
+    )
+    result = asyncio.run(
+        search_facts(
+            request=MagicMock(),
+            query_filters=search_query_parameters,
+            extension=None,
+            session=MagicMock(),
+        )
+    )
+    # the page is still shown without the fields
+    assert result.status_code == 200
+    assert result.context["dataset_fields"] == ["name", "reference"]
+    # database queries aren't cancelled, they have the statement timeout
+    get_entity_query.assert_awaited_once()
+
+
+def test_get_fact_from_postgres(mocker, single_fact_model, query_params, path_params):
+    mocker.patch(
+        "application.routers.fact.get_settings",
+        return_value=MagicMock(FACTS_FROM_POSTGRES=True),
+    )
+    get_fact_by_id = mocker.patch(
+        "application.routers.fact.get_fact_by_id", return_value=single_fact_model
+    )
+    get_fact_query_async = mocker.patch("application.routers.fact.get_fact_query_async")
+    session = MagicMock()
+    extension = MagicMock()
+    extension.value = "json"
+    result = asyncio.run(
+        get_fact(
+            request=MagicMock(),
+            path_params=path_params,
+            query_filters=query_params,
+            extension=extension,
+            session=RunSyncSession(session),
+        )
+    )
+    assert result["fact"] == single_fact_model.fact
+    get_fact_by_id.assert_called_once_with(
+        session, path_params.fact, "ancient-woodland"
+    )
+    get_fact_query_async.assert_not_called()
+
+
+def test_search_facts_from_postgres(
+    mocker, multiple_fact_models, search_query_parameters, multiple_dataset_field_models
+):
+    mocker.patch(
+        "application.routers.fact.get_settings",
+        return_value=MagicMock(FACTS_FROM_POSTGRES=True),
+    )
+    get_facts_for_entity = mocker.patch(
+        "application.routers.fact.get_facts_for_entity",
+        return_value=multiple_fact_models,
+    )
+    get_fact_fields = mocker.patch(
+        "application.routers.fact.get_fact_fields",
+        return_value=multiple_dataset_field_models,
+    )
+    mocker.patch(
+        "application.routers.fact.get_entity_query", return_value=(None, None, None)
+    )
+    get_search_facts_query = mocker.patch(
+        "application.routers.fact.get_search_facts_query_async"
+    )
+    session = MagicMock()
+    result = asyncio.run(
+        search_facts(
+            request=MagicMock(),
+            query_filters=search_query_parameters,
+            extension=None,
+            session=RunSyncSession(session),
+        )
+    )
+    assert result.status_code == 200
+    get_facts_for_entity.assert_called_once_with(
+        session, 110000000, ["name", "reference"]
+    )
+    get_fact_fields.assert_called_once_with(
+        session, "ancient-woodland", entity=110000000
+    )
+    get_search_facts_query.assert_not_called()
@@ -0,0 +1,35 @@
+import pytest
+
+from fastapi.exceptions import HTTPException
+
+from application.routers.tiles import get_dataset_tile
+
+
+def test_get_dataset_tile_returns_vector_tile(mocker):
+    mocker.patch(
+        "application.routers.tiles.get_dataset_versions",
+        return_value={"conservation-area": "1"},
+    )
+    get_tile = mocker.patch("application.routers.tiles.get_tile", return_value=b"tile")
+
+    result = get_dataset_tile("conservation-area", 10, 511, 340, session=None)
+
+    assert result.body == b"tile"
+    assert result.media_type == "application/vnd.mapbox-vector-tile"
+    get_tile.assert_called_once_with(None, "conservation-area", "1", 10, 511, 340)
+
+
+def test_get_dataset_tile_unknown_dataset(mocker):
+    mocker.patch(
+        "application.routers.tiles.get_dataset_versions",
+        return_value={"conservation-area": "1"},
+    )
+    with pytest.raises(HTTPException) as e:
+        get_dataset_tile("not-a-dataset", 0, 0, 0, session=None)
+    assert e.value.status_code == 404
+
+
+def test_get_dataset_tile_outside_zoom_level():
+    with pytest.raises(HTTPException) as e:
+        get_dataset_tile("conservation-area", 1, 2, 0, session=None)
+    assert e.value.status_code == 404
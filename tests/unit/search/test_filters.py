@@ -50,6 +50,24 @@ def test_QueryFilters_valid_entity():
         assert False, f" valid entity :{entity} has been labelled as invalid"
 
 
+def test_QueryFilters_valid_geometry():
+    geometry = ["POINT(-0.33753991127014155 53.74458682618967)"]
+    try:
+        QueryFilters(geometry=geometry)
+        assert True
+    except ValidationError:
+        assert False, f" valid geometry :{geometry} has been labelled as invalid"
+
+
+def test_QueryFilters_invalid_geometry():
+    geometry = ["POINT(-0.33753991127014155 53.74458682618967"]
+    try:
+        QueryFilters(geometry=geometry)
+        assert False, f" invalid geometry :{geometry} has been labelled as valid"
+    except ValidationError as e:
+        assert f"Invalid geometry {geometry[0]}" in str(e)
+
+
 # fact parameter classes
 # def test_FactDatasetQueryFilters_invalid_dataset(mocker):
 #     mocker.patch(
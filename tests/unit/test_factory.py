@@ -0,0 +1,139 @@
+from datetime import date
+
+import pytest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from sqlalchemy.exc import OperationalError, TimeoutError as SQLAlchemyTimeoutError
+
+from application.exceptions import QueryCostExceeded
+from application.factory import _get_cache_validators, add_base_routes, add_middleware
+
+
+@pytest.fixture
+def app_client(mocker):
+    mocker.patch(
+        "application.factory._get_cache_validators",
+        return_value=('"abc123"', date(2024, 8, 1)),
+    )
+    app = FastAPI()
+    calls = []
+
+    @app.get("/entity/{entity}.json")
+    def get_entity(entity: int):
+        calls.append(entity)
+        return {"entity": entity}
+
+    @app.get("/entity/{entity}")
+    def get_entity_html(entity: int):
+        return {"entity": entity}
+
+    add_middleware(app)
+    return TestClient(app), calls
+
+
+def test_cacheable_response_has_validators(app_client):
+    client, _ = app_client
+    response = client.get("/entity/1.json")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"abc123"'
+    assert response.headers["Last-Modified"] == "Thu, 01 Aug 2024 00:00:00 GMT"
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+
+
+def test_matching_etag_returns_not_modified_without_running_route(app_client):
+    client, calls = app_client
+    response = client.get(
+        "/entity/1.json",
+        headers={"If-None-Match": '"xyz", W/"abc123"', "Origin": "localhost"},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == '"abc123"'
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+    assert calls == []
+
+
+def test_stale_etag_returns_response(app_client):
+    client, calls = app_client
+    response = client.get("/entity/1.json", headers={"If-None-Match": '"xyz"'})
+    assert response.status_code == 200
+    assert calls == [1]
+
+
+def test_if_modified_since_is_ignored_as_responses_have_an_etag(app_client):
+    client, calls = app_client
+    # last modified is only a date so data loaded later that day would be missed
+    response = client.get(
+        "/entity/1.json", headers={"If-Modified-Since": "Fri, 02 Aug 2024 00:00:00 GMT"}
+    )
+    assert response.status_code == 200
+    assert calls == [1]
+
+    response = client.get(
+        "/entity/1.json",
+        headers={
+            "If-None-Match": '"abc123"',
+            "If-Modified-Since": "Wed, 31 Jul 2024 00:00:00 GMT",
+        },
+    )
+    assert response.status_code == 304
+
+
+def test_html_pages_are_not_given_validators(app_client):
+    client, _ = app_client
+    response = client.get("/entity/1", headers={"If-None-Match": '"abc123"'})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+def test__get_cache_validators_only_depends_on_requested_datasets(mocker):
+    mocker.patch("application.factory.get_context_session")
+    mocker.patch("application.factory.get_last_updated", return_value=None)
+    versions = mocker.patch("application.factory.get_dataset_versions")
+    request = Request(
+        {
+            "type": "http",
+            "path": "/entity.json",
+            "query_string": b"dataset=tree",
+            "headers": [],
+        }
+    )
+
+    versions.return_value = {"tree": "1", "conservation-area": "1"}
+    etag, _ = _get_cache_validators(request)
+    versions.return_value = {"tree": "1", "conservation-area": "2"}
+    assert _get_cache_validators(request)[0] == etag
+    versions.return_value = {"tree": "2", "conservation-area": "2"}
+    assert _get_cache_validators(request)[0] != etag
+
+
+class QueryCanceled(Exception):
+    pgcode = "57014"
+
+
+@pytest.fixture
+def error_client():
+    app = FastAPI()
+    add_base_routes(app)
+
+    @app.get("/errors/{error}.{extension}")
+    def raise_error(error: str, extension: str):
+        if error == "pool":
+            raise SQLAlchemyTimeoutError("QueuePool limit reached")
+        if error == "cost":
+            raise QueryCostExceeded("Query cost 100 exceeds the limit of 10")
+        raise OperationalError("SELECT 1", {}, QueryCanceled())
+
+    return TestClient(app, raise_server_exceptions=False)
+
+
+@pytest.mark.parametrize(
+    "error, status_code", [("pool", 503), ("cost", 503), ("timeout", 504)]
+)
+def test_database_errors_return_service_unavailable(error_client, error, status_code):
+    response = error_client.get(f"/errors/{error}.json")
+    assert response.status_code == status_code
+    assert response.headers["Retry-After"] == "30"
+    assert "detail" in response.json()
@@ -1,4 +1,6 @@
+from application.core.models import EntityModel
 from application.core.utils import make_links
+from application.search.enum import CountOption
 
 scheme = "http"
 netloc = "localhost"
@@ -89,3 +91,93 @@ def test_pagination_if_limit_zero_then_no_links():
     params = {}
     links = make_links(scheme, netloc, path, params, data)
     assert links == {}
+
+
+def test_pagination_without_count_has_next_link_when_page_is_full():
+    data = {
+        "count": None,
+        "params": {"limit": 2, "count": CountOption.none},
+        "entities": [EntityModel(entity=101), EntityModel(entity=105)],
+    }
+    params = {}
+    links = make_links(scheme, netloc, path, params, data)
+    assert links["first"] == "http://localhost/entity.json?limit=2"
+    assert links["next"] == "http://localhost/entity.json?limit=2&offset=2"
+    assert links.get("prev") is None
+    assert links.get("last") is None
+
+
+def test_pagination_without_count_has_no_next_link_on_partial_page():
+    data = {
+        "count": None,
+        "params": {"limit": 2, "offset": 4, "count": CountOption.estimated},
+        "entities": [{}],
+    }
+    params = {}
+    links = make_links(scheme, netloc, path, params, data)
+    assert links["first"] == "http://localhost/entity.json?limit=2"
+    assert links["prev"] == "http://localhost/entity.json?limit=2&offset=2"
+    assert links.get("next") is None
+    assert links.get("last") is None
+
+
+def test_pagination_without_count_no_links_for_single_partial_page():
+    data = {
+        "count": None,
+        "params": {"limit": 10, "count": CountOption.none},
+        "entities": [{}],
+    }
+    params = {}
+    links = make_links(scheme, netloc, path, params, data)
+    assert links == {}
+
+
+def test_pagination_with_after_entity_uses_last_entity_for_next_link():
+    data = {
+        "count": 45,
+        "params": {"limit": 2, "after_entity": 100},
+        "entities": [EntityModel(entity=101), EntityModel(entity=105)],
+    }
+    query = "dataset=tree&limit=2&after_entity=100"
+    links = make_links(scheme, netloc, path, query, data)
+    assert links["first"] == "http://localhost/entity.json?dataset=tree&limit=2"
+    assert (
+        links["next"]
+        == "http://localhost/entity.json?dataset=tree&limit=2&after_entity=105"
+    )
+    assert links.get("last") is None
+
+
+def test_pagination_with_after_entity_has_no_next_link_on_last_page():
+    data = {
+        "count": 45,
+        "params": {"limit": 2, "after_entity": 100},
+        "entities": [EntityModel(entity=101)],
+    }
+    links = make_links(scheme, netloc, path, "after_entity=100", data)
+    assert links.get("next") is None
+
+
+def test_pagination_second_page_of_offset_search_keeps_offset_links():
+    data = {
+        "count": 45,
+        "params": {"limit": 2, "offset": 2},
+        "entities": [EntityModel(entity=103), EntityModel(entity=105)],
+    }
+    links = make_links(scheme, netloc, path, "dataset=tree&limit=2&offset=2", data)
+    assert links["first"] == "http://localhost/entity.json?dataset=tree&limit=2"
+    assert links["next"] == "http://localhost/entity.json?dataset=tree&limit=2&offset=4"
+    assert links["prev"] == "http://localhost/entity.json?dataset=tree&limit=2"
+    assert (
+        links["last"] == "http://localhost/entity.json?dataset=tree&limit=2&offset=44"
+    )
+
+
+def test_pagination_with_after_entity_and_entities_as_dicts():
+    data = {
+        "count": None,
+        "params": {"limit": 2, "after_entity": 100},
+        "entities": [{"entity": 101}, {"entity": 105}],
+    }
+    links = make_links(scheme, netloc, path, "limit=2&after_entity=100", data)
+    assert links["next"] == "http://localhost/entity.json?limit=2&after_entity=105"
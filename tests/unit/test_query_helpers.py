@@ -77,3 +77,11 @@ def test_get_operator(expected, params):
     from application.data_access.entity_query_helpers import get_operator
 
     assert expected == get_operator(params)
+
+
+def test_get_geometry_is_parsed_once():
+    from application.data_access.entity_query_helpers import get_geometry
+
+    wkt = "POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))"
+    assert get_geometry(wkt).geom_type == "Polygon"
+    assert get_geometry(wkt) is get_geometry(wkt)
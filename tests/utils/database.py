@@ -81,3 +81,16 @@ def reset_database():
 def fetch_entity_from_database(entity_id):
     session = next(get_session())
     return session.query(EntityOrm).filter(EntityOrm.entity == entity_id).first()
+
+
+class RunSyncSession:
+    """
+    Stands in for an AsyncSession so the async path functions can be run
+    against a sync session, e.g. one that's rolled back after each test
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.session, *args, **kwargs)